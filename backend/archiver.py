@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from config import settings
+from services.archive import MONTH_FILE, ParquetArchive, archive_available
+from services.models import PARTITION_KEYS
+
+try:
+    import asyncpg  # type: ignore
+except Exception:  # pragma: no cover
+    asyncpg = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("archiver")
+
+PARTITION_NAME = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+
+# A month is only archived once nothing in it can change any more: no running
+# cycles, no open tasks and no reminders still to send
+OPEN_ROWS = {
+    "pomodoro_cycles": "status = 'active'",
+    "tasks": "completed = FALSE OR (reminder_sent = FALSE AND reminder_time IS NOT NULL)",
+    "calorie_logs": "FALSE",
+}
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Move old monthly partitions to the Parquet archive")
+    parser.add_argument("--dsn", default=settings.DATABASE_URL, help="Defaults to DATABASE_URL")
+    parser.add_argument("--directory", default=settings.ARCHIVE_DIR, help="Defaults to ARCHIVE_DIR")
+    parser.add_argument("--after-months", type=int, default=settings.ARCHIVE_AFTER_MONTHS)
+    parser.add_argument("--table", action="append", choices=sorted(PARTITION_KEYS), help="Only this table (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be archived")
+    return parser.parse_args()
+
+
+def _months_before(now: datetime, months: int) -> date:
+    year, month = divmod(now.year * 12 + now.month - 1 - months, 12)
+    return date(year, month + 1, 1)
+
+
+def _partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+async def _partitions(conn: asyncpg.Connection, table: str) -> list[tuple[str, date]]:
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+        """,
+        table,
+    )
+    partitions = []
+    for row in rows:
+        match = PARTITION_NAME.match(row["relname"])
+        if match and match["table"] == table:
+            partitions.append((row["relname"], date(int(match["year"]), int(match["month"]), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def _recover(conn: asyncpg.Connection, archive: ParquetArchive) -> None:
+    # A file left from an interrupted run is kept if its partition was dropped
+    # and discarded if the partition is still there (it will be redone)
+    for tmp in archive.pending():
+        match = MONTH_FILE.match(tmp.name.removesuffix(".tmp"))
+        if not match:
+            continue
+        partition = _partition_name(tmp.parent.name, date(int(match[1]), int(match[2]), 1))
+        if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", partition):
+            tmp.unlink()
+            logger.info("Discarded %s, %s is still in place", tmp, partition)
+        else:
+            logger.info("Recovered %s", archive.commit(tmp))
+
+
+async def _archive_partition(
+    conn: asyncpg.Connection, archive: ParquetArchive, table: str, partition: str, month: date, dry_run: bool
+) -> str:
+    if archive.path(table, month).exists():
+        return "skipped, already archived"
+    tmp: Path | None = None
+    async with conn.transaction():
+        # Reads carry on; writes into this month wait until it is gone
+        await conn.execute(f"LOCK TABLE {partition} IN SHARE MODE")
+        open_rows = await conn.fetchval(f"SELECT COUNT(*) FROM {partition} WHERE {OPEN_ROWS[table]}")
+        if open_rows:
+            return f"skipped, {open_rows} open rows"
+        statement = await conn.prepare(f"SELECT * FROM {partition}")
+        json_columns = [attr.name for attr in statement.get_attributes() if attr.type.name in {"json", "jsonb"}]
+        rows = [dict(row) for row in await statement.fetch()]
+        if dry_run:
+            return f"would archive {len(rows)} rows"
+        if rows:
+            tmp = archive.write(table, month, rows, json_columns)
+        await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+        await conn.execute(f"DROP TABLE {partition}")
+    if tmp:
+        archive.commit(tmp)
+    return f"archived {len(rows)} rows"
+
+
+async def run(args: argparse.Namespace) -> None:
+    if asyncpg is None:
+        raise SystemExit("asyncpg is not installed")
+    if not args.dsn:
+        raise SystemExit("Set DATABASE_URL or pass --dsn; partitions can't be dropped over PostgREST")
+    if not archive_available(args.directory):
+        raise SystemExit("Set ARCHIVE_DIR or pass --directory, and install pyarrow")
+    archive = ParquetArchive(args.directory)
+    cutoff = _months_before(datetime.now(timezone.utc), args.after_months)
+    logger.info("Archiving months before %s into %s", f"{cutoff:%Y-%m}", archive.directory)
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        await _recover(conn, archive)
+        for table in args.table or PARTITION_KEYS:
+            for partition, month in await _partitions(conn, table):
+                if month >= cutoff:
+                    continue
+                try:
+                    result = await _archive_partition(conn, archive, table, partition, month, args.dry_run)
+                except Exception:
+                    # Any file written stays as .tmp and is settled on the next run
+                    logger.exception("Archiving %s failed", partition)
+                    continue
+                logger.info("%s: %s", partition, result)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(_parse_args()))
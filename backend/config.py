@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Literal
+
 from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
@@ -19,6 +21,39 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_SECRET_KEY: str
 
+    # Direct Postgres connection (session mode) for LISTEN/NOTIFY, optional
+    DATABASE_URL: str | None = None
+
+    # Storage: "postgrest" (supabase-py over HTTPS) or "postgres" (asyncpg pool on DATABASE_URL)
+    STORAGE_BACKEND: Literal["postgrest", "postgres"] = "postgrest"
+    DATABASE_POOL_MIN_SIZE: int = 1
+    DATABASE_POOL_MAX_SIZE: int = 10
+    DATABASE_COMMAND_TIMEOUT: float = 10.0
+    DATABASE_STATEMENT_CACHE_SIZE: int = 100  # 0 behind a transaction-mode pooler
+    QUERY_PAGE_SIZE: int = 500  # rows per keyset page; keep under PostgREST's max-rows
+
+    # Local write journal for the webhook path (disabled unless JOURNAL_DIR is set)
+    JOURNAL_DIR: str | None = None  # one directory per web process, on a persistent disk
+    JOURNAL_FSYNC_INTERVAL_MS: float = 2.0  # appends wait at most this long for a shared fsync
+    JOURNAL_SEGMENT_BYTES: int = 4 * 1024 * 1024
+    JOURNAL_RETRY_SECONDS: float = 1.0  # first replay backoff, doubled up to a minute
+    JOURNAL_DRAIN_SECONDS: float = 5.0  # replay time allowed at shutdown
+
+    # Monthly partitions and the Parquet archive of old months (python -m archiver)
+    PARTITION_MONTHS_AHEAD: int = 3  # empty partitions kept ready ahead of time
+    PARTITION_CHECK_HOURS: float = 6.0
+    ARCHIVE_DIR: str | None = None  # where archived months live; unset: history stops at the oldest partition
+    ARCHIVE_AFTER_MONTHS: int = 12  # months kept in Postgres
+
+    # Shared HTTP client pools (Supabase, OpenAI, Twilio)
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_MAX_KEEPALIVE: int = 10
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_TIMEOUT_SECONDS: float = 10.0
+    OPENAI_TIMEOUT_SECONDS: float = 60.0
+    MEDIA_TIMEOUT_SECONDS: float = 30.0
+
     # Opik (optional but recommended)
     OPIK_API_KEY: str | None = None
     OPIK_PROJECT_NAME: str = "whatsapp-productivity-bot"
@@ -28,10 +63,39 @@ class Settings(BaseSettings):
     PORT: int = 8000
     PUBLIC_BASE_URL: str = "http://localhost:8000"
     APP_ENV: str = "development"
+    DASHBOARD_TILE_TIMEOUT_SECONDS: float = 3.0  # a slower tile renders as unavailable
+    DASHBOARD_STREAMING: bool = True  # send today's section before older days have loaded (?stream= overrides)
+    DASHBOARD_CACHE_ENTRIES: int = 1000  # rendered dashboard pages kept per process; 0 disables
+    DASHBOARD_API_MAX_DAYS: int = 31  # days per /api/dashboard page; every page is the same three queries
+    COMPRESSION_MIN_BYTES: int = 500  # smaller text responses go out uncompressed
 
     # Timer loop
     POMODORO_POLL_SECONDS: int = 30
     POMODORO_NUDGE_SECONDS: int = 120
+    TIMER_BATCH_SIZE: int = 200  # rows each worker claims per batch
+    TIMER_MAX_BATCHES_PER_TICK: int = 10  # keep claiming while batches come back full
+    TIMER_LEASE_SECONDS: int = 60
+    TIMER_FEED_POLL_SECONDS: int = 300  # safety-net poll while the change feed is connected
+    TIMER_IN_WEB: bool = True  # set false when a separate scheduler process runs
+    SCHEDULER_PORT: int = 8001
+
+    # Outbound messages
+    OUTBOUND_WORKERS: int = 4
+    OUTBOUND_RATE_PER_SECOND: float = 10.0  # per sender number
+    OUTBOUND_BURST: int = 10
+    OUTBOUND_MAX_RETRIES: int = 3
+    OUTBOUND_BACKOFF_SECONDS: float = 0.5
+    OUTBOUND_MAX_BACKOFF_SECONDS: float = 20.0  # caps Retry-After too; kept inside OUTBOX_LEASE_SECONDS
+    OUTBOUND_TIMEOUT_SECONDS: float = 10.0
+    OUTBOUND_COALESCE_SECONDS: float = 5.0  # 0 disables per-recipient coalescing
+    OUTBOUND_URGENT_MAX_DELAY_SECONDS: float = 1.0
+
+    # Outbox drain
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_LEASE_SECONDS: int = 120
+    OUTBOX_POLL_SECONDS: float = 2.0
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_SECONDS: int = 30  # doubled after every failed attempt
 
     class Config:
         env_file = ".env"
@@ -4,32 +4,34 @@ import re
 from datetime import datetime
 from typing import Tuple
 
+from services.models import User
 from services.openai_service import OpenAIService
 from services.opik_service import track
-from services.supabase_service import SupabaseService
+from services.storage import StorageBackend
+from utils.time_utils import local_today
 
 
 @track(name="calorie_estimation")
 def log_calorie_text(
-    supabase: SupabaseService, openai: OpenAIService, user: dict, message: str
+    supabase: StorageBackend, openai: OpenAIService, user: User, message: str
 ) -> Tuple[str, dict]:
-    estimate = openai.estimate_calories_text(message, user.get("dietary_preferences", ""))
+    estimate = openai.estimate_calories_text(message, user.dietary_preferences or "")
     return _build_confirmation_message(estimate)
 
 
 @track(name="calorie_estimation")
 def log_calorie_image(
-    supabase: SupabaseService,
+    supabase: StorageBackend,
     openai: OpenAIService,
-    user: dict,
+    user: User,
     image_data_url: str,
 ) -> Tuple[str, dict]:
-    estimate = openai.estimate_calories_image(image_data_url, user.get("dietary_preferences", ""))
+    estimate = openai.estimate_calories_image(image_data_url, user.dietary_preferences or "")
     return _build_confirmation_message(estimate)
 
 
 def handle_calorie_confirmation(
-    supabase: SupabaseService, openai: OpenAIService, user: dict, message: str, pending: dict
+    supabase: StorageBackend, openai: OpenAIService, user: User, message: str, pending: dict
 ) -> Tuple[str, dict]:
     lowered = message.strip().lower()
     calories_override = _extract_number(message)
@@ -68,7 +70,7 @@ def handle_calorie_confirmation(
             refined = openai.refine_calorie_estimate(
                 pending,
                 message.strip(),
-                user.get("dietary_preferences", ""),
+                user.dietary_preferences or "",
             )
             return _build_confirmation_message(refined)
         except Exception:
@@ -82,15 +84,14 @@ def handle_calorie_confirmation(
     )
 
 
-def daily_summary(supabase: SupabaseService, user: dict, start_iso: str, end_iso: str) -> str:
-    logs = supabase.list_today_calories(user["id"], start_iso, end_iso)
-    if not logs:
+def daily_summary(supabase: StorageBackend, user: User) -> str:
+    today = local_today(user.timezone)
+    rollup = supabase.daily_rollups(user.id, today, today).get(today)
+    if not rollup or not rollup.meals:
         return "No meals logged yet today. Send a photo or a text description to log one."
-    total_cal = sum([log.get("calories") or 0 for log in logs])
-    protein = sum([log.get("protein_g") or 0 for log in logs])
-    carbs = sum([log.get("carbs_g") or 0 for log in logs])
-    fat = sum([log.get("fat_g") or 0 for log in logs])
-    goal = user.get("daily_calorie_goal")
+    total_cal = rollup.calories
+    protein, carbs, fat = rollup.protein_g, rollup.carbs_g, rollup.fat_g
+    goal = user.daily_calorie_goal
     if goal:
         remaining = goal - total_cal
         return (
@@ -106,11 +107,11 @@ def daily_summary(supabase: SupabaseService, user: dict, start_iso: str, end_iso
     )
 
 
-def update_goal(supabase: SupabaseService, user: dict, message: str) -> str:
+def update_goal(supabase: StorageBackend, user: User, message: str) -> str:
     value = _extract_number(message)
     if not value:
         return "Please send a number, like 'goal 2000'."
-    supabase.update_user(user["id"], {"daily_calorie_goal": value})
+    supabase.update_user(user.id, {"daily_calorie_goal": value})
     return f"✅ Daily calorie goal set to {value}."
 
 
@@ -128,10 +129,10 @@ def _build_confirmation_message(estimate: dict) -> Tuple[str, dict]:
 
 
 def _save_calorie_log(
-    supabase: SupabaseService, user: dict, estimate: dict, confirmed: bool
+    supabase: StorageBackend, user: User, estimate: dict, confirmed: bool
 ) -> Tuple[str, dict]:
     supabase.insert_calorie_log(
-        user_id=user["id"],
+        user_id=user.id,
         meal_description=estimate.get("description") or "Meal",
         calories=estimate.get("calories"),
         protein_g=estimate.get("protein_g"),
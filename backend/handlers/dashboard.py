@@ -1,12 +1,83 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
-from html import escape
-import json
-from typing import Any
+import asyncio
+import base64
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+import hashlib
+import logging
+from pathlib import Path
+import time
+from typing import Any, AsyncIterator, Callable, TypeVar
 from zoneinfo import ZoneInfo
 
-from services.supabase_service import SupabaseService
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup
+
+from config import settings
+from services.models import CalorieStats, DailyRollup, PomodoroStats, Task, TaskStats, User
+from services.storage import StorageBackend
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+TEMPLATE_DIR = BACKEND_DIR / "templates"
+STATIC_DIR = BACKEND_DIR / "static"
+
+
+@dataclass(frozen=True, slots=True)
+class StaticAsset:
+    filename: str  # <stem>.<content hash>.<suffix>, the name it is served under
+    body: bytes
+    media_type: str
+
+
+def _static_asset(name: str, media_type: str) -> StaticAsset:
+    body = (STATIC_DIR / name).read_bytes()
+    stem, _, suffix = name.rpartition(".")
+    return StaticAsset(f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}.{suffix}", body, media_type)
+
+
+STYLESHEET = _static_asset("dashboard.css", "text/css; charset=utf-8")
+
+# Templates are compiled once, here; auto_reload is off so rendering never
+# stats the files again
+_TEMPLATES = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=True,
+    auto_reload=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+_TEMPLATES.globals["stylesheet_url"] = f"/static/{STYLESHEET.filename}"
+_LOGIN = _TEMPLATES.get_template("login.html")
+_DASHBOARD = _TEMPLATES.get_template("dashboard.html")
+_DAY = _TEMPLATES.get_template("day.html").module.day
+_SECTIONS_SLOT = "<!-- sections -->"
+# The item lists in each tile, empty when only its rollup totals could be read
+_TILE_LISTS = {"pomodoro": ("items",), "tasks": ("created", "completed"), "calories": ("meals",)}
+
+# Changes with the rendering code, templates or stylesheet, so ETags from
+# before a deploy don't match
+_RENDER_VERSION = hashlib.sha256(
+    b"".join(path.read_bytes() for path in [Path(__file__), *sorted(TEMPLATE_DIR.glob("*.html"))])
+    + STYLESHEET.filename.encode()
+).hexdigest()[:12]
+
+
+def static_asset(filename: str) -> tuple[StaticAsset, bool] | None:
+    # (asset, current): a name with another deploy's hash gets this process's
+    # copy, which must not be cached under that name
+    if filename == STYLESHEET.filename:
+        return STYLESHEET, True
+    stem, _, suffix = STYLESHEET.filename.split(".", 2)
+    if filename.startswith(f"{stem}.") and filename.endswith(f".{suffix}"):
+        return STYLESHEET, False
+    return None
 
 
 def normalize_phone_number(value: str) -> str:
@@ -19,347 +90,491 @@ def normalize_phone_number(value: str) -> str:
     return cleaned
 
 
+@dataclass(slots=True)
+class TileTiming:
+    tile: str
+    duration_ms: float
+    status: str = "ok"  # ok, timeout or error
+
+
+@dataclass(slots=True)
+class DashboardPage:
+    # Neither html nor stream when the client's copy is current (304)
+    html: str | None
+    etag: str | None  # None when the page can't be reused
+    timings: list[TileTiming]
+    stream: AsyncIterator[str] | None = None
+
+
+class PageCache:
+    # Rendered dashboard pages, one per (user, days), each kept with the ETag
+    # it was rendered for; the least recently used go first
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._pages: OrderedDict[tuple[str, int], tuple[str, str]] = OrderedDict()
+
+    def get(self, user_id: str, days: int, etag: str) -> str | None:
+        page = self._pages.get((user_id, days))
+        if not page or page[0] != etag:
+            return None
+        self._pages.move_to_end((user_id, days))
+        return page[1]
+
+    def put(self, user_id: str, days: int, etag: str, html: str) -> None:
+        if self.max_entries <= 0:
+            return
+        self._pages[(user_id, days)] = (etag, html)
+        self._pages.move_to_end((user_id, days))
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+
+
+page_cache = PageCache(settings.DASHBOARD_CACHE_ENTRIES)
+
+
+@dataclass(slots=True)
+class HistoryPage:
+    # One page of /api/dashboard; days is None when the client's copy is current (304)
+    timezone: str
+    days: list[dict[str, Any]] | None
+    next_cursor: str | None
+    etag: str | None
+    timings: list[TileTiming]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
 def build_day_sections(
-    supabase: SupabaseService,
-    user: dict,
+    supabase: StorageBackend,
+    user: User,
     days: int = 7,
 ) -> list[dict[str, Any]]:
-    tz_name = user.get("timezone") or "UTC"
-    tz = _safe_timezone(tz_name)
+    tz, day_starts, start_iso, end_iso = _window(user, days)
+    pomodoro = supabase.pomodoro_stats(user.id, start_iso, end_iso, with_blocks=True)
+    tasks = supabase.task_stats(user.id, start_iso, end_iso)
+    calories = supabase.calorie_stats(user.id, start_iso, end_iso, with_meals=True)
+    return _sections(day_starts, tz, pomodoro, tasks, calories)
+
+
+async def load_day_sections(
+    storage: StorageBackend,
+    user: User,
+    days: int = 7,
+    timeout: float | None = None,
+    skip: int = 0,
+) -> tuple[list[dict[str, Any]], list[TileTiming]]:
+    # Same sections as build_day_sections, but the tile totals come from the
+    # daily rollups and the rows only fill in the item lists. The four queries
+    # run at once on worker threads. A tile whose rows fail or outlive
+    # `timeout` shows only its rollup totals; if the rollups fail, totals are
+    # summed from the rows as before. The rest of the page still loads.
+    # `skip` leaves out the most recent days (skip=1: everything but today).
+    tz, day_starts, start_iso, end_iso = _window(user, days, skip)
+    timeout = settings.DASHBOARD_TILE_TIMEOUT_SECONDS if timeout is None else timeout
+    fetches: dict[str, Callable[[], Any]] = {
+        "pomodoro": lambda: storage.pomodoro_stats(user.id, start_iso, end_iso, with_blocks=True),
+        "tasks": lambda: storage.task_stats(user.id, start_iso, end_iso),
+        "calories": lambda: storage.calorie_stats(user.id, start_iso, end_iso, with_meals=True),
+        "rollups": lambda: storage.daily_rollups(user.id, day_starts[-1].date(), day_starts[0].date()),
+    }
+    results = await asyncio.gather(*(_fetch_tile(tile, fetch, timeout) for tile, fetch in fetches.items()))
+    values = {timing.tile: value for value, timing in results}
+    timings = [timing for _, timing in results]
+    sections = _sections(
+        day_starts, tz, values["pomodoro"], values["tasks"], values["calories"], values["rollups"], skip
+    )
+    return sections, timings
+
+
+def dashboard_etag(storage: StorageBackend, user: User, days: int, scope: str = "page") -> str | None:
+    # The page only changes with the user's data_version and local day; None
+    # while the journal holds writes for the user that haven't bumped it yet
+    has_pending_writes = getattr(storage, "has_pending_writes", None)
+    if has_pending_writes and has_pending_writes(user.id):
+        return None
+    today = datetime.now(_safe_timezone(user.timezone)).date()
+    key = f"{_RENDER_VERSION}:{scope}:{user.id}:{user.data_version}:{days}:{today.isoformat()}"
+    return f'W/"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+async def load_dashboard(
+    storage: StorageBackend,
+    user: User,
+    days: int = 7,
+    if_none_match: str | None = None,
+    stream: bool = False,
+    started: float | None = None,
+) -> DashboardPage:
+    # Answers from the client's copy or the page cache when the ETag still
+    # matches. A page is only reused if every tile loaded and no focus session
+    # was running, since neither shows up in data_version. `started` is when
+    # the request came in, for the first byte/content timings.
+    started = time.perf_counter() if started is None else started
+    etag = dashboard_etag(storage, user, days)
+    if etag and _etag_matches(if_none_match, etag):
+        page = DashboardPage(None, etag, [_cache_timing("not_modified", started)])
+        _observe_delivery("cache", started, time.perf_counter())
+        return page
+    html = page_cache.get(user.id, days, etag) if etag else None
+    if html is not None:
+        page = DashboardPage(html, etag, [_cache_timing("hit", started)])
+        _observe_delivery("cache", started, time.perf_counter())
+        return page
+    lookup = _cache_timing("miss" if etag else "bypass", started)
+    if stream:
+        # Its headers go out before the tiles load, so no ETag: once cached,
+        # the next view gets one
+        return DashboardPage(None, None, [lookup], stream=_stream_dashboard(storage, user, days, etag, started))
+    sections, timings = await load_day_sections(storage, user, days)
+    html = render_dashboard(user, sections)
+    reusable = _reusable(sections, timings)
+    if etag and reusable:
+        page_cache.put(user.id, days, etag, html)
+    _observe_delivery("buffered", started, time.perf_counter())
+    return DashboardPage(html, etag if reusable else None, timings + [lookup])
+
+
+async def _stream_dashboard(
+    storage: StorageBackend, user: User, days: int, etag: str | None, started: float
+) -> AsyncIterator[str]:
+    # The page shell goes out straight away, today's section once its own
+    # (small) window has loaded, then the older days. Both windows are
+    # queried at once, so the older days don't wait behind today.
+    older = asyncio.create_task(load_day_sections(storage, user, days, skip=1)) if days > 1 else None
+    try:
+        head, tail = _dashboard_shell(user)
+        chunks = [head]
+        yield head
+        first_byte = time.perf_counter()
+        today, timings = await load_day_sections(storage, user, 1)
+        chunks.append(_render_sections(today))
+        yield chunks[-1]
+        _observe_delivery("stream", started, first_byte, time.perf_counter())
+        sections = today
+        if older:
+            older_sections, older_timings = await older
+            sections, timings = today + older_sections, timings + older_timings
+            chunks.append(_render_sections(older_sections))
+            yield chunks[-1]
+        chunks.append(tail)
+        yield tail
+        if etag and _reusable(sections, timings):
+            page_cache.put(user.id, days, etag, "".join(chunks))
+    finally:
+        # The client went away mid-stream
+        if older and not older.done():
+            older.cancel()
+
+
+async def load_history_page(
+    storage: StorageBackend,
+    user: User,
+    days: int = 7,
+    cursor: str | None = None,
+    if_none_match: str | None = None,
+) -> HistoryPage:
+    # `days` day sections for /api/dashboard, newest first, ending at the
+    # cursor's day (today without one). Every page is the same three window
+    # queries however far back it is, so scrolling through months of history
+    # costs the same per page as the first one. The next cursor is the day
+    # before this page, until the page reaches the day the user signed up.
+    started = time.perf_counter()
+    tz = _safe_timezone(user.timezone)
+    today = datetime.now(tz).date()
+    newest = min(_decode_cursor(cursor), today) if cursor else today
+    first_day = user.created_at.astimezone(tz).date() if user.created_at else None
+    if first_day is not None:
+        days = max(1, min(days, (newest - first_day).days + 1))
+    etag = dashboard_etag(storage, user, days, scope=f"api:{newest.isoformat()}")
+    if etag and _etag_matches(if_none_match, etag):
+        return HistoryPage(tz.key, None, None, etag, [_cache_timing("not_modified", started)])
+    skip = (today - newest).days
+    sections, timings = await load_day_sections(storage, user, skip + days, skip=skip)
+    oldest = newest - timedelta(days=days - 1)
+    # Without a sign-up day, history ends at the first page with nothing in it
+    more = oldest > first_day if first_day is not None else any(map(_has_activity, sections))
+    return HistoryPage(
+        tz.key,
+        [_api_day(section) for section in sections],
+        _encode_cursor(oldest - timedelta(days=1)) if more else None,
+        etag if _reusable(sections, timings) else None,
+        timings,
+    )
+
+
+def _encode_cursor(day: date) -> str:
+    return base64.urlsafe_b64encode(f"v1:{day.isoformat()}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> date:
+    try:
+        version, _, day = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().partition(":")
+        if version != "v1":
+            raise ValueError(f"unknown cursor version {version!r}")
+        return date.fromisoformat(day)
+    except ValueError as exc:  # binascii.Error and UnicodeDecodeError included
+        raise InvalidCursor(cursor) from exc
+
+
+def _api_day(section: dict[str, Any]) -> dict[str, Any]:
+    # A page section without what only the HTML uses
+    return {key: value for key, value in section.items() if key not in ("index", "label")}
+
+
+def _has_activity(section: dict[str, Any]) -> bool:
+    pomodoro, tasks, calories = section["pomodoro"], section["tasks"], section["calories"]
+    if pomodoro is None or tasks is None or calories is None:
+        # Couldn't be read, so it may well have some
+        return True
+    return bool(
+        pomodoro["count"]
+        or tasks["created_count"]
+        or tasks["completed_count"]
+        or calories["total_calories"]
+        or calories["meals"]
+    )
+
+
+def _reusable(sections: list[dict[str, Any]], timings: list[TileTiming]) -> bool:
+    return all(timing.status == "ok" for timing in timings) and not any(section["live"] for section in sections)
+
+
+def _observe_delivery(mode: str, started: float, first_byte: float, first_content: float | None = None) -> None:
+    # First content is today's section; a buffered page brings it with the first byte
+    metrics.observe("dashboard_ttfb_ms", (first_byte - started) * 1000, labels={"mode": mode})
+    metrics.observe("dashboard_ttfc_ms", ((first_content or first_byte) - started) * 1000, labels={"mode": mode})
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison, as If-None-Match calls for
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def _cache_timing(status: str, started: float) -> TileTiming:
+    metrics.inc("dashboard_cache_total", labels={"result": status})
+    return TileTiming("cache", (time.perf_counter() - started) * 1000, status)
+
+
+def server_timing(timings: list[TileTiming]) -> str:
+    # Server-Timing header value, one metric per tile
+    entries = []
+    for timing in timings:
+        desc = "" if timing.status == "ok" else f';desc="{timing.status}"'
+        entries.append(f"{timing.tile}{desc};dur={timing.duration_ms:.1f}")
+    return ", ".join(entries)
+
+
+async def _fetch_tile(tile: str, fetch: Callable[[], T], timeout: float) -> tuple[T | None, TileTiming]:
+    started = time.perf_counter()
+    value: T | None = None
+    status = "ok"
+    try:
+        # A timed-out query keeps its worker thread until the storage call
+        # returns; DATABASE_COMMAND_TIMEOUT and HTTP_TIMEOUT_SECONDS bound that
+        value = await asyncio.wait_for(asyncio.to_thread(fetch), timeout)
+    except asyncio.TimeoutError:
+        status = "timeout"
+        logger.warning("Dashboard %s tile timed out after %.1fs", tile, timeout)
+    except Exception:
+        status = "error"
+        logger.exception("Dashboard %s tile failed", tile)
+    duration_ms = (time.perf_counter() - started) * 1000
+    metrics.observe("dashboard_tile_ms", duration_ms, labels={"tile": tile})
+    if status != "ok":
+        metrics.inc("dashboard_tile_errors_total", labels={"tile": tile, "status": status})
+    return value, TileTiming(tile, duration_ms, status)
+
+
+def _window(user: User, days: int, skip: int = 0) -> tuple[ZoneInfo, list[datetime], str, str]:
+    tz = _safe_timezone(user.timezone)
     today = datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    sections: list[dict[str, Any]] = []
-    for index in range(days):
-        day_start = today - timedelta(days=index)
-        day_end = day_start + timedelta(days=1)
-        start_iso = day_start.astimezone(timezone.utc).isoformat()
-        end_iso = day_end.astimezone(timezone.utc).isoformat()
-        label = day_start.strftime("%A, %b %d")
-        sections.append(
-            {
-                "index": index + 1,
-                "label": label,
-                "date": day_start.strftime("%Y-%m-%d"),
-                "is_today": index == 0,
-                "pomodoro": _fetch_pomodoro(supabase, user["id"], start_iso, end_iso, tz),
-                "tasks": _fetch_tasks(supabase, user["id"], start_iso, end_iso, tz),
-                "calories": _fetch_calories(supabase, user["id"], start_iso, end_iso, tz),
-            }
-        )
-    return sections
+    day_starts = [today - timedelta(days=index) for index in range(skip, days)]
+    # One query per table for the whole window, then one pass over each
+    # result to bucket it into local days
+    start_iso = day_starts[-1].astimezone(timezone.utc).isoformat()
+    end_iso = (day_starts[0] + timedelta(days=1)).astimezone(timezone.utc).isoformat()
+    return tz, day_starts, start_iso, end_iso
 
 
-def render_login(error: str | None = None) -> str:
-    error_html = ""
-    if error:
-        error_html = f"<div class='alert'>{escape(error)}</div>"
-    body = f"""
-    <main class="card shell">
-      <div class="brand">
-        <span class="dot"></span>
-        <span>Tomatose!</span>
-      </div>
-      <h1>Your WhatsApp Productivity Dashboard</h1>
-      <p class="muted">Enter your name and phone number to open your daily dashboard.</p>
-      {error_html}
-      <form class="form" action="/dashboard/view" method="get">
-        <label>
-          <span>Name</span>
-          <input name="name" placeholder="Tushar" autocomplete="name" />
-        </label>
-        <label>
-          <span>Phone number</span>
-          <input name="phone" placeholder="+1 555 123 4567" autocomplete="tel" required />
-        </label>
-        <input type="hidden" name="tz" id="tz" />
-        <button type="submit">Open dashboard</button>
-      </form>
-      <p class="hint">Tip: Use the same phone number you chat with on WhatsApp.</p>
-    </main>
-    """
-    return _base_html("Tomatose! | Dashboard Login", body, include_tz_script=True)
-
-
-def render_dashboard(user: dict, sections: list[dict[str, Any]]) -> str:
-    name = escape(user.get("name") or "there")
-    tz = _safe_timezone(user.get("timezone") or "UTC")
-    tz_name = escape(tz.key)
-    now_local = datetime.now(tz)
-    today_label = now_local.strftime("%A, %b %d")
-    current_tz = user.get("timezone") or "UTC"
-    header = f"""
-    <header class="hero">
-      <div>
-        <div class="brand">
-          <span class="dot"></span>
-          <span>Tomatose!</span>
-        </div>
-        <h1>Welcome back, {name}.</h1>
-        <p class="muted">Timezone: {tz_name} · Day-wise view of focus, tasks, and calories.</p>
-      </div>
-      <div class="hero-card">
-        <div class="stat">
-          <span>Today</span>
-          <strong>{today_label}</strong>
-        </div>
-        <div class="stat">
-          <span>Last updated</span>
-          <strong>{now_local.strftime("%I:%M %p").lstrip("0")}</strong>
-        </div>
-      </div>
-    </header>
-    """
-    tz_sync = f"""
-    <script>
-      (function () {{
-        try {{
-          var localTz = Intl.DateTimeFormat().resolvedOptions().timeZone;
-          var currentTz = {json.dumps(current_tz)};
-          var params = new URLSearchParams(window.location.search);
-          if (!params.has("tz") && localTz && localTz !== currentTz) {{
-            params.set("tz", localTz);
-            window.location.replace(window.location.pathname + "?" + params.toString());
-          }}
-        }} catch (e) {{}}
-      }})();
-    </script>
-    """
-    day_blocks = "\n".join([_render_day(section) for section in sections])
-    body = f"""
-    <main class="shell">
-      {header}
-      {day_blocks}
-    </main>
-    {tz_sync}
-    """
-    return _base_html("Tomatose! | Dashboard", body)
-
-
-def _render_day(section: dict[str, Any]) -> str:
-    label = escape(section["label"])
-    date = escape(section["date"])
-    today_tag = "<span class='pill'>Today</span>" if section.get("is_today") else ""
-    pomodoro_html = _render_pomodoro(section["pomodoro"])
-    tasks_html = _render_tasks(section["tasks"])
-    calories_html = _render_calories(section["calories"])
-    return f"""
-    <section class="day">
-      <div class="day-header">
-        <h2>{label}</h2>
-        <span>{date} {today_tag}</span>
-      </div>
-      <div class="grid">
-        <article class="tile">{pomodoro_html}</article>
-        <article class="tile">{tasks_html}</article>
-        <article class="tile">{calories_html}</article>
-      </div>
-    </section>
-    """
-
-
-def _render_pomodoro(data: dict[str, Any]) -> str:
-    total = data["total_minutes"]
-    count = data["count"]
-    items = data["items"]
-    list_html = "<p class='muted'>No focus sessions logged.</p>"
-    if items:
-        rows = "".join(
-            [
-                f"<li><strong>{escape(item['time'])}</strong> · {escape(item['label'])} "
-                f"<span class='pill'>{item['minutes']}m</span></li>"
-                for item in items
-            ]
-        )
-        list_html = f"<ul class='list'>{rows}</ul>"
-    return f"""
-    <div class="tile-head">
-      <h3>Pomodoro</h3>
-      <span class="pill">{total}m · {count} sessions</span>
-    </div>
-    {list_html}
-    """
-
-
-def _render_tasks(data: dict[str, Any]) -> str:
-    created = data["created"]
-    completed = data["completed"]
-    created_html = "<p class='muted'>No new tasks.</p>"
-    if created:
-        rows = "".join(
-            [
-                f"<li>{escape(task['title'])} "
-                f"<span class='pill {('done' if task['completed'] else 'pending')}'>"
-                f"{'done' if task['completed'] else 'open'}</span></li>"
-                for task in created
-            ]
-        )
-        created_html = f"<ul class='list'>{rows}</ul>"
-    completed_html = "<p class='muted'>No tasks completed.</p>"
-    if completed:
-        rows = "".join(
-            [
-                f"<li>{escape(task['title'])} <span class='pill done'>{escape(task['time'])}</span></li>"
-                for task in completed
-            ]
-        )
-        completed_html = f"<ul class='list'>{rows}</ul>"
-    return f"""
-    <div class="tile-head">
-      <h3>Tasks</h3>
-      <span class="pill">{len(created)} created · {len(completed)} completed</span>
-    </div>
-    <div class="stack">
-      <div>
-        <p class="label">Created</p>
-        {created_html}
-      </div>
-      <div>
-        <p class="label">Completed</p>
-        {completed_html}
-      </div>
-    </div>
-    """
-
-
-def _render_calories(data: dict[str, Any]) -> str:
-    total = data["total_calories"]
-    protein = data["protein"]
-    carbs = data["carbs"]
-    fat = data["fat"]
-    meals = data["meals"]
-    meals_html = "<p class='muted'>No meals logged.</p>"
-    if meals:
-        rows = "".join(
-            [
-                f"<li>{escape(meal['desc'])} "
-                f"<span class='pill'>{meal['calories']} cal</span></li>"
-                for meal in meals
-            ]
-        )
-        meals_html = f"<ul class='list'>{rows}</ul>"
-    return f"""
-    <div class="tile-head">
-      <h3>Calories</h3>
-      <span class="pill">{total} cal</span>
-    </div>
-    <p class="muted">Macros: {protein}g protein · {carbs}g carbs · {fat}g fat</p>
-    {meals_html}
-    """
-
-
-def _fetch_pomodoro(
-    supabase: SupabaseService,
-    user_id: str,
-    start_iso: str,
-    end_iso: str,
+def _sections(
+    day_starts: list[datetime],
     tz: ZoneInfo,
-) -> dict[str, Any]:
-    sessions = supabase._execute(
-        supabase.client.table("pomodoro_sessions")
-        .select("*")
-        .eq("user_id", user_id)
-        .eq("session_type", "work")
-        .gte("start_time", start_iso)
-        .lte("start_time", end_iso)
-        .order("start_time", desc=False)
-    )
-    total_minutes = 0
-    items: list[dict[str, Any]] = []
-    for session in sessions:
-        start = _parse_iso(session["start_time"]).astimezone(tz)
-        end_time = session.get("end_time")
-        minutes = session.get("planned_duration_minutes") or 0
-        if end_time:
-            end = _parse_iso(end_time).astimezone(tz)
-            minutes = int((end - start).total_seconds() / 60)
-        total_minutes += max(minutes, 0)
-        label = session.get("what_did_you_do") or "Focus session"
-        items.append(
-            {
-                "time": start.strftime("%I:%M %p").lstrip("0"),
-                "label": label,
-                "minutes": max(minutes, 0),
-            }
+    pomodoro: PomodoroStats | None,
+    tasks: TaskStats | None,
+    calories: CalorieStats | None,
+    rollups: dict[date, DailyRollup] | None = None,
+    skip: int = 0,
+) -> list[dict[str, Any]]:
+    blocks = _by_day(pomodoro.blocks or [], lambda block: block["start"], tz) if pomodoro is not None else None
+    created = _by_day(tasks.created, lambda task: task.created_at, tz) if tasks is not None else None
+    completed = _by_day(tasks.completed, lambda task: task.completed_at, tz) if tasks is not None else None
+    meals = _by_day(calories.meals or [], lambda meal: meal["logged_at"], tz) if calories is not None else None
+    running = pomodoro is not None and pomodoro.running
+    return [
+        _day_section(
+            index,
+            day_start,
+            tz,
+            blocks.get(day_start.date(), []) if blocks is not None else None,
+            created.get(day_start.date(), []) if created is not None else None,
+            completed.get(day_start.date(), []) if completed is not None else None,
+            meals.get(day_start.date(), []) if meals is not None else None,
+            rollups.get(day_start.date(), DailyRollup(day_start.date())) if rollups is not None else None,
+            live=index == 0 and running,
+            focus_rolled_up=not running,
         )
-    return {"total_minutes": total_minutes, "count": len(sessions), "items": items}
+        for index, day_start in enumerate(day_starts, start=skip)
+    ]
+
+
+def _by_day(items: list[T], key: Callable[[T], datetime | None], tz: ZoneInfo) -> dict[date, list[T]]:
+    days: dict[date, list[T]] = {}
+    for item in items:
+        at = key(item)
+        if at:
+            days.setdefault(at.astimezone(tz).date(), []).append(item)
+    return days
 
 
-def _fetch_tasks(
-    supabase: SupabaseService,
-    user_id: str,
-    start_iso: str,
-    end_iso: str,
+def _day_section(
+    index: int,
+    day_start: datetime,
     tz: ZoneInfo,
+    blocks: list[dict[str, Any]] | None,
+    created: list[Task] | None,
+    completed: list[Task] | None,
+    meals: list[dict[str, Any]] | None,
+    rollup: DailyRollup | None = None,
+    live: bool = False,
+    focus_rolled_up: bool = True,
 ) -> dict[str, Any]:
-    created = supabase._execute(
-        supabase.client.table("tasks")
-        .select("*")
-        .eq("user_id", user_id)
-        .gte("created_at", start_iso)
-        .lte("created_at", end_iso)
-        .order("created_at", desc=False)
-    )
-    completed = supabase._execute(
-        supabase.client.table("tasks")
-        .select("*")
-        .eq("user_id", user_id)
-        .eq("completed", True)
-        .gte("completed_at", start_iso)
-        .lte("completed_at", end_iso)
-        .order("completed_at", desc=False)
+    # Totals come from the day's rollup and lists from its rows. A tile whose
+    # rows couldn't be fetched shows the rollup totals alone, marked partial,
+    # or is None without one; without a rollup the totals are summed from the
+    # rows. A running cycle isn't rolled up until it stops, so focus totals
+    # come from the rows while one is (focus_rolled_up=False). live marks
+    # today while a focus session is running: its minutes change without any
+    # write.
+    totals = _rollup_totals(rollup) if rollup else {}
+    if not focus_rolled_up:
+        totals.pop("pomodoro", None)
+    tiles = {
+        "pomodoro": _pomodoro_tile(blocks, tz) if blocks is not None else None,
+        "tasks": _tasks_tile(created, completed or [], tz) if created is not None else None,
+        "calories": _calories_tile(meals) if meals is not None else None,
+    }
+    for name, tile in tiles.items():
+        if tile is not None:
+            tile.update(totals.get(name, {}))
+        elif rollup:
+            tiles[name] = {**{key: [] for key in _TILE_LISTS[name]}, **_rollup_totals(rollup)[name], "partial": True}
+    return {
+        "index": index + 1,
+        "label": day_start.strftime("%A, %b %d"),
+        "date": day_start.strftime("%Y-%m-%d"),
+        "is_today": index == 0,
+        "live": live,
+        **tiles,
+    }
+
+
+def render_login(error: str | None = None) -> str:
+    return _LOGIN.render(title="Tomatose! | Dashboard Login", error=error)
+
+
+def render_dashboard(user: User, sections: list[dict[str, Any]]) -> str:
+    head, tail = _dashboard_shell(user)
+    return head + _render_sections(sections) + tail
+
+
+def _dashboard_shell(user: User) -> tuple[str, str]:
+    # The page before and after its day sections, which streaming sends apart
+    tz = _safe_timezone(user.timezone)
+    now_local = datetime.now(tz)
+    html = _DASHBOARD.render(
+        title="Tomatose! | Dashboard",
+        name=user.name or "there",
+        tz_name=tz.key,
+        today_label=now_local.strftime("%A, %b %d"),
+        updated_label=now_local.strftime("%I:%M %p").lstrip("0"),
+        current_tz=user.timezone,
+        sections=Markup(_SECTIONS_SLOT),
     )
-    created_items = [
-        {"title": task.get("title") or "Untitled", "completed": bool(task.get("completed"))}
-        for task in created
+    head, _, tail = html.partition(_SECTIONS_SLOT)
+    return head, tail
+
+
+def _render_sections(sections: list[dict[str, Any]]) -> str:
+    return "".join(_DAY(section) for section in sections)
+
+
+def _pomodoro_tile(blocks: list[dict[str, Any]], tz: ZoneInfo) -> dict[str, Any]:
+    items = [
+        {
+            "time": block["start"].astimezone(tz).strftime("%I:%M %p").lstrip("0"),
+            "label": block["summary"] or "Focus session",
+            "minutes": block["minutes"],
+        }
+        for block in blocks
     ]
+    total_minutes = sum(block["minutes"] for block in blocks)
+    return {"total_minutes": total_minutes, "count": len(blocks), "items": items}
+
+
+def _tasks_tile(created: list[Task], completed: list[Task], tz: ZoneInfo) -> dict[str, Any]:
+    created_items = [{"title": task.title or "Untitled", "completed": task.completed} for task in created]
     completed_items = []
     for task in completed:
-        completed_at = task.get("completed_at")
         time_label = ""
-        if completed_at:
-            time_label = _parse_iso(completed_at).astimezone(tz).strftime("%I:%M %p").lstrip("0")
-        completed_items.append({"title": task.get("title") or "Untitled", "time": time_label})
-    return {"created": created_items, "completed": completed_items}
+        if task.completed_at:
+            time_label = task.completed_at.astimezone(tz).strftime("%I:%M %p").lstrip("0")
+        completed_items.append({"title": task.title or "Untitled", "time": time_label})
+    return {
+        "created": created_items,
+        "completed": completed_items,
+        "created_count": len(created_items),
+        "completed_count": len(completed_items),
+    }
 
 
-def _fetch_calories(
-    supabase: SupabaseService,
-    user_id: str,
-    start_iso: str,
-    end_iso: str,
-    tz: ZoneInfo,
-) -> dict[str, Any]:
-    logs = supabase._execute(
-        supabase.client.table("calorie_logs")
-        .select("*")
-        .eq("user_id", user_id)
-        .gte("logged_at", start_iso)
-        .lte("logged_at", end_iso)
-        .order("logged_at", desc=False)
-    )
+def _calories_tile(meals: list[dict[str, Any]]) -> dict[str, Any]:
     total_calories = 0
     total_protein = 0.0
     total_carbs = 0.0
     total_fat = 0.0
-    meals = []
-    for log in logs:
-        calories = int(log.get("calories") or 0)
+    items = []
+    for meal in meals:
+        calories = int(meal["calories"] or 0)
         total_calories += calories
-        total_protein += float(log.get("protein_g") or 0)
-        total_carbs += float(log.get("carbs_g") or 0)
-        total_fat += float(log.get("fat_g") or 0)
-        desc = log.get("meal_description") or "Meal"
-        meals.append({"desc": desc, "calories": calories})
+        total_protein += float(meal.get("protein_g") or 0)
+        total_carbs += float(meal.get("carbs_g") or 0)
+        total_fat += float(meal.get("fat_g") or 0)
+        items.append({"desc": meal["description"] or "Meal", "calories": calories})
     return {
         "total_calories": total_calories,
         "protein": int(total_protein),
         "carbs": int(total_carbs),
         "fat": int(total_fat),
-        "meals": meals,
+        "meals": items,
     }
 
 
-def _parse_iso(value: str) -> datetime:
-    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+def _rollup_totals(rollup: DailyRollup) -> dict[str, dict[str, Any]]:
+    return {
+        "pomodoro": {"total_minutes": rollup.focus_minutes, "count": rollup.focus_sessions},
+        "tasks": {"created_count": rollup.tasks_created, "completed_count": rollup.tasks_completed},
+        "calories": {
+            "total_calories": rollup.calories,
+            "protein": int(rollup.protein_g),
+            "carbs": int(rollup.carbs_g),
+            "fat": int(rollup.fat_g),
+        },
+    }
 
 
 def _safe_timezone(tz_name: str) -> ZoneInfo:
@@ -367,253 +582,3 @@ def _safe_timezone(tz_name: str) -> ZoneInfo:
         return ZoneInfo(tz_name)
     except Exception:
         return ZoneInfo("UTC")
-
-
-def _base_html(title: str, body: str, include_tz_script: bool = False) -> str:
-    tz_script = ""
-    if include_tz_script:
-        tz_script = """
-        <script>
-          (function () {
-            try {
-              var tz = Intl.DateTimeFormat().resolvedOptions().timeZone;
-              var input = document.getElementById("tz");
-              if (input && tz) {
-                input.value = tz;
-              }
-            } catch (e) {}
-          })();
-        </script>
-        """
-    return f"""
-    <!doctype html>
-    <html lang="en">
-      <head>
-        <meta charset="utf-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1" />
-        <title>{escape(title)}</title>
-        <link rel="preconnect" href="https://fonts.googleapis.com" />
-        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin />
-        <link href="https://fonts.googleapis.com/css2?family=Space+Grotesk:wght@400;600;700&family=IBM+Plex+Sans:wght@400;600&display=swap" rel="stylesheet" />
-        <style>
-          :root {{
-            --ink: #1b1b1b;
-            --muted: #6c6c6c;
-            --bg: #f7f4ef;
-            --card: #ffffff;
-            --accent: #0f766e;
-            --accent-soft: #ccfbf1;
-            --shadow: 0 10px 30px rgba(0, 0, 0, 0.08);
-          }}
-          * {{
-            box-sizing: border-box;
-          }}
-          body {{
-            margin: 0;
-            font-family: "IBM Plex Sans", sans-serif;
-            color: var(--ink);
-            background: radial-gradient(circle at top left, #fff3dc, transparent 45%),
-                        radial-gradient(circle at bottom right, #e0f2fe, transparent 55%),
-                        var(--bg);
-          }}
-          h1, h2, h3 {{
-            font-family: "Space Grotesk", sans-serif;
-            margin: 0 0 8px;
-          }}
-          h1 {{
-            font-size: clamp(28px, 3vw, 38px);
-          }}
-          h2 {{
-            font-size: 22px;
-          }}
-          h3 {{
-            font-size: 18px;
-          }}
-          p {{
-            margin: 0 0 12px;
-          }}
-          .shell {{
-            max-width: 1100px;
-            margin: 0 auto;
-            padding: 32px 20px 64px;
-          }}
-          .card {{
-            background: var(--card);
-            border-radius: 20px;
-            padding: 32px;
-            box-shadow: var(--shadow);
-          }}
-          .hero {{
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            gap: 24px;
-            margin-bottom: 24px;
-          }}
-          .hero-card {{
-            display: grid;
-            gap: 12px;
-            background: var(--card);
-            border-radius: 18px;
-            padding: 16px 20px;
-            box-shadow: var(--shadow);
-            min-width: 200px;
-          }}
-          .stat span {{
-            display: block;
-            color: var(--muted);
-            font-size: 12px;
-            text-transform: uppercase;
-            letter-spacing: 0.08em;
-          }}
-          .stat strong {{
-            font-size: 18px;
-          }}
-          .brand {{
-            display: inline-flex;
-            align-items: center;
-            gap: 8px;
-            font-weight: 700;
-            text-transform: uppercase;
-            letter-spacing: 0.12em;
-            font-size: 12px;
-            color: var(--muted);
-          }}
-          .dot {{
-            width: 10px;
-            height: 10px;
-            border-radius: 50%;
-            background: var(--accent);
-          }}
-          .day {{
-            margin-top: 24px;
-          }}
-          .day-header {{
-            display: flex;
-            align-items: baseline;
-            justify-content: space-between;
-            margin-bottom: 12px;
-          }}
-          .day-header span {{
-            color: var(--muted);
-          }}
-          .grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(240px, 1fr));
-            gap: 16px;
-          }}
-          .tile {{
-            background: var(--card);
-            border-radius: 18px;
-            padding: 16px;
-            box-shadow: var(--shadow);
-          }}
-          .tile-head {{
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            gap: 12px;
-            margin-bottom: 12px;
-          }}
-          .pill {{
-            background: var(--accent-soft);
-            color: var(--accent);
-            padding: 4px 10px;
-            border-radius: 999px;
-            font-size: 12px;
-            font-weight: 600;
-            white-space: nowrap;
-          }}
-          .pill.done {{
-            background: #dcfce7;
-            color: #166534;
-          }}
-          .pill.pending {{
-            background: #fef3c7;
-            color: #92400e;
-          }}
-          .list {{
-            list-style: none;
-            padding: 0;
-            margin: 0;
-            display: grid;
-            gap: 8px;
-          }}
-          .list li {{
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            gap: 12px;
-            font-size: 14px;
-          }}
-          .muted {{
-            color: var(--muted);
-          }}
-          .stack {{
-            display: grid;
-            gap: 12px;
-          }}
-          .label {{
-            font-size: 12px;
-            text-transform: uppercase;
-            letter-spacing: 0.08em;
-            color: var(--muted);
-          }}
-          .form {{
-            display: grid;
-            gap: 16px;
-            margin-top: 16px;
-          }}
-          label {{
-            display: grid;
-            gap: 6px;
-            font-size: 14px;
-          }}
-          input {{
-            border: 1px solid #e5e5e5;
-            border-radius: 12px;
-            padding: 12px 14px;
-            font-size: 16px;
-            font-family: "IBM Plex Sans", sans-serif;
-          }}
-          button {{
-            border: none;
-            border-radius: 12px;
-            background: var(--accent);
-            color: #fff;
-            padding: 12px 16px;
-            font-size: 15px;
-            font-weight: 600;
-            cursor: pointer;
-          }}
-          .alert {{
-            background: #fee2e2;
-            color: #991b1b;
-            padding: 10px 12px;
-            border-radius: 12px;
-            margin-top: 12px;
-            font-size: 14px;
-          }}
-          .hint {{
-            margin-top: 12px;
-            color: var(--muted);
-            font-size: 13px;
-          }}
-          @media (max-width: 800px) {{
-            .hero {{
-              flex-direction: column;
-              align-items: flex-start;
-            }}
-            .hero-card {{
-              width: 100%;
-              grid-template-columns: repeat(auto-fit, minmax(120px, 1fr));
-            }}
-          }}
-        </style>
-      </head>
-      <body>
-        {body}
-        {tz_script}
-      </body>
-    </html>
-    """
@@ -4,24 +4,25 @@ import re
 from typing import Tuple
 
 from services.opik_service import track
-from services.supabase_service import SupabaseService
+from services.models import User
+from services.storage import StorageBackend
 
 
 @track(name="onboarding_step")
 def handle_onboarding(
-    supabase: SupabaseService,
-    user: dict,
+    supabase: StorageBackend,
+    user: User,
     phone_number: str,
     message: str,
 ) -> Tuple[str, dict]:
-    step = user.get("onboarding_step") or "welcome"
+    step = user.onboarding_step or "welcome"
 
     if message.strip().lower() == "/onboarding":
         step = "welcome"
-        user = supabase.update_user(user["id"], {"onboarding_step": "welcome", "onboarding_complete": False})
+        user = supabase.update_user(user.id, {"onboarding_step": "welcome", "onboarding_complete": False})
 
     if step == "welcome":
-        supabase.update_user(user["id"], {"onboarding_step": "name", "onboarding_complete": False})
+        supabase.update_user(user.id, {"onboarding_step": "name", "onboarding_complete": False})
         text = (
             "Hey! I'm Tomatose! — your WhatsApp productivity copilot.\n\n"
             "I can help you:\n"
@@ -34,7 +35,7 @@ def handle_onboarding(
 
     if step == "name":
         name = _extract_name(message)
-        supabase.update_user(user["id"], {"name": name, "onboarding_step": "features"})
+        supabase.update_user(user.id, {"name": name, "onboarding_step": "features"})
         text = (
             f"Nice to meet you, {name}!\n\n"
             "Which features do you want to use?\n"
@@ -49,7 +50,7 @@ def handle_onboarding(
         features = _parse_features(message)
         if not features:
             return "Please reply with numbers like 1 2 3 (example: 1 3).", {"context": "onboarding"}
-        supabase.update_user(user["id"], {"features_enabled": features, "onboarding_step": "pomodoro_prefs"})
+        supabase.update_user(user.id, {"features_enabled": features, "onboarding_step": "pomodoro_prefs"})
         if "pomodoro" in features:
             text = (
                 "What's your default focus cycle?\n"
@@ -58,7 +59,7 @@ def handle_onboarding(
             )
             return text, {"context": "onboarding"}
         if "calories" in features:
-            supabase.update_user(user["id"], {"onboarding_step": "calorie_goal"})
+            supabase.update_user(user.id, {"onboarding_step": "calorie_goal"})
             return (
                 "What's your daily calorie goal?\n"
                 "Example: 2000\n"
@@ -69,10 +70,10 @@ def handle_onboarding(
     if step == "pomodoro_prefs":
         work, rest = _parse_pomodoro_prefs(message)
         updates = {"default_work_minutes": work, "default_break_minutes": rest}
-        user = supabase.update_user(user["id"], updates)
-        features = user.get("features_enabled") or []
+        user = supabase.update_user(user.id, updates)
+        features = user.features_enabled
         if "calories" in features:
-            supabase.update_user(user["id"], {"onboarding_step": "calorie_goal"})
+            supabase.update_user(user.id, {"onboarding_step": "calorie_goal"})
             return (
                 "What's your daily calorie goal?\n"
                 "Example: 2000\n"
@@ -83,14 +84,14 @@ def handle_onboarding(
     if step == "calorie_goal":
         goal = _parse_goal(message)
         if goal is not None:
-            supabase.update_user(user["id"], {"daily_calorie_goal": goal})
+            supabase.update_user(user.id, {"daily_calorie_goal": goal})
         return _finish_onboarding(supabase, user)
 
     return _finish_onboarding(supabase, user)
 
 
-def _finish_onboarding(supabase: SupabaseService, user: dict) -> Tuple[str, dict]:
-    supabase.update_user(user["id"], {"onboarding_complete": True, "onboarding_step": "done"})
+def _finish_onboarding(supabase: StorageBackend, user: User) -> Tuple[str, dict]:
+    supabase.update_user(user.id, {"onboarding_complete": True, "onboarding_step": "done"})
     text = (
         "You're all set!\n\n"
         "Quick starts:\n"
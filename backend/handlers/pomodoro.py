@@ -1,25 +1,19 @@
 from __future__ import annotations
 
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from typing import Tuple
 
+from services.models import User
 from services.opik_service import track
-from services.supabase_service import SupabaseService
+from services.storage import StorageBackend
+from utils.pomodoro_cycles import block_index_at
 
 
 @track(name="pomodoro_handler")
-def start_pomodoro(supabase: SupabaseService, user: dict, message: str) -> str:
+def start_pomodoro(supabase: StorageBackend, user: User, message: str) -> str:
     work, rest = _parse_start_times(message, user)
-    supabase.create_pomodoro_session(
-        user["id"],
-        "work",
-        datetime.utcnow(),
-        work,
-        status="active",
-        cycle_work_minutes=work,
-        cycle_break_minutes=rest,
-    )
+    supabase.start_pomodoro_cycle(user.id, datetime.now(timezone.utc), work, rest)
     return (
         f"⏱ Focus started — {work} min work / {rest} min break.\n"
         "I'll ping you at each transition. Send 'stop' to end."
@@ -27,38 +21,29 @@ def start_pomodoro(supabase: SupabaseService, user: dict, message: str) -> str:
 
 
 @track(name="pomodoro_handler")
-def stop_pomodoro(supabase: SupabaseService, user: dict) -> tuple[str, dict]:
-    active = supabase.get_active_sessions_for_user(user["id"])
-    now = datetime.utcnow()
-    for session in active:
-        supabase.update_pomodoro_session(
-            session["id"],
-            {"status": "cancelled", "end_time": now.isoformat()},
-        )
-    if not active:
+def stop_pomodoro(supabase: StorageBackend, user: User) -> tuple[str, dict]:
+    now = datetime.now(timezone.utc)
+    stopped = supabase.stop_pomodoro_cycles(user.id, now)
+    if not stopped:
         return "No active focus session right now.", {"context": "idle", "data": {}}
+    cycle = stopped[0]
     response = "⏹️ Stopped. Quick note — what did you work on?"
-    context = {"context": "awaiting_pomodoro_summary", "data": {"session_id": active[0]["id"]}}
+    context = {
+        "context": "awaiting_pomodoro_summary",
+        "data": {"cycle_id": cycle.id, "block": block_index_at(cycle, now)},
+    }
     return response, context
 
 
 @track(name="backfill_parser")
-def handle_backfill(supabase: SupabaseService, user: dict, backfill: dict) -> str:
+def handle_backfill(supabase: StorageBackend, user: User, backfill: dict) -> str:
     start_time = backfill.get("start_time")
     end_time = backfill.get("end_time")
     description = backfill.get("description") or "Backfilled work"
     if not start_time or not end_time:
         return "I couldn't parse the time range. Try: 'I worked on X from 2pm to 4pm'."
     duration = int((end_time - start_time).total_seconds() / 60)
-    supabase.create_pomodoro_session(
-        user["id"],
-        "work",
-        start_time,
-        duration,
-        status="completed",
-        is_backfill=True,
-        what_did_you_do=description,
-    )
+    supabase.log_pomodoro_cycle(user.id, start_time, end_time, description)
     return (
         f"Logged {duration} minutes — {description}\n"
         f"{start_time.strftime('%-I:%M %p')} → {end_time.strftime('%-I:%M %p')}"
@@ -66,43 +51,27 @@ def handle_backfill(supabase: SupabaseService, user: dict, backfill: dict) -> st
 
 
 @track(name="pomodoro_handler")
-def handle_summary(supabase: SupabaseService, session_id: str, message: str) -> str:
-    supabase.update_pomodoro_session(session_id, {"what_did_you_do": message, "status": "completed"})
+def handle_summary(supabase: StorageBackend, cycle_id: str, block: int, message: str) -> str:
+    supabase.set_pomodoro_summary(cycle_id, block, message)
     return "Nice — logged your session summary."
 
 
-def get_stats(supabase: SupabaseService, user: dict, start_iso: str, end_iso: str) -> str:
-    sessions = supabase._execute(
-        supabase.client.table("pomodoro_sessions")
-        .select("*")
-        .eq("user_id", user["id"])
-        .eq("session_type", "work")
-        .gte("start_time", start_iso)
-        .lte("start_time", end_iso)
-    )
-    if not sessions:
+def get_stats(supabase: StorageBackend, user: User, start_iso: str, end_iso: str) -> str:
+    stats = supabase.pomodoro_stats(user.id, start_iso, end_iso)
+    if not stats.block_count:
         return "No focus sessions logged today."
-    total_minutes = 0
-    items = []
-    for session in sessions:
-        start = datetime.fromisoformat(session["start_time"].replace("Z", "+00:00"))
-        end = session.get("end_time")
-        if end:
-            end_dt = datetime.fromisoformat(end.replace("Z", "+00:00"))
-            total_minutes += int((end_dt - start).total_seconds() / 60)
-        if session.get("what_did_you_do"):
-            items.append(f"- {session['what_did_you_do']}")
-    hours = round(total_minutes / 60, 2)
-    summary = f"Today's focus: {hours} hours across {len(sessions)} sessions."
+    items = [f"- {item}" for item in stats.summaries]
+    hours = round(stats.total_minutes / 60, 2)
+    summary = f"Today's focus: {hours} hours across {stats.block_count} sessions."
     if items:
         summary += "\n\nWhat you did:\n" + "\n".join(items)
     return summary
 
 
-def _parse_start_times(message: str, user: dict) -> Tuple[int, int]:
+def _parse_start_times(message: str, user: User) -> Tuple[int, int]:
     numbers = [int(n) for n in re.findall(r"\d+", message)]
     if not numbers:
-        return user.get("default_work_minutes", 25), user.get("default_break_minutes", 5)
+        return user.default_work_minutes, user.default_break_minutes
     if len(numbers) == 1:
-        return numbers[0], user.get("default_break_minutes", 5)
+        return numbers[0], user.default_break_minutes
     return numbers[0], numbers[1]
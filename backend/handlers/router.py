@@ -20,19 +20,20 @@ from handlers.pomodoro import (
     get_stats,
 )
 from handlers.tasks import add_task, complete_task, list_tasks, parse_task_completion
+from services.models import User
 from services.openai_service import OpenAIService
 from services.opik_service import set_trace_context, track
-from services.supabase_service import SupabaseService
+from services.storage import StorageBackend
 from services.twilio_service import TwilioService
 from utils.time_utils import day_range_utc
 from utils.thread_utils import phone_hash, thread_id_for_day
 
 
 class MessageRouter:
-    def __init__(self) -> None:
-        self.supabase = SupabaseService()
-        self.openai = OpenAIService()
-        self.twilio = TwilioService()
+    def __init__(self, supabase: StorageBackend, openai: OpenAIService, twilio: TwilioService) -> None:
+        self.supabase = supabase
+        self.openai = openai
+        self.twilio = twilio
 
     @track(name="message_router")
     async def route(self, phone_number: str, body: str, media_url: Optional[str] = None) -> str:
@@ -44,42 +45,42 @@ class MessageRouter:
                 "Please check SUPABASE_URL and SUPABASE_SECRET_KEY."
             )
 
-        thread_id = thread_id_for_day(phone_number, user.get("timezone", "UTC"))
+        thread_id = thread_id_for_day(phone_number, user.timezone)
         set_trace_context(
             thread_id=thread_id,
             metadata={
-                "user_id": user.get("id"),
+                "user_id": user.id,
                 "phone_hash": phone_hash(phone_number),
             },
             tags=["whatsapp", "router"],
         )
-        state = self.supabase.get_state(user["id"])
+        state = self.supabase.get_state(user.id)
         context = state.get("current_context") if state else None
         context_data = state.get("context_data") if state else {}
 
         message = body.strip()
 
         # Onboarding
-        if not user.get("onboarding_complete") or message == "/onboarding":
+        if not user.onboarding_complete or message == "/onboarding":
             reply, new_state = handle_onboarding(self.supabase, user, phone_number, message)
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
 
         # Context-specific handling
         if context == "awaiting_pomodoro_summary":
-            session_id = (context_data or {}).get("session_id")
-            if session_id:
-                reply = handle_summary(self.supabase, session_id, message)
+            cycle_id = (context_data or {}).get("cycle_id")
+            if cycle_id:
+                reply = handle_summary(self.supabase, cycle_id, context_data.get("block", 0), message)
             else:
                 reply = "Thanks — got it!"
-            self.supabase.upsert_state(user["id"], phone_number, "idle", {})
+            self.supabase.upsert_state(user.id, phone_number, "idle", {})
             return reply
 
         if context == "awaiting_calorie_confirm":
             reply, new_state = handle_calorie_confirmation(
                 self.supabase, self.openai, user, message, context_data or {}
             )
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
 
         if context == "awaiting_task_completion":
@@ -87,7 +88,7 @@ class MessageRouter:
             task_ids = (context_data or {}).get("task_ids", [])
             if idx and 1 <= idx <= len(task_ids):
                 reply = complete_task(self.supabase, task_ids[idx - 1])
-                self.supabase.upsert_state(user["id"], phone_number, "idle", {})
+                self.supabase.upsert_state(user.id, phone_number, "idle", {})
                 return reply
             # fall through to normal routing
 
@@ -95,7 +96,7 @@ class MessageRouter:
         if media_url:
             data_url = await self.twilio.download_media_data_url(media_url)
             reply, new_state = log_calorie_image(self.supabase, self.openai, user, data_url)
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
 
         # Command matcher
@@ -111,19 +112,19 @@ class MessageRouter:
             return start_pomodoro(self.supabase, user, message)
         if intent_name == "pomodoro_stop":
             reply, new_state = stop_pomodoro(self.supabase, user)
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
         if intent_name == "pomodoro_stats":
-            start_iso, end_iso = day_range_utc(user.get("timezone", "UTC"))
+            start_iso, end_iso = day_range_utc(user.timezone)
             return get_stats(self.supabase, user, start_iso, end_iso)
         if intent_name == "pomodoro_backfill":
-            backfill = self.openai.parse_backfill(message, user.get("timezone", "UTC"))
+            backfill = self.openai.parse_backfill(message, user.timezone)
             return handle_backfill(self.supabase, user, backfill)
         if intent_name == "task_add":
             return add_task(self.supabase, self.openai, user, message)
         if intent_name == "task_list":
             reply, new_state = list_tasks(self.supabase, user)
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
         if intent_name == "task_complete":
             idx = parse_task_completion(message)
@@ -134,11 +135,10 @@ class MessageRouter:
             return "Reply with the number from your task list to mark it done."
         if intent_name == "calorie_log":
             reply, new_state = log_calorie_text(self.supabase, self.openai, user, message)
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
         if intent_name == "calorie_summary":
-            start_iso, end_iso = day_range_utc(user.get("timezone", "UTC"))
-            return daily_summary(self.supabase, user, start_iso, end_iso)
+            return daily_summary(self.supabase, user)
         if intent_name == "calorie_goal":
             return update_goal(self.supabase, user, message)
         if intent_name == "help":
@@ -146,26 +146,26 @@ class MessageRouter:
 
         return "I can help with focus, tasks, and calories. Try: start, tasks, calories, /help."
 
-    def _handle_command(self, user: dict, phone_number: str, message: str) -> Optional[str]:
+    def _handle_command(self, user: User, phone_number: str, message: str) -> Optional[str]:
         lowered = message.lower()
         if lowered in {"/help", "help"}:
             return self._help_text()
         if lowered.startswith("/onboarding"):
             reply, new_state = handle_onboarding(self.supabase, user, phone_number, "/onboarding")
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
         if lowered.startswith("start"):
             return start_pomodoro(self.supabase, user, message)
         if lowered.startswith("stop"):
             reply, new_state = stop_pomodoro(self.supabase, user)
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
         if lowered.startswith("stats"):
-            start_iso, end_iso = day_range_utc(user.get("timezone", "UTC"))
+            start_iso, end_iso = day_range_utc(user.timezone)
             return get_stats(self.supabase, user, start_iso, end_iso)
         if lowered.startswith("tasks"):
             reply, new_state = list_tasks(self.supabase, user)
-            self.supabase.upsert_state(user["id"], phone_number, new_state.get("context"), new_state.get("data", {}))
+            self.supabase.upsert_state(user.id, phone_number, new_state.get("context"), new_state.get("data", {}))
             return reply
         if lowered.startswith("done"):
             idx = parse_task_completion(message)
@@ -173,14 +173,13 @@ class MessageRouter:
                 return "Reply with a number to mark a task done (e.g. done 1)."
             if not user:
                 return "I don't have an active task list. Send 'tasks' first."
-            state = self.supabase.get_state(user["id"])
+            state = self.supabase.get_state(user.id)
             task_ids = (state or {}).get("context_data", {}).get("task_ids", [])
             if 1 <= idx <= len(task_ids):
                 return complete_task(self.supabase, task_ids[idx - 1])
             return "That number doesn't match your current task list."
         if lowered.startswith("calories"):
-            start_iso, end_iso = day_range_utc(user.get("timezone", "UTC"))
-            return daily_summary(self.supabase, user, start_iso, end_iso)
+            return daily_summary(self.supabase, user)
         if lowered.startswith("goal"):
             return update_goal(self.supabase, user, message)
         return None
@@ -4,45 +4,48 @@ import re
 from datetime import datetime
 from typing import Tuple
 
+from services.models import User
 from services.openai_service import OpenAIService
 from services.opik_service import track
-from services.supabase_service import SupabaseService
+from services.storage import RowNotFound, StorageBackend
 
 
 @track(name="task_extraction")
 def add_task(
-    supabase: SupabaseService, openai: OpenAIService, user: dict, message: str
+    supabase: StorageBackend, openai: OpenAIService, user: User, message: str
 ) -> str:
-    extracted = openai.extract_task(message, user.get("timezone", "UTC"))
+    extracted = openai.extract_task(message, user.timezone)
     title = extracted.get("title") or message.strip()
     reminder_time = extracted.get("reminder_time")
-    supabase.insert_task(user["id"], title, message, reminder_time)
+    supabase.insert_task(user.id, title, message, reminder_time)
     if reminder_time:
         return f"✅ Task saved. ⏰ Reminder set for {reminder_time.strftime('%-I:%M %p')}."
     return "✅ Task saved."
 
 
-def list_tasks(supabase: SupabaseService, user: dict) -> Tuple[str, dict]:
-    tasks = supabase.list_incomplete_tasks(user["id"])
-    if not tasks:
-        return "✅ You're all caught up. No open tasks.", {"context": "idle", "data": {}}
+def list_tasks(supabase: StorageBackend, user: User) -> Tuple[str, dict]:
     lines = ["Open tasks:"]
     id_map = []
-    for idx, task in enumerate(tasks, start=1):
-        title = task["title"]
-        reminder = task.get("reminder_time")
+    for idx, task in enumerate(supabase.iter_incomplete_tasks(user.id), start=1):
+        title = task.title
+        reminder = task.reminder_time
         if reminder:
-            lines.append(f"{idx}. {title} (reminder: {reminder})")
+            lines.append(f"{idx}. {title} (reminder: {reminder.isoformat()})")
         else:
             lines.append(f"{idx}. {title}")
-        id_map.append(task["id"])
+        id_map.append(task.id)
+    if not id_map:
+        return "✅ You're all caught up. No open tasks.", {"context": "idle", "data": {}}
     lines.append("Reply with a number to mark one done.")
     return "\n".join(lines), {"context": "awaiting_task_completion", "data": {"task_ids": id_map}}
 
 
-def complete_task(supabase: SupabaseService, task_id: str) -> str:
-    task = supabase.complete_task(task_id)
-    return f"✅ '{task['title']}' marked done!"
+def complete_task(supabase: StorageBackend, task_id: str) -> str:
+    try:
+        task = supabase.complete_task(task_id)
+    except RowNotFound:
+        return "That task no longer exists. Send 'tasks' to see your list."
+    return f"✅ '{task.title}' marked done!"
 
 
 def parse_task_completion(message: str) -> int | None:
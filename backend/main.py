@@ -1,33 +1,72 @@
 from __future__ import annotations
 
 import logging
+import time
 
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from twilio.twiml.messaging_response import MessagingResponse
 
 from config import settings
-from handlers.dashboard import build_day_sections, normalize_phone_number, render_dashboard, render_login
+from handlers.dashboard import (
+    InvalidCursor,
+    load_dashboard,
+    load_history_page,
+    normalize_phone_number,
+    render_login,
+    server_timing,
+    static_asset,
+)
 from handlers.router import MessageRouter
+from services.clients import ClientRegistry, get_clients
+from services.journal import wait_for_journal
 from services.opik_service import configure_opik
-from services.supabase_service import SupabaseService
+from services.outbound_dispatcher import OutboundDispatcher
+from services.outbox_drainer import OutboxDrainer
 from services.timer_service import TimerService
-from services.twilio_service import TwilioService
+from utils.compression import CompressionMiddleware
+from utils.metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 
 app = FastAPI()
-router = MessageRouter()
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES)
+outbound: OutboundDispatcher | None = None
+timer: TimerService | None = None
+drainer: OutboxDrainer | None = None
+
+
+def get_router(request: Request) -> MessageRouter:
+    return request.app.state.router
 
 
 @app.on_event("startup")
 async def startup_event() -> None:
+    global outbound, timer, drainer
     configure_opik()
-    # Start background timer loop
-    supabase = SupabaseService()
-    twilio = TwilioService()
-    timer = TimerService(supabase, twilio)
+    clients = ClientRegistry(journal=True)
+    app.state.clients = clients
+    app.state.router = MessageRouter(clients.storage, clients.openai, clients.twilio)
+    if not settings.TIMER_IN_WEB:
+        return
+    # Start background timer loop and the outbox drainer that sends its messages
+    timer = TimerService(clients.storage)
     timer.start()
+    outbound = OutboundDispatcher(client=clients.twilio_http)
+    outbound.start()
+    drainer = OutboxDrainer(clients.storage, outbound)
+    drainer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    if timer:
+        await timer.stop()
+    if drainer:
+        await drainer.stop()
+    if outbound:
+        await outbound.stop()
+    await app.state.clients.aclose()
 
 
 @app.get("/")
@@ -35,34 +74,111 @@ async def health() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/healthz")
+async def healthz() -> dict:
+    return {"status": "ok", "role": "web", "timer": timer.health() if timer else None}
+
+
+@app.get("/metrics")
+async def metrics_view(clients: ClientRegistry = Depends(get_clients)) -> dict:
+    clients.record_pool_metrics()
+    return metrics.snapshot()
+
+
+@app.get("/static/{filename}")
+async def static_file(filename: str) -> Response:
+    found = static_asset(filename)
+    if not found:
+        return PlainTextResponse("Not found", status_code=404)
+    asset, current = found
+    # A hashed name always holds the same bytes; another deploy's name gets
+    # this process's copy, so that one mustn't be cached
+    cache_control = "public, max-age=31536000, immutable" if current else "no-cache"
+    return Response(asset.body, media_type=asset.media_type, headers={"Cache-Control": cache_control})
+
+
 @app.get("/dashboard")
 async def dashboard_login() -> HTMLResponse:
     return HTMLResponse(render_login())
 
 
 @app.get("/dashboard/view")
-async def dashboard_view(name: str = "", phone: str = "", tz: str = "", days: int = 7) -> HTMLResponse:
+async def dashboard_view(
+    request: Request,
+    name: str = "",
+    phone: str = "",
+    tz: str = "",
+    days: int = 7,
+    stream: bool | None = None,
+    clients: ClientRegistry = Depends(get_clients),
+) -> Response:
+    started = time.perf_counter()
     phone_clean = normalize_phone_number(phone)
     if not phone_clean:
         return HTMLResponse(render_login("Please enter a valid phone number."))
-    supabase = SupabaseService()
+    supabase = clients.storage
     user = supabase.get_user_by_phone(phone_clean)
     if not user:
         user = supabase.create_user(phone_clean)
     updates = {}
-    if name and (user.get("name") != name):
+    if name and (user.name != name):
         updates["name"] = name
-    if tz and (user.get("timezone") != tz):
+    if tz and (user.timezone != tz):
         updates["timezone"] = tz
     if updates:
-        user = supabase.update_user(user["id"], updates)
+        user = supabase.update_user(user.id, updates)
     safe_days = max(1, min(days, 14))
-    sections = build_day_sections(supabase, user, safe_days)
-    return HTMLResponse(render_dashboard(user, sections))
+    page = await load_dashboard(
+        supabase,
+        user,
+        safe_days,
+        request.headers.get("if-none-match"),
+        stream=settings.DASHBOARD_STREAMING if stream is None else stream,
+        started=started,
+    )
+    # Browsers revalidate on every view; a matching ETag costs only the user lookup
+    headers = {"Cache-Control": "private, no-cache", "Server-Timing": server_timing(page.timings)}
+    if page.etag:
+        headers["ETag"] = page.etag
+    if page.stream is not None:
+        return StreamingResponse(page.stream, media_type="text/html; charset=utf-8", headers=headers)
+    if page.html is None:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(page.html, headers=headers)
+
+
+@app.get("/api/dashboard")
+async def dashboard_api(
+    request: Request,
+    phone: str = "",
+    days: int = 7,
+    cursor: str = "",
+    clients: ClientRegistry = Depends(get_clients),
+) -> Response:
+    phone_clean = normalize_phone_number(phone)
+    if not phone_clean:
+        return JSONResponse({"error": "invalid phone number"}, status_code=400)
+    storage = clients.storage
+    user = storage.get_user_by_phone(phone_clean)
+    if not user:
+        return JSONResponse({"error": "unknown user"}, status_code=404)
+    safe_days = max(1, min(days, settings.DASHBOARD_API_MAX_DAYS))
+    try:
+        page = await load_history_page(storage, user, safe_days, cursor or None, request.headers.get("if-none-match"))
+    except InvalidCursor:
+        return JSONResponse({"error": "invalid cursor"}, status_code=400)
+    headers = {"Cache-Control": "private, no-cache", "Server-Timing": server_timing(page.timings)}
+    if page.etag:
+        headers["ETag"] = page.etag
+    if page.days is None:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(
+        {"timezone": page.timezone, "days": page.days, "next_cursor": page.next_cursor}, headers=headers
+    )
 
 
 @app.post("/webhook")
-async def webhook(request: Request) -> PlainTextResponse:
+async def webhook(request: Request, router: MessageRouter = Depends(get_router)) -> PlainTextResponse:
     form = await request.form()
     from_number = form.get("From", "")
     body = form.get("Body", "")
@@ -74,6 +190,8 @@ async def webhook(request: Request) -> PlainTextResponse:
     phone_number = from_number.replace("whatsapp:", "")
 
     reply_text = await router.route(phone_number, body, media_url)
+    # The reply acknowledges the message, so its journaled writes must be on disk
+    await wait_for_journal(request.app.state.clients.storage)
 
     twiml = MessagingResponse()
     twiml.message(reply_text)
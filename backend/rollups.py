@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import date
+
+from handlers.dashboard import normalize_phone_number
+from services.storage import create_storage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("rollups")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Check daily_rollups against the activity rows and repair drift")
+    parser.add_argument("--phone", action="append", help="Only this user (repeatable)")
+    parser.add_argument(
+        "--since",
+        type=date.fromisoformat,
+        help="First local day to rebuild (YYYY-MM-DD); defaults to each user's oldest row in Postgres",
+    )
+    parser.add_argument("--check", action="store_true", help="Report drift without repairing it")
+    return parser.parse_args()
+
+
+def run(args: argparse.Namespace) -> None:
+    storage = create_storage()
+    try:
+        if args.phone:
+            user_ids = []
+            for phone in args.phone:
+                user = storage.get_user_by_phone(normalize_phone_number(phone))
+                if not user:
+                    raise SystemExit(f"No user with phone number {phone}")
+                user_ids.append(user.id)
+        else:
+            user_ids = storage.iter_user_ids()
+        checked = drifted = 0
+        for user_id in user_ids:
+            try:
+                # One transaction per user, holding only that user's rollup lock,
+                # so a repair never stalls other users' writes
+                corrected = storage.rebuild_daily_rollups(user_id, args.since, repair=not args.check)
+            except Exception:
+                logger.exception("Rebuilding rollups for %s failed", user_id)
+                continue
+            checked += 1
+            if corrected:
+                drifted += 1
+                logger.info("%s: %s rollup rows %s", user_id, corrected, "differ" if args.check else "repaired")
+        logger.info("Checked %s users, %s with drift", checked, drifted)
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    run(_parse_args())
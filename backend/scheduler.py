@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from config import settings
+from services.clients import ClientRegistry
+from services.opik_service import configure_opik
+from services.outbound_dispatcher import OutboundDispatcher
+from services.outbox_drainer import OutboxDrainer
+from services.timer_service import TimerService
+from utils.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+
+app = FastAPI()
+role = "all"
+timer: TimerService | None = None
+clients: ClientRegistry | None = None
+
+
+@app.get("/healthz")
+async def healthz() -> JSONResponse:
+    health = timer.health() if timer else None
+    healthy = health["healthy"] if health else role == "outbox"
+    status_code = 200 if healthy else 503
+    return JSONResponse({"role": f"scheduler:{role}", "timer": health}, status_code=status_code)
+
+
+@app.get("/metrics")
+async def metrics_view() -> dict:
+    if clients:
+        clients.record_pool_metrics()
+    return metrics.snapshot()
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the pomodoro/reminder scheduler")
+    parser.add_argument("--role", choices=["all", "timer", "outbox"], default="all")
+    parser.add_argument("--port", type=int, default=settings.SCHEDULER_PORT)
+    parser.add_argument("--outbound-workers", type=int, default=settings.OUTBOUND_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=settings.TIMER_BATCH_SIZE)
+    parser.add_argument("--poll-seconds", type=int, default=settings.POMODORO_POLL_SECONDS)
+    return parser.parse_args()
+
+
+async def run(args: argparse.Namespace) -> None:
+    global role, timer, clients
+    role = args.role
+    settings.TIMER_BATCH_SIZE = args.batch_size
+    settings.POMODORO_POLL_SECONDS = args.poll_seconds
+    configure_opik()
+    clients = ClientRegistry()
+    supabase = clients.storage
+    outbound: OutboundDispatcher | None = None
+    drainer: OutboxDrainer | None = None
+    if role in {"all", "timer"}:
+        timer = TimerService(supabase)
+        timer.start()
+    if role in {"all", "outbox"}:
+        outbound = OutboundDispatcher(workers=args.outbound_workers, client=clients.twilio_http)
+        outbound.start()
+        drainer = OutboxDrainer(supabase, outbound)
+        drainer.start()
+    server = uvicorn.Server(uvicorn.Config(app, host=settings.HOST, port=args.port, log_level="warning"))
+    try:
+        await server.serve()
+    finally:
+        if timer:
+            await timer.stop()
+        if drainer:
+            await drainer.stop()
+        if outbound:
+            await outbound.stop()
+        await clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(_parse_args()))
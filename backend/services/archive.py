@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import re
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Mapping, TypeVar
+
+from config import settings
+from services.models import CalorieLog, CalorieStats, PomodoroCycle, PomodoroStats, Task, TaskStats
+from services.storage import StorageBackend
+from utils.time_utils import parse_ts
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:  # pragma: no cover
+    pa = None
+    pq = None
+
+T = TypeVar("T")
+
+MONTH_FILE = re.compile(r"^(\d{4})-(\d{2})\.parquet$")
+ROW_GROUP_SIZE = 64 * 1024
+
+# (low, high) bounds on a timestamp column, inclusive; None is unbounded
+Bounds = dict[str, tuple[datetime | None, datetime | None]]
+
+
+def archive_available(directory: str | None) -> bool:
+    return bool(directory and pq)
+
+
+def _parquet_value(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return value
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ParquetArchive:
+    # Months dropped from the partitioned tables, one zstd-compressed Parquet
+    # file per table and UTC month: <directory>/<table>/<YYYY-MM>.parquet.
+    # Rows are sorted by user_id so a read for one user skips most row groups,
+    # and the file metadata records each timestamp column's min/max so reads
+    # only open files that can match.
+    def __init__(self, directory: str) -> None:
+        if pq is None:
+            raise RuntimeError("pyarrow is required for the Parquet archive")
+        self.directory = Path(directory)
+        self._metadata_cache: dict[Path, tuple[float, dict]] = {}
+
+    def path(self, table: str, month: date) -> Path:
+        return self.directory / table / f"{month:%Y-%m}.parquet"
+
+    def months(self, table: str) -> list[date]:
+        folder = self.directory / table
+        if not folder.is_dir():
+            return []
+        months = []
+        for entry in folder.iterdir():
+            match = MONTH_FILE.match(entry.name)
+            if match:
+                months.append(date(int(match[1]), int(match[2]), 1))
+        return sorted(months)
+
+    def pending(self) -> list[Path]:
+        # Files written by an archiver run that stopped before moving them
+        # into place
+        return sorted(self.directory.glob("*/*.parquet.tmp"))
+
+    def write(self, table: str, month: date, rows: list[Mapping[str, Any]], json_columns: Iterable[str] = ()) -> Path:
+        # Written beside the final path; commit() moves it into place once the
+        # month's partition has been dropped
+        path = self.path(table, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        records = sorted(
+            ({key: _parquet_value(value) for key, value in row.items()} for row in rows),
+            key=lambda record: str(record.get("user_id") or ""),
+        )
+        ranges: dict[str, tuple[datetime, datetime]] = {}
+        for record in records:
+            for key, value in record.items():
+                if isinstance(value, datetime):
+                    low, high = ranges.get(key, (value, value))
+                    ranges[key] = (min(low, value), max(high, value))
+        metadata = {
+            "json_columns": json.dumps(list(json_columns)),
+            "ranges": json.dumps({key: [low.isoformat(), high.isoformat()] for key, (low, high) in ranges.items()}),
+        }
+        data = pa.Table.from_pylist(records).replace_schema_metadata(metadata)
+        pq.write_table(data, tmp, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+        with open(tmp, "rb") as handle:
+            os.fsync(handle.fileno())
+        written = pq.read_metadata(tmp).num_rows
+        if written != len(rows):
+            raise RuntimeError(f"{tmp}: wrote {written} rows, expected {len(rows)}")
+        return tmp
+
+    def commit(self, tmp: Path) -> Path:
+        path = tmp.with_name(tmp.name.removesuffix(".tmp"))
+        os.replace(tmp, path)
+        _fsync_dir(path.parent)
+        return path
+
+    def read(self, table: str, user_id: str, columns: str, bounds: Bounds) -> list[dict]:
+        # Rows for one user from every file whose ranges overlap `bounds`;
+        # callers apply the exact row filter
+        rows: list[dict] = []
+        for month in self.months(table):
+            path = self.path(table, month)
+            metadata = self._metadata(path)
+            if not _overlaps(metadata["ranges"], bounds):
+                continue
+            data = pq.read_table(path, columns=columns.split(","), filters=[("user_id", "=", user_id)])
+            for row in data.to_pylist():
+                for column in metadata["json_columns"]:
+                    if isinstance(row.get(column), str):
+                        row[column] = json.loads(row[column])
+                rows.append(row)
+        return rows
+
+    def _metadata(self, path: Path) -> dict:
+        mtime = path.stat().st_mtime
+        cached = self._metadata_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        raw = pq.read_schema(path).metadata or {}
+        metadata = {
+            "json_columns": json.loads(raw.get(b"json_columns", b"[]")),
+            "ranges": {
+                column: (parse_ts(low), parse_ts(high))
+                for column, (low, high) in json.loads(raw.get(b"ranges", b"{}")).items()
+            },
+        }
+        self._metadata_cache[path] = (mtime, metadata)
+        return metadata
+
+
+def _overlaps(ranges: dict[str, tuple[datetime, datetime]], bounds: Bounds) -> bool:
+    for column, (low, high) in bounds.items():
+        if column not in ranges:
+            return False
+        file_low, file_high = ranges[column]
+        if (low is not None and file_high < low) or (high is not None and file_low > high):
+            return False
+    return True
+
+
+class ArchivedStorage:
+    # Range reads also return rows from archived months, merged in the same
+    # (column, id) order the backends page in. Months only reach the archive
+    # once they hold no open work, so incomplete tasks and the timer RPCs
+    # never need it; everything else goes straight to the live backend.
+    def __init__(self, inner: StorageBackend, archive: ParquetArchive) -> None:
+        self.inner = inner
+        self.archive = archive
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    @property
+    def query_count(self) -> int:
+        return self.inner.query_count
+
+    def iter_pomodoro_cycles(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[PomodoroCycle]:
+        archived = self._archived_cycles(user_id, start_iso, end_iso)
+        live = self.inner.iter_pomodoro_cycles(user_id, start_iso, end_iso, page_size)
+        return _merge(archived, live, lambda cycle: cycle.started_at)
+
+    def pomodoro_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_blocks: bool = False
+    ) -> PomodoroStats:
+        live = self.inner.pomodoro_stats(user_id, start_iso, end_iso, with_blocks)
+        archived = self._archived_cycles(user_id, start_iso, end_iso)
+        if not archived:
+            return live
+        stats = PomodoroStats.from_cycles(archived, parse_ts(start_iso), parse_ts(end_iso), with_blocks)
+        return stats.merge(live)
+
+    def iter_tasks_created(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]:
+        archived = self._between("tasks", Task, user_id, "created_at", start_iso, end_iso)
+        live = self.inner.iter_tasks_created(user_id, start_iso, end_iso, page_size)
+        return _merge(archived, live, lambda task: task.created_at)
+
+    def iter_tasks_completed(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]:
+        archived = self._archived_completed(user_id, start_iso, end_iso)
+        live = self.inner.iter_tasks_completed(user_id, start_iso, end_iso, page_size)
+        return _merge(archived, live, lambda task: task.completed_at)
+
+    def task_stats(self, user_id: str, start_iso: str, end_iso: str) -> TaskStats:
+        live = self.inner.task_stats(user_id, start_iso, end_iso)
+        archived = TaskStats(
+            created=self._between("tasks", Task, user_id, "created_at", start_iso, end_iso),
+            completed=self._archived_completed(user_id, start_iso, end_iso),
+        )
+        if not archived.created and not archived.completed:
+            return live
+        return archived.merge(live)
+
+    def iter_calorie_logs(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[CalorieLog]:
+        archived = self._between("calorie_logs", CalorieLog, user_id, "logged_at", start_iso, end_iso)
+        live = self.inner.iter_calorie_logs(user_id, start_iso, end_iso, page_size)
+        return _merge(archived, live, lambda log: log.logged_at)
+
+    def calorie_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_meals: bool = False
+    ) -> CalorieStats:
+        live = self.inner.calorie_stats(user_id, start_iso, end_iso, with_meals)
+        archived = self._between("calorie_logs", CalorieLog, user_id, "logged_at", start_iso, end_iso)
+        if not archived:
+            return live
+        return CalorieStats.from_logs(archived, with_meals).merge(live)
+
+    def _archived_cycles(self, user_id: str, start_iso: str, end_iso: str) -> list[PomodoroCycle]:
+        start, end = parse_ts(start_iso), parse_ts(end_iso)
+        rows = self.archive.read(
+            "pomodoro_cycles",
+            user_id,
+            PomodoroCycle.COLUMNS,
+            {"started_at": (None, end), "stopped_at": (start, None)},
+        )
+        cycles = [PomodoroCycle.from_row(row) for row in rows]
+        return [
+            cycle
+            for cycle in cycles
+            if cycle.started_at <= end and (cycle.stopped_at is None or cycle.stopped_at >= start)
+        ]
+
+    def _archived_completed(self, user_id: str, start_iso: str, end_iso: str) -> list[Task]:
+        tasks = self._between("tasks", Task, user_id, "completed_at", start_iso, end_iso)
+        return [task for task in tasks if task.completed]
+
+    def _between(self, table: str, model: Any, user_id: str, column: str, start_iso: str, end_iso: str) -> list:
+        start, end = parse_ts(start_iso), parse_ts(end_iso)
+        rows = self.archive.read(table, user_id, model.COLUMNS, {column: (start, end)})
+        items = [model.from_row(row) for row in rows]
+        items = [item for item in items if getattr(item, column) and start <= getattr(item, column) <= end]
+        return sorted(items, key=lambda item: (getattr(item, column), item.id))
+
+
+def _merge(archived: list[T], live: Iterator[T], key: Callable[[T], datetime | None]) -> Iterator[T]:
+    if not archived:
+        return live
+    archived.sort(key=lambda item: (key(item), item.id))
+    return heapq.merge(archived, live, key=lambda item: (key(item), item.id))
+
+
+def create_archived_storage(inner: StorageBackend) -> StorageBackend:
+    if not archive_available(settings.ARCHIVE_DIR):
+        return inner
+    return ArchivedStorage(inner, ParquetArchive(settings.ARCHIVE_DIR))
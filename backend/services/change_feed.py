@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Callable
+
+from utils.time_utils import parse_ts
+
+try:
+    import asyncpg  # type: ignore
+except Exception:  # pragma: no cover
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "timer_changes"
+
+
+def change_feed_available(dsn: str | None) -> bool:
+    return bool(dsn and asyncpg)
+
+
+class ChangeFeed:
+    def __init__(
+        self,
+        dsn: str,
+        on_change: Callable[[dict], None],
+        on_connect: Callable[[], None],
+        channel: str = CHANNEL,
+        max_backoff_seconds: float = 30.0,
+    ) -> None:
+        self.dsn = dsn
+        self.on_change = on_change
+        self.on_connect = on_connect
+        self.channel = channel
+        self.max_backoff_seconds = max_backoff_seconds
+        self.connected = False
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if not asyncpg:
+            raise RuntimeError("asyncpg is required for the change feed")
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda _conn: closed.set())
+                await conn.add_listener(self.channel, self._handle)
+                self.connected = True
+                backoff = 1.0
+                logger.info("Listening for timer changes on %s", self.channel)
+                # Anything that changed while we were disconnected is picked up here
+                self.on_connect()
+                await closed.wait()
+                logger.warning("Timer change feed connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Timer change feed error: %s", exc)
+            finally:
+                self.connected = False
+                if conn and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff_seconds)
+
+    def _handle(self, _conn, _pid: int, _channel: str, payload: str) -> None:
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            return
+        if change.get("due_at"):
+            # Unreadable: the timer treats a change without one as due now
+            change["due_at"] = parse_ts(change["due_at"], lenient=True)
+        self.on_change(change)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import httpx
+from fastapi import Request
+
+try:
+    import h2  # type: ignore  # noqa: F401
+except Exception:  # pragma: no cover
+    h2 = None
+
+from config import settings
+from services.archive import create_archived_storage
+from services.openai_service import OpenAIService
+from services.outbound_dispatcher import TWILIO_API_BASE
+from services.journal import create_journaled_storage
+from services.storage import StorageBackend, create_storage
+from services.twilio_service import TwilioService
+from utils.metrics import metrics
+
+
+def _limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(settings.HTTP_MAX_KEEPALIVE, max_connections),
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+class ClientRegistry:
+    # Built once per process; handlers and background services get their
+    # clients from here instead of opening their own. With journal=True (the
+    # web process) storage writes go through the local write journal.
+    def __init__(self, journal: bool = False) -> None:
+        http2 = settings.HTTP2_ENABLED and h2 is not None
+        twilio_connections = max(settings.HTTP_MAX_CONNECTIONS, settings.OUTBOUND_WORKERS)
+        self.max_connections = {
+            "supabase": settings.HTTP_MAX_CONNECTIONS,
+            "openai": settings.HTTP_MAX_CONNECTIONS,
+            "twilio": twilio_connections,
+        }
+        self.supabase_http = httpx.Client(
+            http2=http2,
+            limits=_limits(settings.HTTP_MAX_CONNECTIONS),
+            timeout=settings.HTTP_TIMEOUT_SECONDS,
+            follow_redirects=True,
+        )
+        self.openai_http = httpx.Client(
+            http2=http2,
+            limits=_limits(settings.HTTP_MAX_CONNECTIONS),
+            timeout=settings.OPENAI_TIMEOUT_SECONDS,
+        )
+        # Message sends and media downloads share one keep-alive pool to Twilio
+        self.twilio_http = httpx.AsyncClient(
+            http2=http2,
+            base_url=TWILIO_API_BASE,
+            auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+            limits=_limits(twilio_connections),
+            timeout=settings.HTTP_TIMEOUT_SECONDS,
+        )
+        self.storage: StorageBackend = create_archived_storage(create_storage(self.supabase_http))
+        if journal:
+            self.storage = create_journaled_storage(self.storage)
+        self.openai = OpenAIService(self.openai_http)
+        self.twilio = TwilioService(self.twilio_http)
+
+    def http_clients(self) -> dict[str, httpx.Client | httpx.AsyncClient]:
+        return {"supabase": self.supabase_http, "openai": self.openai_http, "twilio": self.twilio_http}
+
+    def record_pool_metrics(self) -> None:
+        for name, client in self.http_clients().items():
+            # httpx does not expose pool stats; read them off the httpcore pool
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for conn in connections if conn.is_idle())
+            active = len(connections) - idle
+            metrics.set_gauge("http_pool_connections", active, labels={"client": name, "state": "active"})
+            metrics.set_gauge("http_pool_connections", idle, labels={"client": name, "state": "idle"})
+            metrics.set_gauge("http_pool_utilization", active / self.max_connections[name], labels={"client": name})
+        db_pool = getattr(self.storage, "pool", None)
+        if db_pool is not None:
+            size = db_pool.get_size()
+            idle = db_pool.get_idle_size()
+            metrics.set_gauge("db_pool_connections", size - idle, labels={"state": "active"})
+            metrics.set_gauge("db_pool_connections", idle, labels={"state": "idle"})
+            metrics.set_gauge("db_pool_utilization", (size - idle) / db_pool.get_max_size())
+
+    async def aclose(self) -> None:
+        await self.twilio_http.aclose()
+        self.openai_http.close()
+        self.supabase_http.close()
+        self.storage.close()
+
+
+def get_clients(request: Request) -> ClientRegistry:
+    return request.app.state.clients
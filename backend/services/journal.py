@@ -0,0 +1,781 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator
+from zoneinfo import ZoneInfo
+
+import httpx
+
+from config import settings
+from services.models import (
+    CalorieLog,
+    CalorieStats,
+    DailyRollup,
+    PomodoroCycle,
+    PomodoroStats,
+    Task,
+    TaskStats,
+    User,
+)
+from services.storage import RowNotFound, StorageBackend
+from utils.metrics import metrics
+from utils.time_utils import days_range_utc, parse_ts
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE classes that will fail the same way on every retry (bad data,
+# constraint violations, schema mismatches); anything else is retried
+PERMANENT_SQLSTATE_CLASSES = {"22", "23", "42"}
+
+
+class WriteJournal:
+    # Append-only log of pending writes in numbered segment files. Each line is
+    # "<crc32> <json>"; appends are group-committed: one fsync, issued at most
+    # every JOURNAL_FSYNC_INTERVAL_MS, covers every entry written before it.
+    # Entries up to the checkpoint have been applied to storage.
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int | None = None,
+        fsync_interval_ms: float | None = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes or settings.JOURNAL_SEGMENT_BYTES
+        self.fsync_interval = (fsync_interval_ms or settings.JOURNAL_FSYNC_INTERVAL_MS) / 1000
+        # One process per journal directory; a second replayer would apply
+        # the same entries out of order
+        self._lock_file = open(self.directory / "lock", "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise RuntimeError(f"Journal directory {self.directory} is in use by another process")
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._dirty = threading.Event()
+        self._closed = False
+        self.checkpoint_seq = self._read_checkpoint()
+        self.recovered = [entry for entry in self._read_entries() if entry["seq"] > self.checkpoint_seq]
+        last_seq = max([self.checkpoint_seq] + [entry["seq"] for entry in self.recovered])
+        self._next_seq = last_seq + 1
+        self._written_seq = last_seq
+        self._synced_seq = last_seq
+        self._file = self._open_segment(self._next_seq)
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal-fsync", daemon=True)
+        self._flusher.start()
+
+    def _segments(self) -> list[Path]:
+        return sorted(self.directory.glob("*.log"))
+
+    def _open_segment(self, first_seq: int):
+        return open(self.directory / f"{first_seq:016d}.log", "ab")
+
+    def _read_checkpoint(self) -> int:
+        try:
+            return int((self.directory / "checkpoint").read_text().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _read_entries(self) -> list[dict]:
+        entries = []
+        for path in self._segments():
+            with open(path, "r+b") as handle:
+                valid_bytes = 0
+                for line in handle:
+                    crc, _, data = line.rstrip(b"\n").partition(b" ")
+                    if not line.endswith(b"\n") or f"{zlib.crc32(data):08x}".encode() != crc:
+                        # Torn write from a crash: it was never acknowledged.
+                        # Cut it off, or the next append to this segment would
+                        # land behind it and be skipped on the following start
+                        logger.warning("Truncating damaged journal record in %s", path.name)
+                        handle.truncate(valid_bytes)
+                        os.fsync(handle.fileno())
+                        break
+                    valid_bytes += len(line)
+                    entries.append(json.loads(data))
+        return entries
+
+    def append(self, op: str, args: dict, wait: bool = True) -> dict:
+        # With wait=False the caller must wait_synced() (or await_synced())
+        # before acknowledging the write
+        entry = {"op": op, "args": args, "at": datetime.now(timezone.utc).isoformat()}
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Journal is closed")
+            entry["seq"] = self._next_seq
+            self._next_seq += 1
+            data = json.dumps(entry, separators=(",", ":")).encode("utf-8")
+            self._file.write(f"{zlib.crc32(data):08x} ".encode() + data + b"\n")
+            self._written_seq = entry["seq"]
+            self._dirty.set()
+        if wait:
+            self.wait_synced(entry["seq"])
+        return entry
+
+    def wait_synced(self, seq: int | None = None) -> None:
+        with self._lock:
+            seq = self._written_seq if seq is None else seq
+            while self._synced_seq < seq:
+                self._synced.wait()
+
+    async def await_synced(self, seq: int | None = None) -> None:
+        seq = self._written_seq if seq is None else seq
+        if self._synced_seq < seq:
+            await asyncio.to_thread(self.wait_synced, seq)
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._dirty.wait()
+            # Let concurrent appends pile up behind one fsync
+            time.sleep(self.fsync_interval)
+            self._dirty.clear()
+            self._sync()
+            if self._closed:
+                return
+
+    def _sync(self) -> None:
+        # The fsync runs outside the lock so appends (some made on the event
+        # loop) only ever wait for the buffered write, not the disk
+        with self._lock:
+            target = self._written_seq
+            if target <= self._synced_seq:
+                self._synced.notify_all()
+                return
+            handle = self._file
+            handle.flush()
+            if handle.tell() >= self.segment_bytes:
+                self._file = self._open_segment(self._next_seq)
+        started = time.perf_counter()
+        os.fsync(handle.fileno())
+        if handle is not self._file:
+            handle.close()
+        metrics.observe("journal_fsync_ms", (time.perf_counter() - started) * 1000)
+        with self._lock:
+            metrics.observe("journal_fsync_batch", target - self._synced_seq)
+            self._synced_seq = target
+            self._synced.notify_all()
+
+    def checkpoint(self, seq: int) -> None:
+        # Fsynced before the rename, so a crash leaves the old checkpoint or
+        # the new one, never an empty file that would replay the whole
+        # journal. Replaying from an older checkpoint re-applies a suffix of
+        # the log in order, which every op tolerates: inserts carry their ids
+        # and a stop only touches cycles started before it.
+        tmp = self.directory / "checkpoint.tmp"
+        with open(tmp, "w") as handle:
+            handle.write(str(seq))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, self.directory / "checkpoint")
+        self.checkpoint_seq = seq
+        # Drop segments that are fully applied; the one being written stays
+        segments = self._segments()
+        for path, following in zip(segments, segments[1:]):
+            if int(following.stem) - 1 <= seq:
+                path.unlink(missing_ok=True)
+
+    def reject(self, entry: dict, error: str) -> None:
+        with open(self.directory / "rejected.jsonl", "a") as handle:
+            handle.write(json.dumps({**entry, "error": error}) + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._dirty.set()
+        self._flusher.join(timeout=5)
+        self._file.close()
+        self._lock_file.close()
+
+
+class JournaledStorage:
+    # Storage wrapper for the webhook path: the writes handlers make are
+    # journaled and acknowledged as soon as they are fsynced, then replayed
+    # against the real backend, in order, by a background thread. Reads merge
+    # in whatever is still pending so a request sees its own writes. Inserts
+    # get their ids here, which makes every replayed write idempotent.
+    # Anything not overridden (timer RPCs, outbox, bulk_insert) goes straight
+    # to the backend.
+    def __init__(self, inner: StorageBackend, journal: WriteJournal) -> None:
+        self.inner = inner
+        self.journal = journal
+        self._lock = threading.Lock()
+        self._pending: dict[int, dict] = {entry["seq"]: entry for entry in journal.recovered}
+        # Last known rows, used to answer writes locally and to keep serving a
+        # user while the backend is unreachable
+        self._users: dict[str, User] = {}
+        self._user_ids: dict[str, str] = {}
+        self._states: dict[str, dict | None] = {}
+        self._tasks: dict[str, tuple[str, Task]] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._replayer = threading.Thread(target=self._replay_loop, name="journal-replay", daemon=True)
+        self._replayer.start()
+        if self._pending:
+            logger.info("Replaying %s journaled writes", len(self._pending))
+            self._wake.set()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    @property
+    def query_count(self) -> int:
+        return self.inner.query_count
+
+    def close(self) -> None:
+        # Give the replayer a moment to drain; whatever is left is replayed
+        # from disk on the next start
+        deadline = time.monotonic() + settings.JOURNAL_DRAIN_SECONDS
+        while self._pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        self._wake.set()
+        self._replayer.join(timeout=5)
+        self.journal.close()
+        self.inner.close()
+
+    # Journal plumbing
+    def _record(self, op: str, args: dict) -> dict:
+        started = time.perf_counter()
+        # A handler on the event loop must not block it on the fsync; the
+        # webhook awaits wait_for_journal() before it replies instead
+        entry = self.journal.append(op, args, wait=not _on_event_loop())
+        with self._lock:
+            self._pending[entry["seq"]] = entry
+            metrics.set_gauge("journal_pending", len(self._pending))
+        metrics.inc("journal_appends_total", labels={"op": op})
+        metrics.observe("journal_append_ms", (time.perf_counter() - started) * 1000)
+        self._wake.set()
+        return entry
+
+    def _pending_entries(self, *ops: str) -> list[dict]:
+        with self._lock:
+            entries = [self._pending[seq] for seq in sorted(self._pending)]
+        return [entry for entry in entries if entry["op"] in ops]
+
+    def _has_pending(self, user_id: str, *ops: str) -> bool:
+        # Entries without a user_id (summaries) may be this user's
+        return any(entry["args"].get("user_id", user_id) == user_id for entry in self._pending_entries(*ops))
+
+    def has_pending_writes(self, user_id: str) -> bool:
+        # Writes the dashboard shows that haven't reached storage, so haven't
+        # bumped the user's data_version yet
+        return self._has_pending(
+            user_id,
+            "update_user",
+            "start_pomodoro_cycle",
+            "log_pomodoro_cycle",
+            "stop_pomodoro_cycles",
+            "set_pomodoro_summary",
+            "insert_task",
+            "complete_task",
+            "insert_calorie_log",
+        )
+
+    def _replay_loop(self) -> None:
+        failures = 0
+        while not self._stop.is_set():
+            with self._lock:
+                seq = min(self._pending, default=None)
+                entry = self._pending.get(seq) if seq is not None else None
+            if entry is None:
+                self._wake.wait(1)
+                self._wake.clear()
+                continue
+            try:
+                self._apply(entry)
+            except Exception as exc:
+                if not _is_permanent(exc):
+                    failures += 1
+                    metrics.inc("journal_replay_errors_total", labels={"op": entry["op"]})
+                    logger.warning("Journal replay of #%s failed, retrying: %s", seq, exc)
+                    # Backoff is not cut short by new appends, only by close()
+                    self._stop.wait(min(settings.JOURNAL_RETRY_SECONDS * 2 ** (failures - 1), 60))
+                    continue
+                logger.exception("Journal entry #%s (%s) rejected by storage", seq, entry["op"])
+                metrics.inc("journal_rejected_total", labels={"op": entry["op"]})
+                self.journal.reject(entry, repr(exc))
+            failures = 0
+            with self._lock:
+                self._pending.pop(seq, None)
+                metrics.set_gauge("journal_pending", len(self._pending))
+            self.journal.checkpoint(seq)
+            lag_ms = (datetime.now(timezone.utc) - parse_ts(entry["at"])).total_seconds() * 1000
+            metrics.observe("journal_replay_lag_ms", lag_ms, labels={"op": entry["op"]})
+
+    def _apply(self, entry: dict) -> None:
+        op, args = entry["op"], entry["args"]
+        if op == "update_user":
+            self.inner.update_user(args["user_id"], dict(args["fields"]))
+        elif op == "upsert_state":
+            self.inner.upsert_state(args["user_id"], args["phone_number"], args["context"], args["context_data"])
+        elif op == "clear_state":
+            self.inner.clear_state(args["user_id"])
+        elif op == "start_pomodoro_cycle":
+            self.inner.start_pomodoro_cycle(
+                args["user_id"],
+                parse_ts(args["started_at"]),
+                args["work_minutes"],
+                args["break_minutes"],
+                cycle_id=args["id"],
+            )
+        elif op == "log_pomodoro_cycle":
+            self.inner.log_pomodoro_cycle(
+                args["user_id"],
+                parse_ts(args["started_at"]),
+                parse_ts(args["stopped_at"]),
+                args["summary"],
+                cycle_id=args["id"],
+            )
+        elif op == "stop_pomodoro_cycles":
+            self.inner.stop_pomodoro_cycles(args["user_id"], parse_ts(args["stopped_at"]))
+        elif op == "set_pomodoro_summary":
+            self.inner.set_pomodoro_summary(args["cycle_id"], args["block"], args["summary"])
+        elif op == "insert_task":
+            self.inner.insert_task(
+                args["user_id"],
+                args["title"],
+                args["raw_message"],
+                parse_ts(args["reminder_time"]),
+                task_id=args["id"],
+                created_at=parse_ts(args["created_at"]),
+            )
+        elif op == "complete_task":
+            self.inner.complete_task(args["task_id"], completed_at=parse_ts(args["completed_at"]))
+        elif op == "insert_calorie_log":
+            self.inner.insert_calorie_log(
+                args["user_id"],
+                args["meal_description"],
+                args["calories"],
+                args["protein_g"],
+                args["carbs_g"],
+                args["fat_g"],
+                args["fiber_g"],
+                args["confirmed"],
+                args["image_url"],
+                log_id=args["id"],
+                logged_at=parse_ts(args["logged_at"]),
+            )
+        else:
+            raise ValueError(f"Unknown journal op: {op}")
+
+    # Users
+    def _remember_user(self, user: User | None) -> User | None:
+        if not user:
+            return None
+        for entry in self._pending_entries("update_user"):
+            if entry["args"]["user_id"] == user.id:
+                user = _with_fields(user, entry["args"]["fields"])
+        self._users[user.id] = user
+        self._user_ids[user.phone_number] = user.id
+        return user
+
+    def _cached_user(self, phone_number: str, exc: Exception) -> User:
+        user_id = self._user_ids.get(phone_number)
+        if not user_id:
+            raise exc
+        logger.warning("Storage unavailable, serving cached user: %s", exc)
+        return self._remember_user(self._users[user_id])
+
+    def get_user_by_phone(self, phone_number: str) -> User | None:
+        try:
+            return self._remember_user(self.inner.get_user_by_phone(phone_number))
+        except Exception as exc:
+            return self._cached_user(phone_number, exc)
+
+    def get_or_create_user(self, phone_number: str) -> User:
+        try:
+            return self._remember_user(self.inner.get_or_create_user(phone_number))
+        except Exception as exc:
+            return self._cached_user(phone_number, exc)
+
+    def get_users_by_ids(self, user_ids: list[str]) -> dict[str, User]:
+        users = self.inner.get_users_by_ids(user_ids)
+        return {user_id: self._remember_user(user) for user_id, user in users.items()}
+
+    def create_user(self, phone_number: str) -> User:
+        return self._remember_user(self.inner.create_user(phone_number))
+
+    def update_user(self, user_id: str, fields: dict) -> User:
+        user = self._users.get(user_id) or self.get_users_by_ids([user_id])[user_id]
+        self._record("update_user", {"user_id": user_id, "fields": fields})
+        user = _with_fields(user, fields)
+        self._users[user_id] = user
+        return user
+
+    # Conversation state
+    def get_state(self, user_id: str) -> dict | None:
+        for entry in reversed(self._pending_entries("upsert_state", "clear_state")):
+            if entry["args"]["user_id"] == user_id:
+                return _state(entry)
+        try:
+            state = self.inner.get_state(user_id)
+        except Exception as exc:
+            if user_id not in self._states:
+                raise
+            logger.warning("Storage unavailable, serving cached state: %s", exc)
+            return self._states[user_id]
+        self._states[user_id] = state
+        return state
+
+    def upsert_state(self, user_id: str, phone_number: str, context: str | None, context_data: dict) -> dict:
+        entry = self._record(
+            "upsert_state",
+            {"user_id": user_id, "phone_number": phone_number, "context": context, "context_data": context_data},
+        )
+        self._states[user_id] = _state(entry)
+        return {"user_id": user_id, **self._states[user_id]}
+
+    def clear_state(self, user_id: str) -> None:
+        self._record("clear_state", {"user_id": user_id})
+        self._states[user_id] = None
+
+    # Pomodoro
+    def start_pomodoro_cycle(
+        self,
+        user_id: str,
+        started_at: datetime,
+        work_minutes: int,
+        break_minutes: int,
+        cycle_id: str | None = None,
+    ) -> PomodoroCycle:
+        entry = self._record(
+            "start_pomodoro_cycle",
+            {
+                "id": cycle_id or str(uuid.uuid4()),
+                "user_id": user_id,
+                "started_at": started_at.isoformat(),
+                "work_minutes": work_minutes,
+                "break_minutes": break_minutes,
+            },
+        )
+        return _cycle(entry)
+
+    def log_pomodoro_cycle(
+        self,
+        user_id: str,
+        started_at: datetime,
+        stopped_at: datetime,
+        summary: str | None = None,
+        cycle_id: str | None = None,
+    ) -> PomodoroCycle:
+        entry = self._record(
+            "log_pomodoro_cycle",
+            {
+                "id": cycle_id or str(uuid.uuid4()),
+                "user_id": user_id,
+                "started_at": started_at.isoformat(),
+                "stopped_at": stopped_at.isoformat(),
+                "summary": summary,
+            },
+        )
+        return _cycle(entry)
+
+    def stop_pomodoro_cycles(self, user_id: str, stopped_at: datetime) -> list[PomodoroCycle]:
+        at = stopped_at.isoformat()
+        running = [cycle for cycle in self.iter_pomodoro_cycles(user_id, at, at) if cycle.stopped_at is None]
+        self._record("stop_pomodoro_cycles", {"user_id": user_id, "stopped_at": at})
+        return [dataclasses.replace(cycle, stopped_at=stopped_at) for cycle in running]
+
+    def set_pomodoro_summary(self, cycle_id: str, block: int, summary: str) -> None:
+        self._record("set_pomodoro_summary", {"cycle_id": cycle_id, "block": block, "summary": summary})
+
+    def iter_pomodoro_cycles(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[PomodoroCycle]:
+        pending = self._pending_entries(
+            "start_pomodoro_cycle", "log_pomodoro_cycle", "stop_pomodoro_cycles", "set_pomodoro_summary"
+        )
+        range_start, range_end = parse_ts(start_iso), parse_ts(end_iso)
+        seen = set()
+        for cycle in self.inner.iter_pomodoro_cycles(user_id, start_iso, end_iso, page_size):
+            seen.add(cycle.id)
+            yield _overlay_cycle(cycle, 0, pending)
+        for entry in pending:
+            args = entry["args"]
+            if entry["op"] not in {"start_pomodoro_cycle", "log_pomodoro_cycle"}:
+                continue
+            if args["user_id"] != user_id or args["id"] in seen:
+                continue
+            cycle = _overlay_cycle(_cycle(entry), entry["seq"], pending)
+            if cycle.started_at <= range_end and (cycle.stopped_at is None or cycle.stopped_at >= range_start):
+                yield cycle
+
+    def pomodoro_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_blocks: bool = False
+    ) -> PomodoroStats:
+        # The stats RPCs can't see journaled writes, so a user with some
+        # pending is aggregated here from the overlaid rows instead
+        ops = ("start_pomodoro_cycle", "log_pomodoro_cycle", "stop_pomodoro_cycles", "set_pomodoro_summary")
+        if not self._has_pending(user_id, *ops):
+            return self.inner.pomodoro_stats(user_id, start_iso, end_iso, with_blocks)
+        cycles = self.iter_pomodoro_cycles(user_id, start_iso, end_iso)
+        return PomodoroStats.from_cycles(cycles, parse_ts(start_iso), parse_ts(end_iso), with_blocks)
+
+    # Tasks
+    def insert_task(
+        self,
+        user_id: str,
+        title: str,
+        raw_message: str,
+        reminder_time: datetime | None,
+        task_id: str | None = None,
+        created_at: datetime | None = None,
+    ) -> Task:
+        entry = self._record(
+            "insert_task",
+            {
+                "id": task_id or str(uuid.uuid4()),
+                "user_id": user_id,
+                "title": title,
+                "raw_message": raw_message,
+                "reminder_time": reminder_time.isoformat() if reminder_time else None,
+                "created_at": (created_at or datetime.now(timezone.utc)).isoformat(),
+            },
+        )
+        task = Task.from_row(entry["args"])
+        self._tasks[task.id] = (user_id, task)
+        return task
+
+    def complete_task(self, task_id: str, completed_at: datetime | None = None) -> Task:
+        if task_id not in self._tasks:
+            # Never seen here, so there is nothing to answer with locally
+            return self.inner.complete_task(task_id, completed_at)
+        user_id, task = self._tasks[task_id]
+        completed_at = completed_at or datetime.now(timezone.utc)
+        self._record(
+            "complete_task", {"task_id": task_id, "user_id": user_id, "completed_at": completed_at.isoformat()}
+        )
+        task = dataclasses.replace(task, completed=True, completed_at=completed_at)
+        self._tasks[task_id] = (user_id, task)
+        return task
+
+    def _pending_tasks(self, user_id: str) -> tuple[list[Task], dict[str, datetime]]:
+        inserted, completed = [], {}
+        for entry in self._pending_entries("insert_task", "complete_task"):
+            args = entry["args"]
+            if args["user_id"] != user_id:
+                continue
+            if entry["op"] == "insert_task":
+                inserted.append(Task.from_row(args))
+            else:
+                completed[args["task_id"]] = parse_ts(args["completed_at"])
+        return inserted, completed
+
+    def iter_incomplete_tasks(self, user_id: str, page_size: int | None = None) -> Iterator[Task]:
+        inserted, completed = self._pending_tasks(user_id)
+        seen = set()
+        for task in self.inner.iter_incomplete_tasks(user_id, page_size):
+            seen.add(task.id)
+            self._tasks[task.id] = (user_id, task)
+            if task.id not in completed:
+                yield task
+        for task in inserted:
+            if task.id not in seen and task.id not in completed:
+                yield task
+
+    def iter_tasks_created(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]:
+        inserted, completed = self._pending_tasks(user_id)
+        seen = set()
+        for task in self.inner.iter_tasks_created(user_id, start_iso, end_iso, page_size):
+            seen.add(task.id)
+            yield _completed(task, completed)
+        range_start, range_end = parse_ts(start_iso), parse_ts(end_iso)
+        for task in inserted:
+            if task.id not in seen and range_start <= task.created_at <= range_end:
+                yield _completed(task, completed)
+
+    def iter_tasks_completed(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]:
+        _, completed = self._pending_tasks(user_id)
+        seen = set()
+        for task in self.inner.iter_tasks_completed(user_id, start_iso, end_iso, page_size):
+            seen.add(task.id)
+            yield task
+        range_start, range_end = parse_ts(start_iso), parse_ts(end_iso)
+        for task_id, completed_at in completed.items():
+            if task_id in seen or task_id not in self._tasks or not range_start <= completed_at <= range_end:
+                continue
+            yield _completed(self._tasks[task_id][1], completed)
+
+    def task_stats(self, user_id: str, start_iso: str, end_iso: str) -> TaskStats:
+        if not self._has_pending(user_id, "insert_task", "complete_task"):
+            return self.inner.task_stats(user_id, start_iso, end_iso)
+        return TaskStats(
+            created=list(self.iter_tasks_created(user_id, start_iso, end_iso)),
+            completed=list(self.iter_tasks_completed(user_id, start_iso, end_iso)),
+        )
+
+    # Calories
+    def insert_calorie_log(
+        self,
+        user_id: str,
+        meal_description: str,
+        calories: int | None,
+        protein_g: float | None,
+        carbs_g: float | None,
+        fat_g: float | None,
+        fiber_g: float | None,
+        confirmed: bool,
+        image_url: str | None = None,
+        log_id: str | None = None,
+        logged_at: datetime | None = None,
+    ) -> CalorieLog:
+        entry = self._record(
+            "insert_calorie_log",
+            {
+                "id": log_id or str(uuid.uuid4()),
+                "user_id": user_id,
+                "meal_description": meal_description,
+                "calories": calories,
+                "protein_g": protein_g,
+                "carbs_g": carbs_g,
+                "fat_g": fat_g,
+                "fiber_g": fiber_g,
+                "confirmed": confirmed,
+                "image_url": image_url,
+                "logged_at": (logged_at or datetime.now(timezone.utc)).isoformat(),
+            },
+        )
+        return CalorieLog.from_row(entry["args"])
+
+    def iter_calorie_logs(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[CalorieLog]:
+        pending = [
+            entry["args"] for entry in self._pending_entries("insert_calorie_log") if entry["args"]["user_id"] == user_id
+        ]
+        seen = set()
+        for log in self.inner.iter_calorie_logs(user_id, start_iso, end_iso, page_size):
+            seen.add(log.id)
+            yield log
+        range_start, range_end = parse_ts(start_iso), parse_ts(end_iso)
+        for args in pending:
+            log = CalorieLog.from_row(args)
+            if log.id not in seen and range_start <= log.logged_at <= range_end:
+                yield log
+
+    def calorie_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_meals: bool = False
+    ) -> CalorieStats:
+        if not self._has_pending(user_id, "insert_calorie_log"):
+            return self.inner.calorie_stats(user_id, start_iso, end_iso, with_meals)
+        return CalorieStats.from_logs(self.iter_calorie_logs(user_id, start_iso, end_iso), with_meals)
+
+    # Daily rollups
+    def daily_rollups(self, user_id: str, start_day: date, end_day: date) -> dict[date, DailyRollup]:
+        # The rollup triggers only see replayed writes, so like the stats these
+        # are computed from the overlaid rows while a user has some pending
+        ops = ("log_pomodoro_cycle", "stop_pomodoro_cycles", "insert_task", "complete_task", "insert_calorie_log")
+        if not self._has_pending(user_id, *ops, "update_user"):
+            return self.inner.daily_rollups(user_id, start_day, end_day)
+        user = self._users.get(user_id) or self.get_users_by_ids([user_id])[user_id]
+        start_iso, end_iso = days_range_utc(start_day, end_day, user.timezone)
+        days = DailyRollup.from_activity(
+            ZoneInfo(user.timezone),
+            self.iter_pomodoro_cycles(user_id, start_iso, end_iso),
+            self.iter_tasks_created(user_id, start_iso, end_iso),
+            self.iter_tasks_completed(user_id, start_iso, end_iso),
+            self.iter_calorie_logs(user_id, start_iso, end_iso),
+        )
+        return {day: rollup for day, rollup in days.items() if start_day <= day <= end_day}
+
+
+def _with_fields(user: User, fields: dict) -> User:
+    names = {field.name for field in dataclasses.fields(User)}
+    return dataclasses.replace(user, **{key: value for key, value in fields.items() if key in names})
+
+
+def _state(entry: dict) -> dict | None:
+    if entry["op"] == "clear_state":
+        return None
+    return {"current_context": entry["args"]["context"], "context_data": entry["args"]["context_data"]}
+
+
+def _cycle(entry: dict) -> PomodoroCycle:
+    args = entry["args"]
+    if entry["op"] == "log_pomodoro_cycle":
+        started_at, stopped_at = parse_ts(args["started_at"]), parse_ts(args["stopped_at"])
+        return PomodoroCycle(
+            id=args["id"],
+            user_id=args["user_id"],
+            started_at=started_at,
+            work_minutes=int((stopped_at - started_at).total_seconds() / 60),
+            stopped_at=stopped_at,
+            summaries={"0": args["summary"]} if args["summary"] else {},
+        )
+    return PomodoroCycle(
+        id=args["id"],
+        user_id=args["user_id"],
+        started_at=parse_ts(args["started_at"]),
+        work_minutes=args["work_minutes"],
+        break_minutes=args["break_minutes"],
+    )
+
+
+def _overlay_cycle(cycle: PomodoroCycle, created_seq: int, pending: list[dict]) -> PomodoroCycle:
+    # Writes queued after the cycle was created: stops and block summaries
+    for entry in pending:
+        args = entry["args"]
+        if entry["seq"] <= created_seq:
+            continue
+        if entry["op"] == "stop_pomodoro_cycles" and args["user_id"] == cycle.user_id and cycle.stopped_at is None:
+            stopped_at = parse_ts(args["stopped_at"])
+            if stopped_at >= cycle.started_at:
+                cycle = dataclasses.replace(cycle, stopped_at=stopped_at)
+        elif entry["op"] == "set_pomodoro_summary" and args["cycle_id"] == cycle.id:
+            cycle = dataclasses.replace(cycle, summaries={**cycle.summaries, str(args["block"]): args["summary"]})
+    return cycle
+
+
+def _completed(task: Task, completed: dict[str, datetime]) -> Task:
+    if task.id in completed and not task.completed:
+        return dataclasses.replace(task, completed=True, completed_at=completed[task.id])
+    return task
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _is_permanent(exc: Exception) -> bool:
+    if isinstance(exc, RowNotFound):
+        # The row is gone (or its insert was rejected); replaying won't bring it back
+        return True
+    if isinstance(exc, (httpx.TransportError, OSError, TimeoutError)):
+        return False
+    if isinstance(exc, (ValueError, TypeError, KeyError)):
+        return True
+    sqlstate = str(getattr(exc, "sqlstate", None) or getattr(exc, "code", None) or "")
+    return sqlstate[:2] in PERMANENT_SQLSTATE_CLASSES
+
+
+def create_journaled_storage(inner: StorageBackend) -> StorageBackend:
+    if not settings.JOURNAL_DIR:
+        return inner
+    return JournaledStorage(inner, WriteJournal(settings.JOURNAL_DIR))
+
+
+async def wait_for_journal(storage: StorageBackend) -> None:
+    # Writes made on the event loop are acknowledged only once on disk
+    if isinstance(storage, JournaledStorage):
+        await storage.journal.await_synced()
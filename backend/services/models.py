@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, tzinfo
+from typing import Any, ClassVar, Iterable, Mapping
+
+from utils.pomodoro_cycles import work_blocks
+from utils.time_utils import parse_ts
+
+# Rows are converted here, once, as they come out of storage: ids become
+# strings and timestamps datetimes, whichever backend produced them. COLUMNS
+# is the projection each query selects, shared by PostgREST and SQL.
+
+# Tables partitioned by month, and the column each is partitioned on. The
+# column is part of the table's primary key.
+PARTITION_KEYS = {
+    "pomodoro_cycles": "started_at",
+    "tasks": "created_at",
+    "calorie_logs": "logged_at",
+}
+
+
+def _id(value: Any) -> str | None:
+    return str(value) if value is not None else None
+
+
+@dataclass(slots=True)
+class User:
+    COLUMNS: ClassVar[str] = (
+        "id,phone_number,name,timezone,onboarding_complete,onboarding_step,features_enabled,"
+        "default_work_minutes,default_break_minutes,daily_calorie_goal,dietary_preferences,data_version,created_at"
+    )
+
+    id: str
+    phone_number: str
+    name: str | None = None
+    timezone: str = "UTC"
+    onboarding_complete: bool = False
+    onboarding_step: str | None = None
+    features_enabled: list[str] = field(default_factory=list)
+    default_work_minutes: int = 25
+    default_break_minutes: int = 5
+    daily_calorie_goal: int | None = None
+    dietary_preferences: str | None = None
+    # Bumped by the database on every write the dashboard shows
+    data_version: int = 0
+    created_at: datetime | None = None
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> User:
+        return cls(
+            id=_id(row["id"]),
+            phone_number=row["phone_number"],
+            name=row.get("name"),
+            timezone=row.get("timezone") or "UTC",
+            onboarding_complete=bool(row.get("onboarding_complete")),
+            onboarding_step=row.get("onboarding_step"),
+            features_enabled=list(row.get("features_enabled") or []),
+            default_work_minutes=row.get("default_work_minutes") or 25,
+            # 0 is a valid choice (no breaks); only a missing value means 5
+            default_break_minutes=5 if row.get("default_break_minutes") is None else row["default_break_minutes"],
+            daily_calorie_goal=row.get("daily_calorie_goal"),
+            dietary_preferences=row.get("dietary_preferences"),
+            data_version=row.get("data_version") or 0,
+            created_at=parse_ts(row.get("created_at")),
+        )
+
+
+@dataclass(slots=True)
+class PomodoroCycle:
+    COLUMNS: ClassVar[str] = "id,user_id,started_at,work_minutes,break_minutes,stopped_at,summaries"
+
+    id: str
+    user_id: str
+    started_at: datetime
+    work_minutes: int
+    break_minutes: int = 0
+    stopped_at: datetime | None = None
+    summaries: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> PomodoroCycle:
+        return cls(
+            id=_id(row["id"]),
+            user_id=_id(row["user_id"]),
+            started_at=parse_ts(row["started_at"]),
+            work_minutes=row.get("work_minutes") or 0,
+            break_minutes=row.get("break_minutes") or 0,
+            stopped_at=parse_ts(row.get("stopped_at")),
+            summaries=row.get("summaries") or {},
+        )
+
+
+@dataclass(slots=True)
+class Task:
+    COLUMNS: ClassVar[str] = "id,title,reminder_time,completed,completed_at,created_at"
+
+    id: str
+    title: str
+    reminder_time: datetime | None = None
+    completed: bool = False
+    completed_at: datetime | None = None
+    created_at: datetime | None = None
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> Task:
+        return cls(
+            id=_id(row["id"]),
+            title=row.get("title") or "",
+            reminder_time=parse_ts(row.get("reminder_time")),
+            completed=bool(row.get("completed")),
+            completed_at=parse_ts(row.get("completed_at")),
+            created_at=parse_ts(row.get("created_at")),
+        )
+
+
+@dataclass(slots=True)
+class CalorieLog:
+    COLUMNS: ClassVar[str] = "id,meal_description,calories,protein_g,carbs_g,fat_g,logged_at"
+
+    id: str
+    meal_description: str | None = None
+    calories: int | None = None
+    protein_g: float | None = None
+    carbs_g: float | None = None
+    fat_g: float | None = None
+    logged_at: datetime | None = None
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> CalorieLog:
+        return cls(
+            id=_id(row["id"]),
+            meal_description=row.get("meal_description"),
+            calories=row.get("calories"),
+            protein_g=row.get("protein_g"),
+            carbs_g=row.get("carbs_g"),
+            fat_g=row.get("fat_g"),
+            logged_at=parse_ts(row.get("logged_at")),
+        )
+
+
+# Aggregates for a user and time range, as returned by the *_stats RPCs. The
+# from_* constructors compute the same thing from rows in hand (rows still in
+# the write journal or the archive); merge adds two disjoint sets together.
+
+
+@dataclass(slots=True)
+class PomodoroStats:
+    total_minutes: int = 0
+    block_count: int = 0
+    summaries: list[str] = field(default_factory=list)
+    # Only when asked for: each work block as {start, minutes, summary}
+    blocks: list[dict[str, Any]] | None = None
+    # A cycle in the range is still going, so the totals grow with time
+    running: bool = False
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> PomodoroStats:
+        blocks = row.get("blocks")
+        if blocks is not None:
+            blocks = [
+                {"start": parse_ts(block["start"]), "minutes": block["minutes"], "summary": block.get("summary")}
+                for block in blocks
+            ]
+        return cls(
+            total_minutes=row.get("total_minutes") or 0,
+            block_count=row.get("block_count") or 0,
+            summaries=list(row.get("summaries") or []),
+            blocks=blocks,
+            running=bool(row.get("running")),
+        )
+
+    @classmethod
+    def from_cycles(
+        cls,
+        cycles: Iterable[PomodoroCycle],
+        range_start: datetime,
+        range_end: datetime,
+        with_blocks: bool = False,
+    ) -> PomodoroStats:
+        cycles = list(cycles)
+        blocks = sorted(
+            (block for cycle in cycles for block in work_blocks(cycle, range_start, range_end)),
+            key=lambda block: block["start"],
+        )
+        return cls(
+            total_minutes=sum(block["minutes"] for block in blocks),
+            block_count=len(blocks),
+            summaries=[block["summary"] for block in blocks if block["summary"]],
+            blocks=[
+                {"start": block["start"], "minutes": block["minutes"], "summary": block["summary"]}
+                for block in blocks
+            ]
+            if with_blocks
+            else None,
+            running=any(cycle.stopped_at is None for cycle in cycles),
+        )
+
+    def merge(self, other: PomodoroStats) -> PomodoroStats:
+        blocks = None
+        if self.blocks is not None or other.blocks is not None:
+            blocks = sorted((self.blocks or []) + (other.blocks or []), key=lambda block: block["start"])
+        return PomodoroStats(
+            total_minutes=self.total_minutes + other.total_minutes,
+            block_count=self.block_count + other.block_count,
+            summaries=self.summaries + other.summaries,
+            blocks=blocks,
+            running=self.running or other.running,
+        )
+
+
+@dataclass(slots=True)
+class CalorieStats:
+    meal_count: int = 0
+    calories: int = 0
+    protein_g: float = 0.0
+    carbs_g: float = 0.0
+    fat_g: float = 0.0
+    # Only when asked for: each meal as {description, calories, protein_g,
+    # carbs_g, fat_g, logged_at}, oldest first
+    meals: list[dict[str, Any]] | None = None
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> CalorieStats:
+        meals = row.get("meals")
+        if meals is not None:
+            meals = [{**meal, "logged_at": parse_ts(meal.get("logged_at"))} for meal in meals]
+        return cls(
+            meal_count=row.get("meal_count") or 0,
+            calories=row.get("calories") or 0,
+            protein_g=float(row.get("protein_g") or 0),
+            carbs_g=float(row.get("carbs_g") or 0),
+            fat_g=float(row.get("fat_g") or 0),
+            meals=meals,
+        )
+
+    @classmethod
+    def from_logs(cls, logs: Iterable[CalorieLog], with_meals: bool = False) -> CalorieStats:
+        stats = cls(meals=[] if with_meals else None)
+        for log in logs:
+            stats.meal_count += 1
+            stats.calories += log.calories or 0
+            stats.protein_g += log.protein_g or 0
+            stats.carbs_g += log.carbs_g or 0
+            stats.fat_g += log.fat_g or 0
+            if with_meals:
+                stats.meals.append(
+                    {
+                        "description": log.meal_description,
+                        "calories": log.calories or 0,
+                        "protein_g": log.protein_g,
+                        "carbs_g": log.carbs_g,
+                        "fat_g": log.fat_g,
+                        "logged_at": log.logged_at,
+                    }
+                )
+        return stats
+
+    def merge(self, other: CalorieStats) -> CalorieStats:
+        meals = None
+        if self.meals is not None or other.meals is not None:
+            meals = (self.meals or []) + (other.meals or [])
+        return CalorieStats(
+            meal_count=self.meal_count + other.meal_count,
+            calories=self.calories + other.calories,
+            protein_g=self.protein_g + other.protein_g,
+            carbs_g=self.carbs_g + other.carbs_g,
+            fat_g=self.fat_g + other.fat_g,
+            meals=meals,
+        )
+
+
+@dataclass(slots=True)
+class TaskStats:
+    created: list[Task] = field(default_factory=list)
+    completed: list[Task] = field(default_factory=list)
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> TaskStats:
+        return cls(
+            created=[Task.from_row(task) for task in row.get("created") or []],
+            completed=[Task.from_row(task) for task in row.get("completed") or []],
+        )
+
+    def merge(self, other: TaskStats) -> TaskStats:
+        return TaskStats(created=self.created + other.created, completed=self.completed + other.completed)
+
+
+# One user's totals for one local day, from the daily_rollups table (one row
+# per metric there). from_activity computes the same from rows in hand.
+@dataclass(slots=True)
+class DailyRollup:
+    METRICS: ClassVar[tuple[str, ...]] = (
+        "focus_minutes",
+        "focus_sessions",
+        "tasks_created",
+        "tasks_completed",
+        "meals",
+        "calories",
+        "protein_g",
+        "carbs_g",
+        "fat_g",
+    )
+
+    day: date
+    focus_minutes: int = 0
+    focus_sessions: int = 0
+    tasks_created: int = 0
+    tasks_completed: int = 0
+    meals: int = 0
+    calories: int = 0
+    protein_g: float = 0.0
+    carbs_g: float = 0.0
+    fat_g: float = 0.0
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]]) -> dict[date, DailyRollup]:
+        days: dict[date, DailyRollup] = {}
+        for row in rows:
+            day = row["day"] if isinstance(row["day"], date) else date.fromisoformat(row["day"])
+            rollup = days.get(day) or days.setdefault(day, cls(day))
+            metric = row["metric"]
+            if metric in {"protein_g", "carbs_g", "fat_g"}:
+                setattr(rollup, metric, float(row["value"]))
+            elif metric in cls.METRICS:
+                setattr(rollup, metric, int(row["value"]))
+        return days
+
+    @classmethod
+    def from_activity(
+        cls,
+        tz: tzinfo,
+        cycles: Iterable[PomodoroCycle],
+        created: Iterable[Task],
+        completed: Iterable[Task],
+        logs: Iterable[CalorieLog],
+    ) -> dict[date, DailyRollup]:
+        # Same attribution as the rollup triggers: stopped cycles only, each
+        # work block on the day it starts
+        days: dict[date, DailyRollup] = {}
+
+        def on(at: datetime) -> DailyRollup:
+            day = at.astimezone(tz).date()
+            return days.get(day) or days.setdefault(day, cls(day))
+
+        for cycle in cycles:
+            if cycle.stopped_at is None:
+                continue
+            for block in work_blocks(cycle):
+                rollup = on(block["start"])
+                rollup.focus_minutes += block["minutes"]
+                rollup.focus_sessions += 1
+        for task in created:
+            if task.created_at:
+                on(task.created_at).tasks_created += 1
+        for task in completed:
+            if task.completed and task.completed_at:
+                on(task.completed_at).tasks_completed += 1
+        for log in logs:
+            if log.logged_at:
+                rollup = on(log.logged_at)
+                rollup.meals += 1
+                rollup.calories += log.calories or 0
+                rollup.protein_g += log.protein_g or 0
+                rollup.carbs_g += log.carbs_g or 0
+                rollup.fat_g += log.fat_g or 0
+        return days
@@ -6,6 +6,7 @@ from pathlib import Path
 from typing import Any
 
 import dateparser
+import httpx
 from openai import OpenAI
 
 from config import settings
@@ -14,8 +15,8 @@ PROMPT_DIR = Path(__file__).resolve().parents[1] / "prompts"
 
 
 class OpenAIService:
-    def __init__(self) -> None:
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, http_client: httpx.Client | None = None) -> None:
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client)
 
     def _load_prompt(self, filename: str) -> str:
         return (PROMPT_DIR / filename).read_text()
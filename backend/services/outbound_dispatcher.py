@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+import httpx
+
+from config import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TWILIO_API_BASE = "https://api.twilio.com/2010-04-01"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class OutboundSendError(RuntimeError):
+    def __init__(self, message: str, retryable: bool = True) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class Priority(IntEnum):
+    URGENT = 0  # pomodoro transitions
+    NORMAL = 1  # task reminders
+    LOW = 2  # nudges
+
+
+def _format_whatsapp(phone_number: str) -> str:
+    if phone_number.startswith("whatsapp:"):
+        return phone_number
+    return f"whatsapp:{phone_number}"
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: int) -> None:
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class OutboundMessage:
+    to: str
+    body: str
+    sender: str
+    media_url: str | None = None
+    priority: Priority = Priority.NORMAL
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: asyncio.Future | None = None
+
+
+@dataclass
+class _PendingBatch:
+    messages: list[OutboundMessage]
+    deadline: float
+    handle: asyncio.TimerHandle
+
+
+class OutboundDispatcher:
+    def __init__(self, workers: int | None = None, client: httpx.AsyncClient | None = None) -> None:
+        self.workers = workers or settings.OUTBOUND_WORKERS
+        self.queue: asyncio.PriorityQueue[tuple[int, int, OutboundMessage]] = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._pending: dict[str, _PendingBatch] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._client = client
+        self._owns_client = client is None
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        if self._owns_client:
+            self._client = httpx.AsyncClient(
+                base_url=TWILIO_API_BASE,
+                auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+                limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers),
+            )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for key in list(self._pending):
+            self._flush(key)
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=settings.OUTBOUND_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning("Dropping %d queued outbound messages on shutdown", self.queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+
+    def enqueue(
+        self,
+        phone_number: str,
+        body: str,
+        media_url: str | None = None,
+        sender: str | None = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        # Callers may fire and forget; failures are logged by the worker
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        message = OutboundMessage(
+            to=_format_whatsapp(phone_number),
+            body=body,
+            sender=_format_whatsapp(sender or settings.TWILIO_WHATSAPP_NUMBER),
+            media_url=media_url,
+            priority=priority,
+            future=future,
+        )
+        if media_url or settings.OUTBOUND_COALESCE_SECONDS <= 0:
+            self._put(message)
+        else:
+            self._coalesce(message)
+        return future
+
+    def _put(self, message: OutboundMessage) -> None:
+        self.queue.put_nowait((int(message.priority), next(self._sequence), message))
+        metrics.set_gauge("outbound_queue_depth", self.queue.qsize())
+
+    def _coalesce(self, message: OutboundMessage) -> None:
+        # Hold messages per recipient for a short window so bursts go out as one.
+        # Urgent messages cap the window so transitions are never late by much.
+        loop = asyncio.get_running_loop()
+        if message.priority == Priority.URGENT:
+            delay = min(settings.OUTBOUND_COALESCE_SECONDS, settings.OUTBOUND_URGENT_MAX_DELAY_SECONDS)
+        else:
+            delay = settings.OUTBOUND_COALESCE_SECONDS
+        deadline = loop.time() + delay
+        key = f"{message.sender}|{message.to}"
+        batch = self._pending.get(key)
+        if batch is None:
+            handle = loop.call_at(deadline, self._flush, key)
+            self._pending[key] = _PendingBatch([message], deadline, handle)
+            return
+        batch.messages.append(message)
+        if deadline < batch.deadline:
+            batch.handle.cancel()
+            batch.deadline = deadline
+            batch.handle = loop.call_at(deadline, self._flush, key)
+
+    def _flush(self, key: str) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.handle.cancel()
+        messages = sorted(batch.messages, key=lambda item: (item.priority, item.enqueued_at))
+        if len(messages) == 1:
+            self._put(messages[0])
+            return
+        merged = OutboundMessage(
+            to=messages[0].to,
+            body="\n\n".join(item.body for item in messages),
+            sender=messages[0].sender,
+            priority=messages[0].priority,
+            enqueued_at=min(item.enqueued_at for item in messages),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        merged.future.add_done_callback(lambda done: _resolve_all(done, messages))
+        metrics.inc("outbound_messages_saved_total", len(messages) - 1)
+        self._put(merged)
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, message = await self.queue.get()
+            metrics.set_gauge("outbound_queue_depth", self.queue.qsize())
+            metrics.observe("outbound_queue_lag_ms", (time.monotonic() - message.enqueued_at) * 1000)
+            try:
+                sid = await self._deliver(message)
+            except Exception as exc:
+                metrics.inc("outbound_failed_total")
+                logger.warning("Outbound message to %s failed: %s", message.to, exc)
+                if message.future and not message.future.done():
+                    message.future.set_exception(exc)
+            else:
+                metrics.inc("outbound_sent_total")
+                if message.future and not message.future.done():
+                    message.future.set_result(sid)
+            finally:
+                self.queue.task_done()
+
+    def _bucket(self, sender: str) -> TokenBucket:
+        bucket = self._buckets.get(sender)
+        if bucket is None:
+            bucket = self._buckets[sender] = TokenBucket(
+                settings.OUTBOUND_RATE_PER_SECOND, settings.OUTBOUND_BURST
+            )
+        return bucket
+
+    async def _deliver(self, message: OutboundMessage) -> str:
+        if not self._client:
+            raise OutboundSendError("Dispatcher is not started")
+        payload = {"From": message.sender, "To": message.to, "Body": message.body}
+        if message.media_url:
+            payload["MediaUrl"] = message.media_url
+        path = f"/Accounts/{settings.TWILIO_ACCOUNT_SID}/Messages.json"
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            await self._bucket(message.sender).acquire()
+            retry_after = None
+            try:
+                resp = await self._client.post(path, data=payload, timeout=settings.OUTBOUND_TIMEOUT_SECONDS)
+            except httpx.TransportError as exc:
+                error: Exception = exc
+                status = "transport"
+            else:
+                if resp.status_code < 300:
+                    metrics.observe("outbound_send_latency_ms", (time.monotonic() - started) * 1000)
+                    return resp.json().get("sid", "")
+                if resp.status_code not in RETRYABLE_STATUS:
+                    raise OutboundSendError(
+                        f"Twilio returned {resp.status_code}: {resp.text[:200]}", retryable=False
+                    )
+                error = OutboundSendError(f"Twilio returned {resp.status_code}")
+                status = str(resp.status_code)
+                retry_after = resp.headers.get("Retry-After")
+            if attempt >= settings.OUTBOUND_MAX_RETRIES:
+                raise error
+            metrics.inc("outbound_retries_total", labels={"status": status})
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+    def _backoff(self, attempt: int, retry_after: str | None) -> float:
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), _max_backoff())
+            except ValueError:
+                pass
+        delay = settings.OUTBOUND_BACKOFF_SECONDS * (2**attempt)
+        return min(delay + random.uniform(0, delay / 2), _max_backoff())
+
+
+def _max_backoff() -> float:
+    # Every try and every wait between them has to fit inside one outbox
+    # lease, or the claim lapses mid-send and another worker sends it again
+    tries = settings.OUTBOUND_MAX_RETRIES + 1
+    budget = settings.OUTBOX_LEASE_SECONDS - tries * settings.OUTBOUND_TIMEOUT_SECONDS
+    return max(min(settings.OUTBOUND_MAX_BACKOFF_SECONDS, budget / max(tries - 1, 1)), 0.0)
+
+
+def _resolve_all(merged: asyncio.Future, messages: list[OutboundMessage]) -> None:
+    for message in messages:
+        if not message.future or message.future.done():
+            continue
+        if merged.cancelled():
+            message.future.cancel()
+        elif merged.exception():
+            message.future.set_exception(merged.exception())
+        else:
+            message.future.set_result(merged.result())
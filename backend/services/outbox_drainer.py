@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+
+from config import settings
+from services.change_feed import ChangeFeed, change_feed_available
+from services.outbound_dispatcher import OutboundDispatcher, OutboundSendError, Priority
+from services.storage import StorageBackend
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_CHANNEL = "outbound_messages"
+RECORD_INTERVAL_SECONDS = 1.0
+
+
+class OutboxDrainer:
+    def __init__(self, supabase: StorageBackend, outbound: OutboundDispatcher) -> None:
+        self.supabase = supabase
+        self.outbound = outbound
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.change_feed: ChangeFeed | None = None
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task:
+            return
+        if change_feed_available(settings.DATABASE_URL):
+            self.change_feed = ChangeFeed(
+                settings.DATABASE_URL,
+                lambda _change: self._wake.set(),
+                self._wake.set,
+                channel=OUTBOX_CHANNEL,
+            )
+            self.change_feed.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.change_feed:
+            await self.change_feed.stop()
+            self.change_feed = None
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                drained = await self.drain_once()
+            except Exception:
+                logger.exception("Outbox drain failed")
+                metrics.inc("outbox_errors_total")
+                drained = 0
+            if drained >= settings.OUTBOX_BATCH_SIZE:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain_once(self) -> int:
+        now = datetime.now(timezone.utc)
+        batch = self.supabase.claim_outbound_messages(
+            self.worker_id, settings.OUTBOX_BATCH_SIZE, settings.OUTBOX_LEASE_SECONDS, now
+        )
+        if not batch:
+            return 0
+        in_flight = {
+            self.outbound.enqueue(
+                message["phone_number"],
+                message["body"],
+                media_url=message.get("media_url"),
+                priority=Priority(message.get("priority") or Priority.NORMAL),
+            ): message
+            for message in batch
+        }
+        # Results are recorded as sends finish, so a slow recipient can't hold
+        # the rest of the batch past its lease; the lease is renewed for
+        # whatever is still in flight
+        renew_at = time.monotonic() + settings.OUTBOX_LEASE_SECONDS / 3
+        pending = set(in_flight)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=RECORD_INTERVAL_SECONDS)
+            if done:
+                self._record([_result(in_flight[future], future) for future in done])
+            if pending and time.monotonic() >= renew_at:
+                self._extend([in_flight[future]["id"] for future in pending])
+                renew_at = time.monotonic() + settings.OUTBOX_LEASE_SECONDS / 3
+        return len(batch)
+
+    def _record(self, results: list[dict]) -> None:
+        self.supabase.record_outbound_results(
+            self.worker_id,
+            results,
+            settings.OUTBOX_MAX_ATTEMPTS,
+            settings.OUTBOX_RETRY_SECONDS,
+        )
+        sent = sum(1 for result in results if "error" not in result)
+        metrics.inc("outbox_delivered_total", sent)
+        metrics.inc("outbox_failed_attempts_total", len(results) - sent)
+
+    def _extend(self, message_ids: list[str]) -> None:
+        held = self.supabase.extend_outbound_claims(
+            self.worker_id, message_ids, settings.OUTBOX_LEASE_SECONDS, datetime.now(timezone.utc)
+        )
+        if held < len(message_ids):
+            # Another worker reclaimed them; its results win and ours are dropped
+            logger.warning("Outbox lease lost for %d of %d messages", len(message_ids) - held, len(message_ids))
+            metrics.inc("outbox_leases_lost_total", len(message_ids) - held)
+
+
+def _result(message: dict, future: asyncio.Future) -> dict:
+    if future.cancelled():
+        return {"id": message["id"], "error": "Send cancelled", "retryable": True}
+    outcome = future.exception()
+    if outcome is None:
+        return {"id": message["id"], "provider_sid": future.result()}
+    retryable = outcome.retryable if isinstance(outcome, OutboundSendError) else True
+    return {"id": message["id"], "error": str(outcome)[:500], "retryable": retryable}
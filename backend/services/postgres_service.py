@@ -0,0 +1,595 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Coroutine, Iterator, TypeVar
+
+try:
+    import asyncpg  # type: ignore
+except Exception:  # pragma: no cover
+    asyncpg = None
+
+from config import settings
+from services.models import (
+    PARTITION_KEYS,
+    CalorieLog,
+    CalorieStats,
+    DailyRollup,
+    PomodoroCycle,
+    PomodoroStats,
+    Task,
+    TaskStats,
+    User,
+)
+from services.storage import RowNotFound
+from utils.time_utils import parse_ts
+
+T = TypeVar("T")
+
+
+def _on_conflict_id(table: str) -> str:
+    # Re-inserting a client-generated id leaves the row as it is; the no-op
+    # update (rather than DO NOTHING) makes RETURNING hand back the existing
+    # row. Partitioned tables are unique on (id, partition key).
+    return f"ON CONFLICT (id, {PARTITION_KEYS[table]}) DO UPDATE SET id = EXCLUDED.id"
+
+
+USER_COLUMNS = {
+    "name",
+    "timezone",
+    "onboarding_complete",
+    "onboarding_step",
+    "features_enabled",
+    "default_work_minutes",
+    "default_break_minutes",
+    "daily_calorie_goal",
+    "dietary_preferences",
+}
+
+
+async def _init_connection(conn) -> None:
+    # Binary jsonb codec (version byte + text) so COPY works on jsonb columns too
+    await conn.set_type_codec(
+        "jsonb",
+        schema="pg_catalog",
+        encoder=lambda value: b"\x01" + json.dumps(value).encode("utf-8"),
+        decoder=lambda data: json.loads(data[1:].decode("utf-8")),
+        format="binary",
+    )
+
+
+class PostgresService:
+    def __init__(self, dsn: str | None = None) -> None:
+        dsn = dsn or settings.DATABASE_URL
+        if not asyncpg:
+            raise RuntimeError("asyncpg is required for STORAGE_BACKEND=postgres")
+        if not dsn:
+            raise RuntimeError("DATABASE_URL is required for STORAGE_BACKEND=postgres")
+        self.query_count = 0
+        # The pool runs on its own loop so the synchronous storage API can be
+        # called from handlers and background loops alike
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="postgres-storage", daemon=True)
+        self._thread.start()
+        try:
+            self.pool = self._run(self._create_pool(dsn))
+        except Exception:
+            self._stop_loop()
+            raise
+
+    async def _create_pool(self, dsn: str):
+        return await asyncpg.create_pool(
+            dsn,
+            min_size=settings.DATABASE_POOL_MIN_SIZE,
+            max_size=settings.DATABASE_POOL_MAX_SIZE,
+            command_timeout=settings.DATABASE_COMMAND_TIMEOUT,
+            statement_cache_size=settings.DATABASE_STATEMENT_CACHE_SIZE,
+            init=_init_connection,
+        )
+
+    def _run(self, coro: Coroutine[Any, Any, T]) -> T:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self) -> None:
+        if self._loop.is_closed():
+            return
+        self._run(self.pool.close())
+        self._stop_loop()
+
+    def _stop_loop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+
+    # Statements go through the pool's per-connection prepared statement cache.
+    # With a model, records are converted straight into it; otherwise into
+    # PostgREST-shaped dicts.
+    def _fetch(self, sql: str, *args: Any, model: Any = None) -> list[Any]:
+        self.query_count += 1
+        convert = model.from_row if model else _row
+        return [convert(record) for record in self._run(self.pool.fetch(sql, *args))]
+
+    def _fetchrow(self, sql: str, *args: Any, model: Any = None) -> Any:
+        self.query_count += 1
+        record = self._run(self.pool.fetchrow(sql, *args))
+        if not record:
+            return None
+        return model.from_row(record) if model else _row(record)
+
+    def _fetchval(self, sql: str, *args: Any) -> Any:
+        self.query_count += 1
+        return self._run(self.pool.fetchval(sql, *args))
+
+    def _paginate(
+        self, sql: str, *args: Any, column: str, model: Any, page_size: int | None = None
+    ) -> Iterator[Any]:
+        # Keyset pagination on (column, id); sql has an {after} slot for the
+        # cursor condition and is completed with the ordering and page limit
+        page_size = page_size or settings.QUERY_PAGE_SIZE
+        cursor: tuple[Any, ...] = ()
+        after = f"AND ({column}, id) > (${len(args) + 1}, ${len(args) + 2})"
+        while True:
+            query = sql.format(after=after if cursor else "") + f" ORDER BY {column}, id LIMIT {page_size}"
+            rows = self._fetch(query, *args, *cursor, model=model)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            cursor = (getattr(rows[-1], column), rows[-1].id)
+
+    def bulk_insert(self, table: str, rows: list[dict]) -> int:
+        if not rows:
+            return 0
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        columns = list(rows[0])
+        records = [tuple(row.get(column) for column in columns) for row in rows]
+
+        async def copy() -> None:
+            async with self.pool.acquire() as conn:
+                await conn.copy_records_to_table(table, records=records, columns=columns)
+
+        self.query_count += 1
+        self._run(copy())
+        return len(rows)
+
+    def create_future_partitions(self, months_ahead: int) -> int:
+        return int(self._fetchval("SELECT create_future_partitions($1)", months_ahead) or 0)
+
+    # Users
+    def get_user_by_phone(self, phone_number: str) -> User | None:
+        return self._fetchrow(
+            f"SELECT {User.COLUMNS} FROM users WHERE phone_number = $1", phone_number, model=User
+        )
+
+    def get_users_by_ids(self, user_ids: list[str]) -> dict[str, User]:
+        ids = list(dict.fromkeys(user_ids))
+        if not ids:
+            return {}
+        data = self._fetch(f"SELECT {User.COLUMNS} FROM users WHERE id = ANY($1::UUID[])", ids, model=User)
+        return {user.id: user for user in data}
+
+    def create_user(self, phone_number: str) -> User:
+        return self._fetchrow(
+            f"INSERT INTO users (phone_number) VALUES ($1) RETURNING {User.COLUMNS}", phone_number, model=User
+        )
+
+    def update_user(self, user_id: str, fields: dict) -> User:
+        columns = [name for name in fields if name != "updated_at"]
+        unknown = set(columns) - USER_COLUMNS
+        if unknown:
+            raise ValueError(f"Unknown user columns: {', '.join(sorted(unknown))}")
+        assignments = [f"{name} = ${index}" for index, name in enumerate(columns, start=2)]
+        assignments.append("updated_at = NOW()")
+        user = self._fetchrow(
+            f"UPDATE users SET {', '.join(assignments)} WHERE id = $1 RETURNING {User.COLUMNS}",
+            user_id,
+            *(fields[name] for name in columns),
+            model=User,
+        )
+        if user is None:
+            raise RowNotFound(f"No user {user_id}")
+        return user
+
+    def get_or_create_user(self, phone_number: str) -> User:
+        async def get_or_create() -> asyncpg.Record:
+            # One connection checkout for the lookup and the (rare) insert
+            async with self.pool.acquire() as conn:
+                user = await conn.fetchrow(f"SELECT {User.COLUMNS} FROM users WHERE phone_number = $1", phone_number)
+                if user:
+                    return user
+                self.query_count += 1
+                user = await conn.fetchrow(
+                    f"INSERT INTO users (phone_number) VALUES ($1) ON CONFLICT (phone_number) DO NOTHING "
+                    f"RETURNING {User.COLUMNS}",
+                    phone_number,
+                )
+                if user:
+                    return user
+                self.query_count += 1
+                return await conn.fetchrow(f"SELECT {User.COLUMNS} FROM users WHERE phone_number = $1", phone_number)
+
+        self.query_count += 1
+        return User.from_row(self._run(get_or_create()))
+
+    def iter_user_ids(self, page_size: int | None = None) -> Iterator[str]:
+        page_size = page_size or settings.QUERY_PAGE_SIZE
+        after = None
+        while True:
+            rows = self._fetch(
+                "SELECT id FROM users WHERE $1::uuid IS NULL OR id > $1 ORDER BY id LIMIT $2", after, page_size
+            )
+            for row in rows:
+                yield row["id"]
+            if len(rows) < page_size:
+                return
+            after = rows[-1]["id"]
+
+    # Conversation state
+    def get_state(self, user_id: str) -> dict | None:
+        return self._fetchrow(
+            "SELECT current_context, context_data FROM conversation_state WHERE user_id = $1", user_id
+        )
+
+    def upsert_state(self, user_id: str, phone_number: str, context: str | None, context_data: dict) -> dict:
+        return self._fetchrow(
+            """
+            INSERT INTO conversation_state (user_id, phone_number, current_context, context_data, updated_at)
+            VALUES ($1, $2, $3, $4, NOW())
+            ON CONFLICT (user_id) DO UPDATE SET
+                phone_number = EXCLUDED.phone_number,
+                current_context = EXCLUDED.current_context,
+                context_data = EXCLUDED.context_data,
+                updated_at = EXCLUDED.updated_at
+            RETURNING user_id, current_context, context_data
+            """,
+            user_id,
+            phone_number,
+            context,
+            context_data,
+        )
+
+    def fire_due_nudges(self, batch_size: int, nudge_after_seconds: int, now: datetime) -> list[dict]:
+        return self._fetch(
+            "SELECT user_id, phone_number, context_data FROM fire_due_nudges($1, $2, $3)",
+            batch_size,
+            nudge_after_seconds,
+            now,
+        )
+
+    def clear_state(self, user_id: str) -> None:
+        self.query_count += 1
+        self._run(self.pool.execute("DELETE FROM conversation_state WHERE user_id = $1", user_id))
+
+    # Pomodoro
+    def start_pomodoro_cycle(
+        self,
+        user_id: str,
+        started_at: datetime,
+        work_minutes: int,
+        break_minutes: int,
+        cycle_id: str | None = None,
+    ) -> PomodoroCycle:
+        return self._fetchrow(
+            f"""
+            INSERT INTO pomodoro_cycles (
+                id, user_id, started_at, work_minutes, break_minutes, status, notified_phase, next_transition_at
+            )
+            VALUES (COALESCE($6::UUID, gen_random_uuid()), $1, $2, $3, $4, 'active', 0, $5)
+            {_on_conflict_id("pomodoro_cycles")}
+            RETURNING {PomodoroCycle.COLUMNS}
+            """,
+            user_id,
+            started_at,
+            work_minutes,
+            break_minutes,
+            started_at + timedelta(minutes=work_minutes),
+            cycle_id,
+            model=PomodoroCycle,
+        )
+
+    def log_pomodoro_cycle(
+        self,
+        user_id: str,
+        started_at: datetime,
+        stopped_at: datetime,
+        summary: str | None = None,
+        cycle_id: str | None = None,
+    ) -> PomodoroCycle:
+        return self._fetchrow(
+            f"""
+            INSERT INTO pomodoro_cycles (
+                id, user_id, started_at, work_minutes, break_minutes, stopped_at, status,
+                is_backfill, notified_phase, summaries
+            )
+            VALUES (COALESCE($6::UUID, gen_random_uuid()), $1, $2, $3, 0, $4, 'stopped', TRUE, 1, $5)
+            {_on_conflict_id("pomodoro_cycles")}
+            RETURNING {PomodoroCycle.COLUMNS}
+            """,
+            user_id,
+            started_at,
+            int((stopped_at - started_at).total_seconds() / 60),
+            stopped_at,
+            {"0": summary} if summary else {},
+            cycle_id,
+            model=PomodoroCycle,
+        )
+
+    def stop_pomodoro_cycles(self, user_id: str, stopped_at: datetime) -> list[PomodoroCycle]:
+        return self._fetch(
+            f"""
+            UPDATE pomodoro_cycles
+            SET status = 'stopped', stopped_at = $2, next_transition_at = NULL
+            WHERE user_id = $1 AND status = 'active' AND started_at <= $2
+            RETURNING {PomodoroCycle.COLUMNS}
+            """,
+            user_id,
+            stopped_at,
+            model=PomodoroCycle,
+        )
+
+    def set_pomodoro_summary(self, cycle_id: str, block: int, summary: str) -> None:
+        self._fetchval("SELECT id FROM set_pomodoro_summary($1, $2, $3)", cycle_id, block, summary)
+
+    def iter_pomodoro_cycles(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[PomodoroCycle]:
+        return self._paginate(
+            f"""
+            SELECT {PomodoroCycle.COLUMNS} FROM pomodoro_cycles
+            WHERE user_id = $1
+              AND started_at <= $3
+              AND (stopped_at IS NULL OR stopped_at >= $2)
+              {{after}}
+            """,
+            user_id,
+            parse_ts(start_iso),
+            parse_ts(end_iso),
+            column="started_at",
+            model=PomodoroCycle,
+            page_size=page_size,
+        )
+
+    def pomodoro_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_blocks: bool = False
+    ) -> PomodoroStats:
+        return self._fetchrow(
+            "SELECT * FROM pomodoro_stats($1, $2, $3, $4)",
+            user_id,
+            parse_ts(start_iso),
+            parse_ts(end_iso),
+            with_blocks,
+            model=PomodoroStats,
+        )
+
+    def advance_due_pomodoro_cycles(self, batch_size: int, now: datetime) -> list[dict]:
+        return self._fetch(
+            "SELECT user_id, phone_number, timezone, end_time FROM advance_due_pomodoro_cycles($1, $2)",
+            batch_size,
+            now,
+        )
+
+    def next_timer_due_at(self, nudge_after_seconds: int) -> datetime | None:
+        return self._fetchval("SELECT next_timer_due_at($1)", nudge_after_seconds)
+
+    # Tasks
+    def insert_task(
+        self,
+        user_id: str,
+        title: str,
+        raw_message: str,
+        reminder_time: datetime | None,
+        task_id: str | None = None,
+        created_at: datetime | None = None,
+    ) -> Task:
+        return self._fetchrow(
+            f"""
+            INSERT INTO tasks (id, user_id, title, raw_message, reminder_time, created_at)
+            VALUES (COALESCE($5::UUID, gen_random_uuid()), $1, $2, $3, $4, COALESCE($6, NOW()))
+            {_on_conflict_id("tasks")}
+            RETURNING {Task.COLUMNS}
+            """,
+            user_id,
+            title,
+            raw_message,
+            reminder_time,
+            task_id,
+            created_at,
+            model=Task,
+        )
+
+    def iter_incomplete_tasks(self, user_id: str, page_size: int | None = None) -> Iterator[Task]:
+        return self._paginate(
+            f"SELECT {Task.COLUMNS} FROM tasks WHERE user_id = $1 AND completed = FALSE {{after}}",
+            user_id,
+            column="created_at",
+            model=Task,
+            page_size=page_size,
+        )
+
+    def complete_task(self, task_id: str, completed_at: datetime | None = None) -> Task:
+        task = self._fetchrow(
+            f"""
+            UPDATE tasks SET completed = TRUE, completed_at = COALESCE($2, NOW())
+            WHERE id = $1
+            RETURNING {Task.COLUMNS}
+            """,
+            task_id,
+            completed_at,
+            model=Task,
+        )
+        if task is None:
+            raise RowNotFound(f"No task {task_id}")
+        return task
+
+    def iter_tasks_created(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]:
+        return self._paginate(
+            f"""
+            SELECT {Task.COLUMNS} FROM tasks
+            WHERE user_id = $1 AND created_at >= $2 AND created_at <= $3 {{after}}
+            """,
+            user_id,
+            parse_ts(start_iso),
+            parse_ts(end_iso),
+            column="created_at",
+            model=Task,
+            page_size=page_size,
+        )
+
+    def iter_tasks_completed(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]:
+        return self._paginate(
+            f"""
+            SELECT {Task.COLUMNS} FROM tasks
+            WHERE user_id = $1 AND completed = TRUE AND completed_at >= $2 AND completed_at <= $3 {{after}}
+            """,
+            user_id,
+            parse_ts(start_iso),
+            parse_ts(end_iso),
+            column="completed_at",
+            model=Task,
+            page_size=page_size,
+        )
+
+    def task_stats(self, user_id: str, start_iso: str, end_iso: str) -> TaskStats:
+        return self._fetchrow(
+            "SELECT * FROM task_stats($1, $2, $3)", user_id, parse_ts(start_iso), parse_ts(end_iso), model=TaskStats
+        )
+
+    def fire_due_task_reminders(self, batch_size: int, now: datetime) -> list[dict]:
+        return self._fetch("SELECT id, user_id, reminder_time FROM fire_due_task_reminders($1, $2)", batch_size, now)
+
+    # Calories
+    def insert_calorie_log(
+        self,
+        user_id: str,
+        meal_description: str,
+        calories: int | None,
+        protein_g: float | None,
+        carbs_g: float | None,
+        fat_g: float | None,
+        fiber_g: float | None,
+        confirmed: bool,
+        image_url: str | None = None,
+        log_id: str | None = None,
+        logged_at: datetime | None = None,
+    ) -> CalorieLog:
+        return self._fetchrow(
+            f"""
+            INSERT INTO calorie_logs (
+                id, user_id, meal_description, image_url, calories, protein_g, carbs_g, fat_g, fiber_g,
+                confirmed, logged_at
+            )
+            VALUES (
+                COALESCE($10::UUID, gen_random_uuid()), $1, $2, $3, $4, $5, $6, $7, $8, $9, COALESCE($11, NOW())
+            )
+            {_on_conflict_id("calorie_logs")}
+            RETURNING {CalorieLog.COLUMNS}
+            """,
+            user_id,
+            meal_description,
+            image_url,
+            calories,
+            protein_g,
+            carbs_g,
+            fat_g,
+            fiber_g,
+            confirmed,
+            log_id,
+            logged_at,
+            model=CalorieLog,
+        )
+
+    def iter_calorie_logs(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[CalorieLog]:
+        return self._paginate(
+            f"""
+            SELECT {CalorieLog.COLUMNS} FROM calorie_logs
+            WHERE user_id = $1 AND logged_at >= $2 AND logged_at <= $3 {{after}}
+            """,
+            user_id,
+            parse_ts(start_iso),
+            parse_ts(end_iso),
+            column="logged_at",
+            model=CalorieLog,
+            page_size=page_size,
+        )
+
+    def calorie_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_meals: bool = False
+    ) -> CalorieStats:
+        return self._fetchrow(
+            "SELECT * FROM calorie_stats($1, $2, $3, $4)",
+            user_id,
+            parse_ts(start_iso),
+            parse_ts(end_iso),
+            with_meals,
+            model=CalorieStats,
+        )
+
+    # Daily rollups
+    def daily_rollups(self, user_id: str, start_day: date, end_day: date) -> dict[date, DailyRollup]:
+        rows = self._fetch(
+            "SELECT day, metric, value FROM daily_rollups WHERE user_id = $1 AND day BETWEEN $2 AND $3",
+            user_id,
+            start_day,
+            end_day,
+        )
+        return DailyRollup.from_rows(rows)
+
+    def rebuild_daily_rollups(self, user_id: str, since: date | None = None, repair: bool = True) -> int:
+        return self._fetchval("SELECT rebuild_daily_rollups($1, $2, $3)", user_id, since, repair)
+
+    # Outbound messages
+    def claim_outbound_messages(
+        self, worker_id: str, batch_size: int, lease_seconds: int, now: datetime
+    ) -> list[dict]:
+        return self._fetch(
+            "SELECT id, phone_number, body, media_url, priority FROM claim_outbound_messages($1, $2, $3, $4)",
+            worker_id,
+            batch_size,
+            lease_seconds,
+            now,
+        )
+
+    def extend_outbound_claims(
+        self, worker_id: str, message_ids: list[str], lease_seconds: int, now: datetime
+    ) -> int:
+        if not message_ids:
+            return 0
+        data = self._fetchval(
+            "SELECT extend_outbound_claims($1, $2::uuid[], $3, $4)", worker_id, message_ids, lease_seconds, now
+        )
+        return int(data or 0)
+
+    def record_outbound_results(
+        self, worker_id: str, results: list[dict], max_attempts: int, retry_after_seconds: int
+    ) -> int:
+        if not results:
+            return 0
+        data = self._fetchval(
+            "SELECT record_outbound_results($1, $2, $3, $4)", worker_id, results, max_attempts, retry_after_seconds
+        )
+        return int(data or 0)
+
+
+def _value(value: Any) -> Any:
+    # Match what PostgREST returns so callers see the same rows from either backend
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _row(record: Any) -> dict:
+    return {key: _value(value) for key, value in record.items()}
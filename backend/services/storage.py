@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Iterator, Protocol
+
+import httpx
+
+from config import settings
+from services.models import (
+    CalorieLog,
+    CalorieStats,
+    DailyRollup,
+    PomodoroCycle,
+    PomodoroStats,
+    Task,
+    TaskStats,
+    User,
+)
+
+
+class RowNotFound(LookupError):
+    # An update matched no row; retrying it won't change that
+    pass
+
+
+class StorageBackend(Protocol):
+    query_count: int
+
+    def close(self) -> None: ...
+
+    def bulk_insert(self, table: str, rows: list[dict]) -> int: ...
+
+    def create_future_partitions(self, months_ahead: int) -> int: ...
+
+    # Users
+    def get_user_by_phone(self, phone_number: str) -> User | None: ...
+
+    def get_users_by_ids(self, user_ids: list[str]) -> dict[str, User]: ...
+
+    def create_user(self, phone_number: str) -> User: ...
+
+    # Updates by id raise RowNotFound when the row doesn't exist
+    def update_user(self, user_id: str, fields: dict) -> User: ...
+
+    def get_or_create_user(self, phone_number: str) -> User: ...
+
+    def iter_user_ids(self, page_size: int | None = None) -> Iterator[str]: ...
+
+    # Conversation state
+    def get_state(self, user_id: str) -> dict | None: ...
+
+    def upsert_state(self, user_id: str, phone_number: str, context: str | None, context_data: dict) -> dict: ...
+
+    def fire_due_nudges(self, batch_size: int, nudge_after_seconds: int, now: datetime) -> list[dict]: ...
+
+    def clear_state(self, user_id: str) -> None: ...
+
+    # Pomodoro
+    # Inserts take an optional client-generated id; inserting an id that
+    # already exists is a no-op, so journaled writes can be replayed safely
+    def start_pomodoro_cycle(
+        self,
+        user_id: str,
+        started_at: datetime,
+        work_minutes: int,
+        break_minutes: int,
+        cycle_id: str | None = None,
+    ) -> PomodoroCycle: ...
+
+    def log_pomodoro_cycle(
+        self,
+        user_id: str,
+        started_at: datetime,
+        stopped_at: datetime,
+        summary: str | None = None,
+        cycle_id: str | None = None,
+    ) -> PomodoroCycle: ...
+
+    # Only cycles started by stopped_at, so a replayed stop leaves later ones running
+    def stop_pomodoro_cycles(self, user_id: str, stopped_at: datetime) -> list[PomodoroCycle]: ...
+
+    def set_pomodoro_summary(self, cycle_id: str, block: int, summary: str) -> None: ...
+
+    def iter_pomodoro_cycles(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[PomodoroCycle]: ...
+
+    def pomodoro_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_blocks: bool = False
+    ) -> PomodoroStats: ...
+
+    def advance_due_pomodoro_cycles(self, batch_size: int, now: datetime) -> list[dict]: ...
+
+    def next_timer_due_at(self, nudge_after_seconds: int) -> datetime | None: ...
+
+    # Tasks
+    def insert_task(
+        self,
+        user_id: str,
+        title: str,
+        raw_message: str,
+        reminder_time: datetime | None,
+        task_id: str | None = None,
+        created_at: datetime | None = None,
+    ) -> Task: ...
+
+    def iter_incomplete_tasks(self, user_id: str, page_size: int | None = None) -> Iterator[Task]: ...
+
+    def complete_task(self, task_id: str, completed_at: datetime | None = None) -> Task: ...
+
+    def iter_tasks_created(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]: ...
+
+    def iter_tasks_completed(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]: ...
+
+    def task_stats(self, user_id: str, start_iso: str, end_iso: str) -> TaskStats: ...
+
+    def fire_due_task_reminders(self, batch_size: int, now: datetime) -> list[dict]: ...
+
+    # Calories
+    def insert_calorie_log(
+        self,
+        user_id: str,
+        meal_description: str,
+        calories: int | None,
+        protein_g: float | None,
+        carbs_g: float | None,
+        fat_g: float | None,
+        fiber_g: float | None,
+        confirmed: bool,
+        image_url: str | None = None,
+        log_id: str | None = None,
+        logged_at: datetime | None = None,
+    ) -> CalorieLog: ...
+
+    def iter_calorie_logs(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[CalorieLog]: ...
+
+    def calorie_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_meals: bool = False
+    ) -> CalorieStats: ...
+
+    # Daily rollups
+    def daily_rollups(self, user_id: str, start_day: date, end_day: date) -> dict[date, DailyRollup]: ...
+
+    def rebuild_daily_rollups(self, user_id: str, since: date | None = None, repair: bool = True) -> int: ...
+
+    # Outbound messages
+    def claim_outbound_messages(
+        self, worker_id: str, batch_size: int, lease_seconds: int, now: datetime
+    ) -> list[dict]: ...
+
+    def extend_outbound_claims(
+        self, worker_id: str, message_ids: list[str], lease_seconds: int, now: datetime
+    ) -> int: ...
+
+    def record_outbound_results(
+        self, worker_id: str, results: list[dict], max_attempts: int, retry_after_seconds: int
+    ) -> int: ...
+
+
+def create_storage(http_client: httpx.Client | None = None) -> StorageBackend:
+    if settings.STORAGE_BACKEND == "postgres":
+        from services.postgres_service import PostgresService
+
+        return PostgresService()
+    from services.supabase_service import SupabaseService
+
+    return SupabaseService(http_client)
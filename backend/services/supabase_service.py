@@ -1,51 +1,125 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from typing import Any
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Iterator
 
+import httpx
 from postgrest.exceptions import APIError
-from supabase import Client, create_client
+from supabase import Client, ClientOptions, create_client
 
 from config import settings
+from services.models import (
+    PARTITION_KEYS,
+    CalorieLog,
+    CalorieStats,
+    DailyRollup,
+    PomodoroCycle,
+    PomodoroStats,
+    Task,
+    TaskStats,
+    User,
+)
+from services.storage import RowNotFound
+from utils.time_utils import parse_ts
 
 
 class SupabaseService:
-    def __init__(self) -> None:
-        self.client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SECRET_KEY)
+    def __init__(self, http_client: httpx.Client | None = None) -> None:
+        options = ClientOptions(httpx_client=http_client) if http_client else None
+        self.client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SECRET_KEY, options)
+        self.query_count = 0
 
     def _execute(self, query) -> Any:
+        self.query_count += 1
         response = query.execute()
         if hasattr(response, "error") and response.error:
             raise RuntimeError(response.error)
         return response.data
 
+    def close(self) -> None:
+        pass
+
+    def _paginate(
+        self, build: Callable[[], Any], column: str, page_size: int | None = None
+    ) -> Iterator[dict]:
+        # Keyset pagination on (column, id): each page starts strictly after
+        # the last row of the previous one, so results are never cut off at
+        # the server's max-rows and only one page is held at a time
+        page_size = page_size or settings.QUERY_PAGE_SIZE
+        cursor: tuple[str, str] | None = None
+        while True:
+            query = build().order(column, desc=False).order("id", desc=False).limit(page_size)
+            if cursor:
+                value, row_id = cursor
+                query = query.or_(f'{column}.gt."{value}",and({column}.eq."{value}",id.gt.{row_id})')
+            rows = self._execute(query) or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1][column], rows[-1]["id"])
+
+    def _insert(self, table: str, payload: dict) -> dict:
+        if "id" not in payload:
+            return self._execute(self.client.table(table).insert(payload))[0]
+        # Client-generated id: a replayed insert leaves the existing row alone
+        on_conflict = f"id,{PARTITION_KEYS[table]}"
+        data = self._execute(self.client.table(table).upsert(payload, on_conflict=on_conflict, ignore_duplicates=True))
+        return data[0] if data else payload
+
+    def bulk_insert(self, table: str, rows: list[dict]) -> int:
+        if not rows:
+            return 0
+        payload = [{key: _jsonable(value) for key, value in row.items()} for row in rows]
+        self._execute(self.client.table(table).insert(payload, returning="minimal"))
+        return len(rows)
+
+    def create_future_partitions(self, months_ahead: int) -> int:
+        data = self._execute(self.client.rpc("create_future_partitions", {"months_ahead": months_ahead}))
+        return int(data or 0)
+
     # Users
-    def get_user_by_phone(self, phone_number: str) -> dict | None:
+    def get_user_by_phone(self, phone_number: str) -> User | None:
         data = self._execute(
-            self.client.table("users").select("*").eq("phone_number", phone_number).limit(1)
+            self.client.table("users").select(User.COLUMNS).eq("phone_number", phone_number).limit(1)
         )
-        return data[0] if data else None
+        return User.from_row(data[0]) if data else None
+
+    def get_users_by_ids(self, user_ids: list[str]) -> dict[str, User]:
+        ids = list(dict.fromkeys(user_ids))
+        if not ids:
+            return {}
+        data = self._execute(self.client.table("users").select(User.COLUMNS).in_("id", ids))
+        return {row["id"]: User.from_row(row) for row in data}
 
-    def create_user(self, phone_number: str) -> dict:
+    def create_user(self, phone_number: str) -> User:
         payload = {"phone_number": phone_number}
         data = self._execute(self.client.table("users").insert(payload))
-        return data[0]
+        return User.from_row(data[0])
 
-    def update_user(self, user_id: str, fields: dict) -> dict:
+    def update_user(self, user_id: str, fields: dict) -> User:
         fields["updated_at"] = datetime.utcnow().isoformat()
         data = self._execute(self.client.table("users").update(fields).eq("id", user_id))
-        return data[0]
+        if not data:
+            raise RowNotFound(f"No user {user_id}")
+        return User.from_row(data[0])
 
-    def get_or_create_user(self, phone_number: str) -> dict:
+    def get_or_create_user(self, phone_number: str) -> User:
         user = self.get_user_by_phone(phone_number)
         if user:
             return user
         return self.create_user(phone_number)
 
+    def iter_user_ids(self, page_size: int | None = None) -> Iterator[str]:
+        for row in self._paginate(lambda: self.client.table("users").select("id"), "id", page_size):
+            yield row["id"]
+
     # Conversation state
     def get_state(self, user_id: str) -> dict | None:
         data = self._execute(
-            self.client.table("conversation_state").select("*").eq("user_id", user_id).limit(1)
+            self.client.table("conversation_state")
+            .select("current_context,context_data")
+            .eq("user_id", user_id)
+            .limit(1)
         )
         return data[0] if data else None
 
@@ -67,7 +141,7 @@ class SupabaseService:
             if "42P10" not in str(exc):
                 raise
             existing = self._execute(
-                self.client.table("conversation_state").select("*").eq("user_id", user_id).limit(1)
+                self.client.table("conversation_state").select("id").eq("user_id", user_id).limit(1)
             )
             if existing:
                 data = self._execute(
@@ -77,97 +151,215 @@ class SupabaseService:
             data = self._execute(self.client.table("conversation_state").insert(payload))
             return data[0]
 
+    def fire_due_nudges(self, batch_size: int, nudge_after_seconds: int, now: datetime) -> list[dict]:
+        data = self._execute(
+            self.client.rpc(
+                "fire_due_nudges",
+                {
+                    "batch_size": batch_size,
+                    "nudge_after_seconds": nudge_after_seconds,
+                    "now_ts": now.isoformat(),
+                },
+            ).select("user_id,phone_number,context_data")
+        )
+        return data or []
+
     def clear_state(self, user_id: str) -> None:
         self._execute(self.client.table("conversation_state").delete().eq("user_id", user_id))
 
     # Pomodoro
-    def create_pomodoro_session(
+    def start_pomodoro_cycle(
+        self,
+        user_id: str,
+        started_at: datetime,
+        work_minutes: int,
+        break_minutes: int,
+        cycle_id: str | None = None,
+    ) -> PomodoroCycle:
+        payload = {
+            "user_id": user_id,
+            "started_at": started_at.isoformat(),
+            "work_minutes": work_minutes,
+            "break_minutes": break_minutes,
+            "status": "active",
+            "notified_phase": 0,
+            "next_transition_at": (started_at + timedelta(minutes=work_minutes)).isoformat(),
+        }
+        if cycle_id:
+            payload["id"] = cycle_id
+        return PomodoroCycle.from_row(self._insert("pomodoro_cycles", payload))
+
+    def log_pomodoro_cycle(
         self,
         user_id: str,
-        session_type: str,
-        start_time: datetime,
-        duration_minutes: int,
-        status: str = "active",
-        is_backfill: bool = False,
-        what_did_you_do: str | None = None,
-        cycle_work_minutes: int | None = None,
-        cycle_break_minutes: int | None = None,
-    ) -> dict:
-        end_time = start_time + timedelta(minutes=duration_minutes)
+        started_at: datetime,
+        stopped_at: datetime,
+        summary: str | None = None,
+        cycle_id: str | None = None,
+    ) -> PomodoroCycle:
+        # Backfilled work is a single, already finished work block
+        work_minutes = int((stopped_at - started_at).total_seconds() / 60)
         payload = {
             "user_id": user_id,
-            "session_type": session_type,
-            "start_time": start_time.isoformat(),
-            "end_time": end_time.isoformat(),
-            "planned_duration_minutes": duration_minutes,
-            "status": status,
-            "is_backfill": is_backfill,
-            "what_did_you_do": what_did_you_do,
+            "started_at": started_at.isoformat(),
+            "work_minutes": work_minutes,
+            "break_minutes": 0,
+            "stopped_at": stopped_at.isoformat(),
+            "status": "stopped",
+            "is_backfill": True,
+            "notified_phase": 1,
+            "summaries": {"0": summary} if summary else {},
         }
-        if cycle_work_minutes is not None:
-            payload["cycle_work_minutes"] = cycle_work_minutes
-        if cycle_break_minutes is not None:
-            payload["cycle_break_minutes"] = cycle_break_minutes
-        data = self._execute(self.client.table("pomodoro_sessions").insert(payload))
-        return data[0]
-
-    def update_pomodoro_session(self, session_id: str, fields: dict) -> dict:
+        if cycle_id:
+            payload["id"] = cycle_id
+        return PomodoroCycle.from_row(self._insert("pomodoro_cycles", payload))
+
+    def stop_pomodoro_cycles(self, user_id: str, stopped_at: datetime) -> list[PomodoroCycle]:
+        payload = {"status": "stopped", "stopped_at": stopped_at.isoformat(), "next_transition_at": None}
         data = self._execute(
-            self.client.table("pomodoro_sessions").update(fields).eq("id", session_id)
+            self.client.table("pomodoro_cycles")
+            .update(payload)
+            .eq("user_id", user_id)
+            .eq("status", "active")
+            .lte("started_at", stopped_at.isoformat())
         )
-        return data[0]
+        return [PomodoroCycle.from_row(row) for row in data or []]
 
-    def get_active_sessions(self) -> list[dict]:
+    def set_pomodoro_summary(self, cycle_id: str, block: int, summary: str) -> None:
+        self._execute(
+            self.client.rpc(
+                "set_pomodoro_summary",
+                {"cycle_id": cycle_id, "block_index": block, "summary": summary},
+            ).select("id")
+        )
+
+    def iter_pomodoro_cycles(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[PomodoroCycle]:
+        # Cycles overlapping [start, end]; still-running cycles have no stopped_at
+        rows = self._paginate(
+            lambda: self.client.table("pomodoro_cycles")
+            .select(PomodoroCycle.COLUMNS)
+            .eq("user_id", user_id)
+            .lte("started_at", end_iso)
+            .or_(f"stopped_at.is.null,stopped_at.gte.{start_iso}"),
+            "started_at",
+            page_size,
+        )
+        for row in rows:
+            yield PomodoroCycle.from_row(row)
+
+    def pomodoro_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_blocks: bool = False
+    ) -> PomodoroStats:
         data = self._execute(
-            self.client.table("pomodoro_sessions").select("*").eq("status", "active")
+            self.client.rpc(
+                "pomodoro_stats",
+                {"target_user_id": user_id, "range_start": start_iso, "range_end": end_iso, "with_blocks": with_blocks},
+            )
         )
-        return data
+        return PomodoroStats.from_row(data[0] if data else {})
 
-    def get_active_sessions_for_user(self, user_id: str) -> list[dict]:
+    def advance_due_pomodoro_cycles(self, batch_size: int, now: datetime) -> list[dict]:
         data = self._execute(
-            self.client.table("pomodoro_sessions").select("*").eq("status", "active").eq("user_id", user_id)
+            self.client.rpc(
+                "advance_due_pomodoro_cycles",
+                {"batch_size": batch_size, "now_ts": now.isoformat()},
+            ).select("user_id,phone_number,timezone,end_time")
         )
-        return data
+        return data or []
+
+    def next_timer_due_at(self, nudge_after_seconds: int) -> datetime | None:
+        data = self._execute(
+            self.client.rpc("next_timer_due_at", {"nudge_after_seconds": nudge_after_seconds})
+        )
+        return parse_ts(str(data)) if data else None
 
     # Tasks
-    def insert_task(self, user_id: str, title: str, raw_message: str, reminder_time: datetime | None) -> dict:
+    def insert_task(
+        self,
+        user_id: str,
+        title: str,
+        raw_message: str,
+        reminder_time: datetime | None,
+        task_id: str | None = None,
+        created_at: datetime | None = None,
+    ) -> Task:
         payload = {
             "user_id": user_id,
             "title": title,
             "raw_message": raw_message,
             "reminder_time": reminder_time.isoformat() if reminder_time else None,
         }
-        data = self._execute(self.client.table("tasks").insert(payload))
-        return data[0]
+        if task_id:
+            payload["id"] = task_id
+        if created_at:
+            payload["created_at"] = created_at.isoformat()
+        return Task.from_row(self._insert("tasks", payload))
 
-    def list_incomplete_tasks(self, user_id: str) -> list[dict]:
-        data = self._execute(
-            self.client.table("tasks")
-            .select("*")
-            .eq("user_id", user_id)
-            .eq("completed", False)
-            .order("created_at", desc=False)
+    def iter_incomplete_tasks(self, user_id: str, page_size: int | None = None) -> Iterator[Task]:
+        rows = self._paginate(
+            lambda: self.client.table("tasks").select(Task.COLUMNS).eq("user_id", user_id).eq("completed", False),
+            "created_at",
+            page_size,
         )
-        return data
+        for row in rows:
+            yield Task.from_row(row)
 
-    def complete_task(self, task_id: str) -> dict:
-        payload = {"completed": True, "completed_at": datetime.utcnow().isoformat()}
+    def complete_task(self, task_id: str, completed_at: datetime | None = None) -> Task:
+        payload = {"completed": True, "completed_at": (completed_at or datetime.utcnow()).isoformat()}
         data = self._execute(self.client.table("tasks").update(payload).eq("id", task_id))
-        return data[0]
+        if not data:
+            raise RowNotFound(f"No task {task_id}")
+        return Task.from_row(data[0])
 
-    def fetch_due_task_reminders(self, now: datetime) -> list[dict]:
+    def iter_tasks_created(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]:
+        rows = self._paginate(
+            lambda: self.client.table("tasks")
+            .select(Task.COLUMNS)
+            .eq("user_id", user_id)
+            .gte("created_at", start_iso)
+            .lte("created_at", end_iso),
+            "created_at",
+            page_size,
+        )
+        for row in rows:
+            yield Task.from_row(row)
+
+    def iter_tasks_completed(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[Task]:
+        rows = self._paginate(
+            lambda: self.client.table("tasks")
+            .select(Task.COLUMNS)
+            .eq("user_id", user_id)
+            .eq("completed", True)
+            .gte("completed_at", start_iso)
+            .lte("completed_at", end_iso),
+            "completed_at",
+            page_size,
+        )
+        for row in rows:
+            yield Task.from_row(row)
+
+    def task_stats(self, user_id: str, start_iso: str, end_iso: str) -> TaskStats:
         data = self._execute(
-            self.client.table("tasks")
-            .select("*")
-            .lte("reminder_time", now.isoformat())
-            .eq("reminder_sent", False)
+            self.client.rpc(
+                "task_stats", {"target_user_id": user_id, "range_start": start_iso, "range_end": end_iso}
+            )
         )
-        return data
+        return TaskStats.from_row(data[0] if data else {})
 
-    def mark_task_reminder_sent(self, task_id: str) -> dict:
-        payload = {"reminder_sent": True}
-        data = self._execute(self.client.table("tasks").update(payload).eq("id", task_id))
-        return data[0]
+    def fire_due_task_reminders(self, batch_size: int, now: datetime) -> list[dict]:
+        data = self._execute(
+            self.client.rpc(
+                "fire_due_task_reminders",
+                {"batch_size": batch_size, "now_ts": now.isoformat()},
+            ).select("id,user_id,reminder_time")
+        )
+        return data or []
 
     # Calories
     def insert_calorie_log(
@@ -181,7 +373,9 @@ class SupabaseService:
         fiber_g: float | None,
         confirmed: bool,
         image_url: str | None = None,
-    ) -> dict:
+        log_id: str | None = None,
+        logged_at: datetime | None = None,
+    ) -> CalorieLog:
         payload = {
             "user_id": user_id,
             "meal_description": meal_description,
@@ -193,15 +387,113 @@ class SupabaseService:
             "fiber_g": fiber_g,
             "confirmed": confirmed,
         }
-        data = self._execute(self.client.table("calorie_logs").insert(payload))
-        return data[0]
+        if log_id:
+            payload["id"] = log_id
+        if logged_at:
+            payload["logged_at"] = logged_at.isoformat()
+        return CalorieLog.from_row(self._insert("calorie_logs", payload))
 
-    def list_today_calories(self, user_id: str, start_iso: str, end_iso: str) -> list[dict]:
-        data = self._execute(
-            self.client.table("calorie_logs")
-            .select("*")
+    def iter_calorie_logs(
+        self, user_id: str, start_iso: str, end_iso: str, page_size: int | None = None
+    ) -> Iterator[CalorieLog]:
+        rows = self._paginate(
+            lambda: self.client.table("calorie_logs")
+            .select(CalorieLog.COLUMNS)
             .eq("user_id", user_id)
             .gte("logged_at", start_iso)
-            .lte("logged_at", end_iso)
+            .lte("logged_at", end_iso),
+            "logged_at",
+            page_size,
+        )
+        for row in rows:
+            yield CalorieLog.from_row(row)
+
+    def calorie_stats(
+        self, user_id: str, start_iso: str, end_iso: str, with_meals: bool = False
+    ) -> CalorieStats:
+        data = self._execute(
+            self.client.rpc(
+                "calorie_stats",
+                {"target_user_id": user_id, "range_start": start_iso, "range_end": end_iso, "with_meals": with_meals},
+            )
+        )
+        return CalorieStats.from_row(data[0] if data else {})
+
+    # Daily rollups
+    def daily_rollups(self, user_id: str, start_day: date, end_day: date) -> dict[date, DailyRollup]:
+        data = self._execute(
+            self.client.table("daily_rollups")
+            .select("day,metric,value")
+            .eq("user_id", user_id)
+            .gte("day", start_day.isoformat())
+            .lte("day", end_day.isoformat())
         )
-        return data
+        return DailyRollup.from_rows(data or [])
+
+    def rebuild_daily_rollups(self, user_id: str, since: date | None = None, repair: bool = True) -> int:
+        data = self._execute(
+            self.client.rpc(
+                "rebuild_daily_rollups",
+                {"target_user_id": user_id, "since": since.isoformat() if since else None, "repair": repair},
+            )
+        )
+        return int(data or 0)
+
+    # Outbound messages
+    def claim_outbound_messages(
+        self, worker_id: str, batch_size: int, lease_seconds: int, now: datetime
+    ) -> list[dict]:
+        data = self._execute(
+            self.client.rpc(
+                "claim_outbound_messages",
+                {
+                    "worker_id": worker_id,
+                    "batch_size": batch_size,
+                    "lease_seconds": lease_seconds,
+                    "now_ts": now.isoformat(),
+                },
+            ).select("id,phone_number,body,media_url,priority")
+        )
+        return data or []
+
+    def extend_outbound_claims(
+        self, worker_id: str, message_ids: list[str], lease_seconds: int, now: datetime
+    ) -> int:
+        if not message_ids:
+            return 0
+        data = self._execute(
+            self.client.rpc(
+                "extend_outbound_claims",
+                {
+                    "worker_id": worker_id,
+                    "message_ids": message_ids,
+                    "lease_seconds": lease_seconds,
+                    "now_ts": now.isoformat(),
+                },
+            )
+        )
+        return int(data or 0)
+
+    def record_outbound_results(
+        self, worker_id: str, results: list[dict], max_attempts: int, retry_after_seconds: int
+    ) -> int:
+        if not results:
+            return 0
+        data = self._execute(
+            self.client.rpc(
+                "record_outbound_results",
+                {
+                    "worker_id": worker_id,
+                    "results": results,
+                    "max_attempts": max_attempts,
+                    "retry_after_seconds": retry_after_seconds,
+                },
+            )
+        )
+        return int(data or 0)
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
@@ -1,183 +1,253 @@
 from __future__ import annotations
 
 import asyncio
-from datetime import datetime, timezone
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator
 
 from config import settings
+from services.change_feed import ChangeFeed, change_feed_available
 from services.opik_service import set_trace_context, track
-from services.supabase_service import SupabaseService
-from services.twilio_service import TwilioService
+from services.storage import StorageBackend
+from utils.metrics import COUNT_BUCKETS, metrics
 from utils.thread_utils import phone_hash, thread_id_for_day
+from utils.time_utils import parse_ts
+
+logger = logging.getLogger(__name__)
 
 
 class TimerService:
-    def __init__(self, supabase: SupabaseService, twilio: TwilioService) -> None:
+    def __init__(self, supabase: StorageBackend) -> None:
         self.supabase = supabase
-        self.twilio = twilio
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
         self._task: asyncio.Task | None = None
+        self.last_tick_at: datetime | None = None
+        self.last_tick_ok = True
+        self._wake = asyncio.Event()
+        self._next_due: datetime | None = None
+        self.change_feed: ChangeFeed | None = None
+        self._fired: dict[str, list[float]] = {}
+        self._partitions_checked_at: float | None = None
 
     def start(self) -> None:
         if not self._task:
+            if change_feed_available(settings.DATABASE_URL):
+                self.change_feed = ChangeFeed(settings.DATABASE_URL, self.on_change, self.on_feed_connected)
+                self.change_feed.start()
             self._task = asyncio.create_task(self._run())
 
+    async def stop(self) -> None:
+        if self.change_feed:
+            await self.change_feed.stop()
+            self.change_feed = None
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def health(self) -> dict:
+        feed_connected = bool(self.change_feed and self.change_feed.connected)
+        poll_seconds = settings.TIMER_FEED_POLL_SECONDS if feed_connected else settings.POMODORO_POLL_SECONDS
+        stale_after = poll_seconds * 3
+        age = None
+        if self.last_tick_at:
+            age = (datetime.now(timezone.utc) - self.last_tick_at).total_seconds()
+        return {
+            "running": bool(self._task and not self._task.done()),
+            "worker_id": self.worker_id,
+            "last_tick_at": self.last_tick_at.isoformat() if self.last_tick_at else None,
+            "last_tick_ok": self.last_tick_ok,
+            "change_feed_connected": feed_connected,
+            "healthy": age is not None and age <= stale_after,
+        }
+
     async def _run(self) -> None:
         while True:
             try:
-                await self._check_pomodoros()
-                await self._check_task_reminders()
-                await self._check_nudges()
+                self.last_tick_ok = await self._tick()
             except Exception:
                 # Avoid crashing loop
-                pass
-            await asyncio.sleep(settings.POMODORO_POLL_SECONDS)
+                logger.exception("Timer tick failed")
+                metrics.inc("timer_errors_total", labels={"check": "tick"})
+                self.last_tick_ok = False
+            self.last_tick_at = datetime.now(timezone.utc)
+            await self._sleep()
 
-    @track(name="pomodoro_handler")
-    async def _check_pomodoros(self) -> None:
-        now = datetime.now(timezone.utc)
-        sessions = self.supabase.get_active_sessions()
-        for session in sessions:
-            end_time = session.get("end_time")
-            if not end_time:
-                continue
+    def schedule(self, due_at: datetime | None = None) -> None:
+        due_at = due_at or datetime.now(timezone.utc)
+        if self._next_due is None or due_at < self._next_due:
+            self._next_due = due_at
+            self._wake.set()
+
+    def on_change(self, change: dict) -> None:
+        due_at = change.get("due_at")
+        if due_at and change.get("table") == "conversation_state":
+            due_at += timedelta(seconds=settings.POMODORO_NUDGE_SECONDS)
+        self.schedule(due_at)
+
+    def on_feed_connected(self) -> None:
+        # Catch up on anything missed while the feed was down
+        self.schedule()
+
+    async def _sleep(self) -> None:
+        feed_connected = bool(self.change_feed and self.change_feed.connected)
+        if feed_connected:
+            self._schedule_next_due()
+        # With a live change feed, polling is only a safety net
+        poll_seconds = settings.TIMER_FEED_POLL_SECONDS if feed_connected else settings.POMODORO_POLL_SECONDS
+        deadline = asyncio.get_running_loop().time() + poll_seconds
+        while True:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if self._next_due:
+                timeout = min(timeout, (self._next_due - datetime.now(timezone.utc)).total_seconds())
+            if timeout <= 0:
+                break
+            self._wake.clear()
             try:
-                end_dt = datetime.fromisoformat(end_time.replace("Z", "+00:00"))
-                if end_dt.tzinfo is None:
-                    end_dt = end_dt.replace(tzinfo=timezone.utc)
-            except Exception:
-                continue
-            if end_dt > now:
-                continue
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        self._next_due = None
 
-            # Mark session complete
-            self.supabase.update_pomodoro_session(session["id"], {"status": "completed"})
+    def _schedule_next_due(self) -> None:
+        try:
+            due_at = self.supabase.next_timer_due_at(settings.POMODORO_NUDGE_SECONDS)
+        except Exception:
+            return
+        if due_at:
+            # Work another worker is still firing must not spin the loop
+            floor = datetime.now(timezone.utc) + timedelta(seconds=1)
+            self.schedule(max(due_at, floor))
 
-            user_id = session["user_id"]
-            user = self.supabase._execute(
-                self.supabase.client.table("users").select("*").eq("id", user_id).limit(1)
-            )
-            if not user:
-                continue
-            user = user[0]
-            phone_number = user["phone_number"]
-            thread_id = thread_id_for_day(phone_number, user.get("timezone", "UTC"))
-            set_trace_context(
-                thread_id=thread_id,
-                metadata={
-                    "user_id": user.get("id"),
-                    "phone_hash": phone_hash(phone_number),
-                    "feature": "pomodoro",
-                },
-                tags=["whatsapp", "system"],
+    async def _tick(self) -> bool:
+        started = time.perf_counter()
+        queries_before = self.supabase.query_count
+        self._fired = {}
+        errors: dict[str, str] = {}
+        checks = {
+            "pomodoro": self._check_pomodoros,
+            "task_reminder": self._check_task_reminders,
+            "pomodoro_nudge": self._check_nudges,
+        }
+        try:
+            try:
+                self._maintain_partitions()
+            except Exception as exc:
+                logger.exception("Partition maintenance failed")
+                metrics.inc("timer_errors_total", labels={"check": "partitions"})
+                errors["partitions"] = type(exc).__name__
+            for job, check in checks.items():
+                # One failing check must not starve the others
+                try:
+                    await check()
+                except Exception as exc:
+                    logger.exception("Timer check %s failed", job)
+                    metrics.inc("timer_errors_total", labels={"check": job})
+                    errors[job] = type(exc).__name__
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            queries = self.supabase.query_count - queries_before
+            metrics.observe("timer_tick_duration_ms", duration_ms)
+            metrics.inc("timer_ticks_total")
+            for job in checks:
+                lags = self._fired.get(job, [])
+                metrics.observe("timer_items_per_tick", len(lags), labels={"job": job}, buckets=COUNT_BUCKETS)
+                metrics.inc("timer_items_total", len(lags), labels={"job": job})
+            logger.info(
+                json.dumps(
+                    {
+                        "event": "timer_tick",
+                        "worker_id": self.worker_id,
+                        "duration_ms": round(duration_ms, 1),
+                        "queries": queries,
+                        "items": {job: len(self._fired.get(job, [])) for job in checks},
+                        "max_lag_ms": {
+                            job: round(max(lags), 1) for job, lags in self._fired.items() if lags
+                        },
+                        "errors": errors,
+                    }
+                )
             )
+        return not errors
 
-            if session["session_type"] == "work":
-                # Start break immediately (use session cycle if present)
-                break_minutes = session.get("cycle_break_minutes") or user.get("default_break_minutes", 5)
-                self.supabase.create_pomodoro_session(
-                    user_id,
-                    "break",
-                    now,
-                    break_minutes,
-                    status="active",
-                    cycle_work_minutes=session.get("cycle_work_minutes") or user.get("default_work_minutes", 25),
-                    cycle_break_minutes=break_minutes,
-                )
-                self.twilio.send_message(
-                    phone_number,
-                    f"⏱ Work block complete! Take a {break_minutes}-minute break.\n"
-                    "Quick check-in — what did you work on?",
-                )
-                self.supabase.upsert_state(
-                    user_id,
-                    phone_number,
-                    "awaiting_pomodoro_summary",
-                    {
-                        "session_id": session["id"],
-                        "summary_requested_at": now.isoformat(),
-                        "summary_nudged": False,
+    def _record_fired(self, job: str, due_at: datetime | str | None, now: datetime) -> None:
+        # Firing lag: how late the job ran compared to when it was due
+        lag_ms = 0.0
+        due_dt = parse_ts(due_at, lenient=True)
+        if due_dt:
+            lag_ms = max((now - due_dt).total_seconds() * 1000, 0.0)
+            metrics.observe("timer_firing_lag_ms", lag_ms, labels={"job": job})
+        self._fired.setdefault(job, []).append(lag_ms)
+
+    def _maintain_partitions(self) -> None:
+        # Keep next months' partitions created well before rows arrive for
+        # them; retried on the next tick if it fails
+        checked_at = self._partitions_checked_at
+        if checked_at is not None and time.monotonic() - checked_at < settings.PARTITION_CHECK_HOURS * 3600:
+            return
+        created = self.supabase.create_future_partitions(settings.PARTITION_MONTHS_AHEAD)
+        self._partitions_checked_at = time.monotonic()
+        if created:
+            logger.info("Created %s monthly partitions", created)
+
+    def _claim_batches(self, claim: Callable[[], list[dict]]) -> Iterator[list[dict]]:
+        # Each claim is one transaction over at most TIMER_BATCH_SIZE rows;
+        # batches are handled as they come back and claiming stops at the
+        # first short batch instead of loading every due row up front
+        for _ in range(settings.TIMER_MAX_BATCHES_PER_TICK):
+            batch = claim()
+            if batch:
+                yield batch
+            if len(batch) < settings.TIMER_BATCH_SIZE:
+                return
+
+    @track(name="pomodoro_handler")
+    async def _check_pomodoros(self) -> None:
+        now = datetime.now(timezone.utc)
+        # Claim, complete, start the next phase, request summaries and queue the
+        # transition message in one transaction; the outbox drainer sends it
+        batches = self._claim_batches(
+            lambda: self.supabase.advance_due_pomodoro_cycles(settings.TIMER_BATCH_SIZE, now)
+        )
+        for transitions in batches:
+            for transition in transitions:
+                self._record_fired("pomodoro", transition.get("end_time"), now)
+                phone_number = transition["phone_number"]
+                thread_id = thread_id_for_day(phone_number, transition.get("timezone") or "UTC")
+                set_trace_context(
+                    thread_id=thread_id,
+                    metadata={
+                        "user_id": transition["user_id"],
+                        "phone_hash": phone_hash(phone_number),
+                        "feature": "pomodoro",
                     },
-                )
-            else:
-                # Start next work session automatically unless stopped
-                work_minutes = session.get("cycle_work_minutes") or user.get("default_work_minutes", 25)
-                self.supabase.create_pomodoro_session(
-                    user_id,
-                    "work",
-                    now,
-                    work_minutes,
-                    status="active",
-                    cycle_work_minutes=work_minutes,
-                    cycle_break_minutes=session.get("cycle_break_minutes") or user.get("default_break_minutes", 5),
-                )
-                self.twilio.send_message(
-                    phone_number,
-                    f"✅ Break over. Starting a {work_minutes}-minute focus block now.\n"
-                    "Send 'stop' anytime to end.",
+                    tags=["whatsapp", "system"],
                 )
 
     async def _check_task_reminders(self) -> None:
         now = datetime.now(timezone.utc)
-        due_tasks = self.supabase.fetch_due_task_reminders(now)
-        for task in due_tasks:
-            user_id = task["user_id"]
-            user = self.supabase._execute(
-                self.supabase.client.table("users").select("*").eq("id", user_id).limit(1)
-            )
-            if not user:
-                continue
-            phone_number = user[0]["phone_number"]
-            thread_id = thread_id_for_day(phone_number, user[0].get("timezone", "UTC"))
-            set_trace_context(
-                thread_id=thread_id,
-                metadata={
-                    "user_id": user_id,
-                    "phone_hash": phone_hash(phone_number),
-                    "feature": "task_reminder",
-                },
-                tags=["whatsapp", "system"],
-            )
-            self.twilio.send_message(phone_number, f"⏰ Reminder: {task['title']}")
-            self.supabase.mark_task_reminder_sent(task["id"])
+        # Marks reminders sent and queues one digest per user in one transaction
+        batches = self._claim_batches(
+            lambda: self.supabase.fire_due_task_reminders(settings.TIMER_BATCH_SIZE, now)
+        )
+        for due_tasks in batches:
+            for task in due_tasks:
+                self._record_fired("task_reminder", task.get("reminder_time"), now)
 
     async def _check_nudges(self) -> None:
         now = datetime.now(timezone.utc)
-        states = self.supabase._execute(
-            self.supabase.client.table("conversation_state")
-            .select("*")
-            .eq("current_context", "awaiting_pomodoro_summary")
+        # Flags prompts as nudged and queues the nudge in one transaction
+        batches = self._claim_batches(
+            lambda: self.supabase.fire_due_nudges(settings.TIMER_BATCH_SIZE, settings.POMODORO_NUDGE_SECONDS, now)
         )
-        for state in states:
-            data = state.get("context_data") or {}
-            requested_at = data.get("summary_requested_at")
-            nudged = data.get("summary_nudged")
-            if not requested_at or nudged:
-                continue
-            user = self.supabase._execute(
-                self.supabase.client.table("users").select("*").eq("id", state["user_id"]).limit(1)
-            )
-            tz = "UTC"
-            if user:
-                tz = user[0].get("timezone", "UTC")
-            thread_id = thread_id_for_day(state["phone_number"], tz)
-            set_trace_context(
-                thread_id=thread_id,
-                metadata={
-                    "user_id": state.get("user_id"),
-                    "phone_hash": phone_hash(state["phone_number"]),
-                    "feature": "pomodoro_nudge",
-                },
-                tags=["whatsapp", "system"],
-            )
-            try:
-                requested_dt = datetime.fromisoformat(requested_at.replace("Z", "+00:00"))
-                if requested_dt.tzinfo is None:
-                    requested_dt = requested_dt.replace(tzinfo=timezone.utc)
-            except Exception:
-                continue
-            if (now - requested_dt).total_seconds() >= settings.POMODORO_NUDGE_SECONDS:
-                self.twilio.send_message(
-                    state["phone_number"],
-                    "Quick reminder — what did you work on in that last focus session?",
-                )
-                data["summary_nudged"] = True
-                self.supabase.upsert_state(state["user_id"], state["phone_number"], "awaiting_pomodoro_summary", data)
+        for states in batches:
+            for state in states:
+                requested_at = parse_ts((state.get("context_data") or {}).get("summary_requested_at"), lenient=True)
+                due_at = requested_at + timedelta(seconds=settings.POMODORO_NUDGE_SECONDS) if requested_at else None
+                self._record_fired("pomodoro_nudge", due_at, now)
+
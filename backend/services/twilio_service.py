@@ -9,8 +9,10 @@ from config import settings
 
 
 class TwilioService:
-    def __init__(self) -> None:
+    def __init__(self, http_client: httpx.AsyncClient) -> None:
         self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        # Shared, authenticated keep-alive client for Twilio API calls
+        self.http = http_client
 
     def _format_to(self, phone_number: str) -> str:
         if phone_number.startswith("whatsapp:"):
@@ -33,11 +35,9 @@ class TwilioService:
         self.client.messages.create(**payload)
 
     async def download_media_data_url(self, media_url: str) -> str:
-        auth = (settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        async with httpx.AsyncClient(auth=auth, follow_redirects=True, timeout=30) as client:
-            resp = await client.get(media_url)
-            resp.raise_for_status()
-            content_type = resp.headers.get("content-type", "image/jpeg")
-            data = resp.content
+        resp = await self.http.get(media_url, follow_redirects=True, timeout=settings.MEDIA_TIMEOUT_SECONDS)
+        resp.raise_for_status()
+        content_type = resp.headers.get("content-type", "image/jpeg")
+        data = resp.content
         b64 = base64.b64encode(data).decode("utf-8")
         return f"data:{content_type};base64,{b64}"
@@ -0,0 +1,55 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import pytest
+
+# Settings are loaded at import time; no test talks to these services
+for name, value in {
+    "OPENAI_API_KEY": "test",
+    "TWILIO_ACCOUNT_SID": "ACtest",
+    "TWILIO_AUTH_TOKEN": "test",
+    "TWILIO_WHATSAPP_NUMBER": "whatsapp:+10000000000",
+    "SUPABASE_URL": "https://test.supabase.co",
+    "SUPABASE_SECRET_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+SCHEMA = Path(__file__).resolve().parents[2] / "scripts" / "setup_supabase.sql"
+
+
+@pytest.fixture(scope="session")
+def postgres_dsn():
+    # A scratch database with scripts/setup_supabase.sql loaded, on the server
+    # TEST_DATABASE_URL points at; tests that need one are skipped without it
+    dsn = os.environ.get("TEST_DATABASE_URL")
+    if not dsn:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    asyncpg = pytest.importorskip("asyncpg")
+    name = "commit2change_test"
+    scratch = urlsplit(dsn)._replace(path=f"/{name}").geturl()
+
+    async def recreate(drop_only: bool = False) -> None:
+        admin = await asyncpg.connect(dsn)
+        try:
+            await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+            if not drop_only:
+                await admin.execute(f'CREATE DATABASE "{name}"')
+        finally:
+            await admin.close()
+
+    async def load_schema() -> None:
+        conn = await asyncpg.connect(scratch)
+        try:
+            await conn.execute(SCHEMA.read_text())
+        finally:
+            await conn.close()
+
+    asyncio.run(recreate())
+    asyncio.run(load_schema())
+    yield scratch
+    asyncio.run(recreate(drop_only=True))
@@ -0,0 +1,97 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.change_feed import ChangeFeed
+from services.timer_service import TimerService
+
+
+def _feed(on_change=None, on_connect=None) -> ChangeFeed:
+    return ChangeFeed("postgresql://unused", on_change or (lambda change: None), on_connect or (lambda: None))
+
+
+def test_payload_due_at_is_parsed_to_utc():
+    changes = []
+    feed = _feed(changes.append)
+    feed._handle(None, 0, "timer_changes", '{"table": "tasks", "id": "t1", "due_at": "2024-05-01T09:30:00Z"}')
+    feed._handle(None, 0, "timer_changes", '{"table": "tasks", "id": "t2", "due_at": "2024-05-01T09:30:00"}')
+    feed._handle(None, 0, "timer_changes", '{"table": "tasks", "id": "t3", "due_at": "soon"}')
+    feed._handle(None, 0, "timer_changes", "not json")
+    due = datetime(2024, 5, 1, 9, 30, tzinfo=timezone.utc)
+    assert [change["due_at"] for change in changes] == [due, due, None]
+
+
+async def _next_change(changes: asyncio.Queue, table: str) -> dict:
+    while True:
+        change = await asyncio.wait_for(changes.get(), 10)
+        if change["table"] == table:
+            return change
+
+
+async def _feed_round_trip(dsn: str) -> None:
+    import asyncpg
+
+    from services.postgres_service import PostgresService
+
+    storage = PostgresService(dsn)
+    admin = await asyncpg.connect(dsn)
+    timer = TimerService(storage)
+    changes: asyncio.Queue = asyncio.Queue()
+    connected = asyncio.Event()
+
+    def on_change(change: dict) -> None:
+        changes.put_nowait(change)
+        timer.on_change(change)
+
+    def on_connect() -> None:
+        connected.set()
+        timer.on_feed_connected()
+
+    feed = ChangeFeed(dsn, on_change, on_connect)
+    try:
+        feed.start()
+        await asyncio.wait_for(connected.wait(), 10)
+        user = await asyncio.to_thread(storage.create_user, f"+1555{uuid.uuid4().int % 10**7:07d}")
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+
+        cycle = await asyncio.to_thread(storage.start_pomodoro_cycle, user.id, now, 25, 5)
+        change = await _next_change(changes, "pomodoro_cycles")
+        assert change["id"] == cycle.id
+        assert change["due_at"] == now + timedelta(minutes=25)
+
+        reminder = now + timedelta(minutes=10)
+        task = await asyncio.to_thread(storage.insert_task, user.id, "Call Sam", "call sam", reminder)
+        change = await _next_change(changes, "tasks")
+        assert change["id"] == task.id
+        assert change["due_at"] == reminder
+
+        # Drop the listener; a reminder due while it is gone sends no
+        # notification anyone hears, so the reconnect has to trigger a catch-up
+        connected.clear()
+        timer._next_due = None
+        terminated = await admin.fetchval(
+            """
+            SELECT COUNT(pg_terminate_backend(pid)) FROM pg_stat_activity
+            WHERE datname = current_database() AND query ILIKE 'LISTEN%'
+            """
+        )
+        assert terminated == 1
+        missed = now - timedelta(minutes=1)
+        await asyncio.to_thread(storage.insert_task, user.id, "Missed", "missed", missed)
+
+        await asyncio.wait_for(connected.wait(), 10)
+        assert feed.connected
+        assert timer._next_due is not None and timer._next_due <= datetime.now(timezone.utc)
+        due_at = await asyncio.to_thread(storage.next_timer_due_at, 0)
+        assert due_at <= missed
+    finally:
+        await feed.stop()
+        await admin.close()
+        storage.close()
+
+
+def test_due_work_is_pushed_and_reconnect_catches_up(postgres_dsn):
+    pytest.importorskip("asyncpg")
+    asyncio.run(_feed_round_trip(postgres_dsn))
@@ -0,0 +1,115 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+
+from utils import compression
+from utils.compression import CompressionMiddleware, choose_encoding
+
+PAGE = b"<p>focus block</p>" * 100
+
+
+def _app(body_chunks: list[bytes], status: int = 200, headers: list[tuple[bytes, bytes]] | None = None):
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": headers if headers is not None else [(b"content-type", b"text/html; charset=utf-8")],
+            }
+        )
+        for index, chunk in enumerate(body_chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(body_chunks) - 1})
+
+    return app
+
+
+def _call(app, accept_encoding: str = "gzip", minimum_size: int = 500) -> list[dict]:
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size)(scope, None, send))
+    return sent
+
+
+def _headers(start: dict) -> dict[str, str]:
+    return {key.decode(): value.decode() for key, value in start["headers"]}
+
+
+@pytest.fixture
+def no_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+
+def test_choose_encoding(no_brotli):
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("br") is None
+    assert choose_encoding("") is None
+
+
+def test_choose_encoding_prefers_brotli_when_installed(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", object())
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("gzip, br;q=0") == "gzip"
+
+
+def test_large_text_body_is_gzipped(no_brotli):
+    start, body = _call(_app([PAGE]))
+    headers = _headers(start)
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(body["body"])
+    assert gzip.decompress(body["body"]) == PAGE
+
+
+@pytest.mark.parametrize(
+    "status, headers, body",
+    [
+        (200, [(b"content-type", b"text/html")], b"<p>short</p>"),
+        (200, [(b"content-type", b"image/png")], PAGE),
+        (200, [(b"content-type", b"text/html"), (b"content-encoding", b"gzip")], PAGE),
+        (304, [(b"content-type", b"text/html"), (b"etag", b'"v1"')], b""),
+    ],
+    ids=["small", "binary", "already-encoded", "not-modified"],
+)
+def test_responses_left_alone(no_brotli, status, headers, body):
+    start, sent = _call(_app([body], status, headers))
+    assert start["headers"] == headers
+    assert sent["body"] == body
+
+
+def test_client_without_accept_encoding_gets_identity(no_brotli):
+    start, body = _call(_app([PAGE]), accept_encoding="")
+    assert "content-encoding" not in _headers(start)
+    assert body["body"] == PAGE
+
+
+def test_strong_etag_is_weakened(no_brotli):
+    headers = [(b"content-type", b"text/html"), (b"etag", b'"v1"')]
+    start, _ = _call(_app([PAGE], headers=headers))
+    assert _headers(start)["etag"] == 'W/"v1"'
+
+    headers = [(b"content-type", b"text/html"), (b"etag", b'W/"v1"')]
+    start, _ = _call(_app([PAGE], headers=headers))
+    assert _headers(start)["etag"] == 'W/"v1"'
+
+
+def test_streamed_chunks_are_flushed_as_they_arrive(no_brotli):
+    chunks = [b"<header>", PAGE, b"</html>"]
+    start, *bodies = _call(_app(chunks))
+    headers = _headers(start)
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert [body["more_body"] for body in bodies] == [True, True, False]
+
+    # Each chunk decodes on its own, before the next one is sent
+    decoder = zlib.decompressobj(31)
+    for chunk, body in zip(chunks, bodies):
+        assert decoder.decompress(body["body"]) == chunk
+    assert decoder.eof
@@ -0,0 +1,261 @@
+import asyncio
+import base64
+import dataclasses
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from handlers import dashboard
+from handlers.dashboard import (
+    InvalidCursor,
+    PageCache,
+    _day_section,
+    _decode_cursor,
+    _encode_cursor,
+    _etag_matches,
+    dashboard_etag,
+    load_dashboard,
+    load_history_page,
+)
+from services.models import CalorieLog, CalorieStats, DailyRollup, PomodoroStats, TaskStats, User
+from utils.time_utils import parse_ts
+
+
+class MealStorage:
+    # Stats calls answered from a list of meals; no cycles or tasks
+    def __init__(self, logged_at: list[datetime] | None = None) -> None:
+        self.logs = [
+            CalorieLog(id=f"m{index}", meal_description="Meal", calories=500, logged_at=at)
+            for index, at in enumerate(logged_at or [])
+        ]
+        self.calls = 0
+        self.pending = False
+
+    def has_pending_writes(self, user_id: str) -> bool:
+        return self.pending
+
+    def pomodoro_stats(self, user_id: str, start_iso: str, end_iso: str, with_blocks: bool = False) -> PomodoroStats:
+        self.calls += 1
+        return PomodoroStats.from_cycles([], parse_ts(start_iso), parse_ts(end_iso), with_blocks)
+
+    def task_stats(self, user_id: str, start_iso: str, end_iso: str) -> TaskStats:
+        self.calls += 1
+        return TaskStats()
+
+    def calorie_stats(self, user_id: str, start_iso: str, end_iso: str, with_meals: bool = False) -> CalorieStats:
+        self.calls += 1
+        start, end = parse_ts(start_iso), parse_ts(end_iso)
+        return CalorieStats.from_logs([log for log in self.logs if start <= log.logged_at < end], with_meals)
+
+    def daily_rollups(self, user_id: str, start_day: date, end_day: date) -> dict[date, DailyRollup]:
+        self.calls += 1
+        days = DailyRollup.from_activity(timezone.utc, [], [], [], self.logs)
+        return {day: rollup for day, rollup in days.items() if start_day <= day <= end_day}
+
+
+USER = User(id="u1", phone_number="+15550000000", timezone="UTC")
+
+
+@pytest.fixture(autouse=True)
+def fresh_page_cache(monkeypatch):
+    monkeypatch.setattr(dashboard, "page_cache", PageCache(8))
+
+
+def test_page_cache_returns_pages_for_the_same_etag_only():
+    cache = PageCache(8)
+    cache.put("u1", 7, "e1", "<html>")
+    assert cache.get("u1", 7, "e1") == "<html>"
+    assert cache.get("u1", 7, "e2") is None
+    assert cache.get("u1", 14, "e1") is None
+
+
+def test_page_cache_evicts_least_recently_used():
+    cache = PageCache(2)
+    cache.put("u1", 7, "e", "one")
+    cache.put("u2", 7, "e", "two")
+    cache.get("u1", 7, "e")
+    cache.put("u3", 7, "e", "three")
+    assert cache.get("u2", 7, "e") is None
+    assert cache.get("u1", 7, "e") == "one"
+    assert cache.get("u3", 7, "e") == "three"
+
+
+def test_page_cache_disabled():
+    cache = PageCache(0)
+    cache.put("u1", 7, "e", "page")
+    assert cache.get("u1", 7, "e") is None
+
+
+@pytest.mark.parametrize(
+    "if_none_match, matches",
+    [
+        (None, False),
+        ("", False),
+        ('W/"abc"', True),
+        ('"abc"', True),
+        ('"other", W/"abc"', True),
+        ("*", True),
+        ('"other"', False),
+    ],
+)
+def test_etag_matches_weakly(if_none_match, matches):
+    assert _etag_matches(if_none_match, 'W/"abc"') is matches
+
+
+def test_dashboard_etag_follows_data_version_days_and_scope():
+    storage = MealStorage()
+    etag = dashboard_etag(storage, USER, 7)
+    assert etag.startswith('W/"')
+    assert dashboard_etag(storage, USER, 7) == etag
+    assert dashboard_etag(storage, dataclasses.replace(USER, data_version=1), 7) != etag
+    assert dashboard_etag(storage, USER, 14) != etag
+    assert dashboard_etag(storage, USER, 7, scope="api:2024-01-01") != etag
+
+
+def test_dashboard_etag_withheld_while_writes_are_pending():
+    storage = MealStorage()
+    storage.pending = True
+    assert dashboard_etag(storage, USER, 7) is None
+
+
+def test_revalidation_and_page_cache():
+    storage = MealStorage([datetime.now(timezone.utc)])
+    page = asyncio.run(load_dashboard(storage, USER, 7))
+    assert page.html and page.etag
+    assert storage.calls == 4
+
+    # The client's copy is current
+    revalidated = asyncio.run(load_dashboard(storage, USER, 7, if_none_match=page.etag))
+    assert revalidated.html is None
+    assert revalidated.timings[0].status == "not_modified"
+
+    # Another client, same data: served from the page cache
+    cached = asyncio.run(load_dashboard(storage, USER, 7))
+    assert cached.html == page.html
+    assert cached.timings[0].status == "hit"
+    assert storage.calls == 4
+
+    # A write bumps data_version, so the old ETag no longer matches
+    changed = dataclasses.replace(USER, data_version=1)
+    fresh = asyncio.run(load_dashboard(storage, changed, 7, if_none_match=page.etag))
+    assert fresh.html and fresh.etag != page.etag
+    assert storage.calls == 8
+
+
+def test_pages_with_pending_writes_are_not_cached():
+    storage = MealStorage()
+    storage.pending = True
+    page = asyncio.run(load_dashboard(storage, USER, 7))
+    assert page.html and page.etag is None
+    assert page.timings[-1].status == "bypass"
+    asyncio.run(load_dashboard(storage, USER, 7))
+    assert storage.calls == 8
+
+
+DAY = datetime(2024, 5, 1, tzinfo=timezone.utc)
+BLOCK = {"start": DAY, "summary": None, "minutes": 25}
+MEAL = {"description": "Oats", "calories": 300, "protein_g": 10, "carbs_g": 50, "fat_g": 5, "logged_at": DAY}
+ROLLUP = DailyRollup(DAY.date(), focus_minutes=50, focus_sessions=2, tasks_created=3, calories=800, protein_g=40.5)
+
+
+def test_tile_totals_come_from_the_rollup_and_lists_from_the_rows():
+    section = _day_section(0, DAY, timezone.utc, [BLOCK], [], [], [MEAL], ROLLUP)
+    assert (section["pomodoro"]["total_minutes"], section["pomodoro"]["count"]) == (50, 2)
+    assert [item["minutes"] for item in section["pomodoro"]["items"]] == [25]
+    assert (section["tasks"]["created_count"], section["tasks"]["created"]) == (3, [])
+    assert (section["calories"]["total_calories"], section["calories"]["protein"]) == (800, 40)
+    assert [meal["desc"] for meal in section["calories"]["meals"]] == ["Oats"]
+    assert not any(section[tile].get("partial") for tile in ("pomodoro", "tasks", "calories"))
+
+
+def test_running_cycle_focus_totals_come_from_the_rows():
+    section = _day_section(0, DAY, timezone.utc, [BLOCK], [], [], [MEAL], ROLLUP, live=True, focus_rolled_up=False)
+    assert (section["pomodoro"]["total_minutes"], section["pomodoro"]["count"]) == (25, 1)
+    assert section["calories"]["total_calories"] == 800
+
+
+def test_totals_from_one_source_when_the_other_fails():
+    rollup_only = _day_section(0, DAY, timezone.utc, None, None, None, None, ROLLUP)
+    assert rollup_only["tasks"] == {
+        "created": [],
+        "completed": [],
+        "created_count": 3,
+        "completed_count": 0,
+        "partial": True,
+    }
+    rows_only = _day_section(0, DAY, timezone.utc, [BLOCK], [], [], [MEAL])
+    assert (rows_only["pomodoro"]["total_minutes"], rows_only["calories"]["total_calories"]) == (25, 300)
+    assert _day_section(0, DAY, timezone.utc, None, None, None, None)["calories"] is None
+
+
+def _history(storage: MealStorage, user: User, days: int) -> list[list[str]]:
+    pages, cursor = [], None
+    while True:
+        page = asyncio.run(load_history_page(storage, user, days, cursor))
+        pages.append([day["date"] for day in page.days])
+        if page.next_cursor is None:
+            return pages
+        cursor = page.next_cursor
+        assert len(pages) < 20
+
+
+def test_cursor_round_trip():
+    cursor = _encode_cursor(date(2024, 2, 29))
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert _decode_cursor(cursor) == date(2024, 2, 29)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        base64.urlsafe_b64encode(b"v2:2024-01-01").decode(),
+        base64.urlsafe_b64encode(b"v1:yesterday").decode(),
+        base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+        "2024-01-01",
+    ],
+)
+def test_invalid_cursors(cursor):
+    with pytest.raises(InvalidCursor):
+        _decode_cursor(cursor)
+
+
+def test_history_pages_end_at_the_sign_up_day():
+    today = datetime.now(timezone.utc).date()
+    user = dataclasses.replace(USER, created_at=datetime.now(timezone.utc) - timedelta(days=10))
+    pages = _history(MealStorage(), user, 4)
+
+    assert [len(page) for page in pages] == [4, 4, 3]
+    dates = [day for page in pages for day in page]
+    assert dates == [(today - timedelta(days=offset)).isoformat() for offset in range(11)]
+
+
+def test_history_without_a_sign_up_day_ends_at_an_empty_page():
+    now = datetime.now(timezone.utc)
+    storage = MealStorage([now, now - timedelta(days=5)])
+    assert [len(page) for page in _history(storage, USER, 3)] == [3, 3, 3]
+
+
+def test_cursor_in_the_future_starts_today():
+    today = datetime.now(timezone.utc).date()
+    page = asyncio.run(load_history_page(MealStorage(), USER, 2, _encode_cursor(today + timedelta(days=5))))
+    assert [day["date"] for day in page.days] == [today.isoformat(), (today - timedelta(days=1)).isoformat()]
+    assert "label" not in page.days[0] and "index" not in page.days[0]
+
+
+def test_history_page_revalidation():
+    storage = MealStorage()
+    cursor = _encode_cursor(datetime.now(timezone.utc).date() - timedelta(days=7))
+    page = asyncio.run(load_history_page(storage, USER, 7, cursor))
+    assert page.etag
+    assert page.etag != asyncio.run(load_history_page(storage, USER, 7)).etag
+
+    calls = storage.calls
+    revalidated = asyncio.run(load_history_page(storage, USER, 7, cursor, if_none_match=page.etag))
+    assert revalidated.days is None and revalidated.etag == page.etag
+    assert storage.calls == calls
+
+
+def test_history_page_rejects_invalid_cursor():
+    with pytest.raises(InvalidCursor):
+        asyncio.run(load_history_page(MealStorage(), USER, 7, "bogus"))
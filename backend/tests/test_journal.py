@@ -0,0 +1,188 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from config import settings
+from services.journal import JournaledStorage, WriteJournal, wait_for_journal
+from services.storage import RowNotFound
+
+
+class RecordingStorage:
+    def __init__(self, failures: int = 0) -> None:
+        self.query_count = 0
+        self.failures = failures
+        self.states: list[tuple[str, str | None]] = []
+
+    def close(self) -> None:
+        pass
+
+    def upsert_state(self, user_id: str, phone_number: str, context: str | None, context_data: dict) -> dict:
+        if self.failures:
+            self.failures -= 1
+            raise OSError("storage unavailable")
+        self.states.append((user_id, context))
+        return {}
+
+    def clear_state(self, user_id: str) -> None:
+        self.states.append((user_id, None))
+
+    def complete_task(self, task_id: str, completed_at=None):
+        raise RowNotFound(f"No task {task_id}")
+
+
+def _seqs(journal: WriteJournal) -> list[int]:
+    return [entry["seq"] for entry in journal.recovered]
+
+
+def _append(directory, *ops: str) -> None:
+    journal = WriteJournal(str(directory), fsync_interval_ms=1)
+    for op in ops:
+        journal.append(op, {"user_id": "u1"})
+    journal.close()
+
+
+def _checkpoint(directory) -> int:
+    path = directory / "checkpoint"
+    return int(path.read_text()) if path.exists() else 0
+
+
+def _wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_restart_recovers_unapplied_entries(tmp_path):
+    _append(tmp_path, "clear_state", "clear_state")
+
+    journal = WriteJournal(str(tmp_path))
+    assert _seqs(journal) == [1, 2]
+    assert journal.append("clear_state", {"user_id": "u1"})["seq"] == 3
+    journal.close()
+
+
+def test_torn_tail_is_truncated_so_later_appends_survive(tmp_path):
+    _append(tmp_path, "clear_state", "clear_state")
+    (segment,) = tmp_path.glob("*.log")
+    with open(segment, "ab") as handle:
+        handle.write(b'0badc0de {"op":"clear_st')
+
+    journal = WriteJournal(str(tmp_path), fsync_interval_ms=1)
+    assert _seqs(journal) == [1, 2]
+    journal.append("clear_state", {"user_id": "u1"})
+    journal.close()
+
+    journal = WriteJournal(str(tmp_path))
+    assert _seqs(journal) == [1, 2, 3]
+    journal.close()
+
+
+def test_torn_record_at_the_start_of_the_reopened_segment(tmp_path):
+    # A crash right after rotating leaves a segment named for the next seq,
+    # which is the segment the restarted journal appends to
+    _append(tmp_path, "clear_state", "clear_state")
+    (tmp_path / "checkpoint").write_text("2")
+    (tmp_path / f"{3:016d}.log").write_bytes(b"torn")
+
+    journal = WriteJournal(str(tmp_path), fsync_interval_ms=1)
+    assert _seqs(journal) == []
+    journal.append("clear_state", {"user_id": "u1"})
+    journal.close()
+
+    journal = WriteJournal(str(tmp_path))
+    assert _seqs(journal) == [3]
+    journal.close()
+
+
+def test_segments_rotate_and_checkpoint_drops_applied_ones(tmp_path):
+    journal = WriteJournal(str(tmp_path), segment_bytes=1, fsync_interval_ms=1)
+    for _ in range(3):
+        journal.append("clear_state", {"user_id": "u1"})
+    assert len(list(tmp_path.glob("*.log"))) == 4
+    journal.checkpoint(2)
+    journal.close()
+
+    assert _checkpoint(tmp_path) == 2
+    assert [path.stem for path in sorted(tmp_path.glob("*.log"))] == [f"{seq:016d}" for seq in (3, 4)]
+    journal = WriteJournal(str(tmp_path))
+    assert _seqs(journal) == [3]
+    journal.close()
+
+
+def test_appends_on_the_event_loop_do_not_wait_for_fsync(tmp_path):
+    journal = WriteJournal(str(tmp_path), fsync_interval_ms=300)
+    storage = JournaledStorage(RecordingStorage(), journal)
+
+    async def handle_message() -> float:
+        started = time.perf_counter()
+        storage.upsert_state("u1", "+1", "a", {})
+        appended = time.perf_counter() - started
+        assert journal._synced_seq == 0
+        await wait_for_journal(storage)
+        assert journal._synced_seq == 1
+        return appended
+
+    assert asyncio.run(handle_message()) < 0.2
+    storage.close()
+
+
+def test_second_process_cannot_open_the_directory(tmp_path):
+    journal = WriteJournal(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        WriteJournal(str(tmp_path))
+    journal.close()
+
+
+def test_replay_applies_recovered_entries_in_order(tmp_path):
+    journal = WriteJournal(str(tmp_path), fsync_interval_ms=1)
+    for context in ("a", "b"):
+        journal.append(
+            "upsert_state", {"user_id": "u1", "phone_number": "+1", "context": context, "context_data": {}}
+        )
+    journal.append("clear_state", {"user_id": "u1"})
+    journal.close()
+
+    inner = RecordingStorage()
+    storage = JournaledStorage(inner, WriteJournal(str(tmp_path)))
+    _wait_for(lambda: _checkpoint(tmp_path) == 3)
+    storage.close()
+
+    assert inner.states == [("u1", "a"), ("u1", "b"), ("u1", None)]
+    journal = WriteJournal(str(tmp_path))
+    assert _seqs(journal) == []
+    journal.close()
+
+
+def test_replay_retries_until_storage_accepts(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOURNAL_RETRY_SECONDS", 0.01)
+    inner = RecordingStorage(failures=2)
+    storage = JournaledStorage(inner, WriteJournal(str(tmp_path), fsync_interval_ms=1))
+    storage.upsert_state("u1", "+1", "a", {})
+    # Reads see the write before storage has it
+    assert storage.get_state("u1")["current_context"] == "a"
+    _wait_for(lambda: inner.states == [("u1", "a")])
+    storage.close()
+
+
+def test_replay_skips_updates_to_missing_rows(tmp_path, monkeypatch):
+    # Retrying can't make the task exist, and holding the entry back would
+    # stall every write queued behind it
+    monkeypatch.setattr(settings, "JOURNAL_RETRY_SECONDS", 60)
+    journal = WriteJournal(str(tmp_path), fsync_interval_ms=1)
+    journal.append(
+        "complete_task", {"task_id": "t1", "user_id": "u1", "completed_at": "2024-01-01T00:00:00+00:00"}
+    )
+    journal.append("clear_state", {"user_id": "u2"})
+    journal.close()
+
+    inner = RecordingStorage()
+    storage = JournaledStorage(inner, WriteJournal(str(tmp_path)))
+    _wait_for(lambda: _checkpoint(tmp_path) == 2)
+    storage.close()
+
+    assert inner.states == [("u2", None)]
+    (rejected,) = (tmp_path / "rejected.jsonl").read_text().splitlines()
+    assert json.loads(rejected)["op"] == "complete_task"
@@ -0,0 +1,81 @@
+import asyncio
+
+from config import settings
+from services import outbox_drainer
+from services.outbound_dispatcher import OutboundDispatcher, OutboundSendError
+from services.outbox_drainer import OutboxDrainer
+
+
+class OutboxStorage:
+    def __init__(self, batch: list[dict]) -> None:
+        self.batch = batch
+        self.recorded: list[list[dict]] = []
+        self.extended: list[list[str]] = []
+
+    def claim_outbound_messages(self, worker_id, batch_size, lease_seconds, now):
+        batch, self.batch = self.batch, []
+        return batch
+
+    def extend_outbound_claims(self, worker_id, message_ids, lease_seconds, now):
+        self.extended.append(sorted(message_ids))
+        return len(message_ids)
+
+    def record_outbound_results(self, worker_id, results, max_attempts, retry_after_seconds):
+        self.recorded.append(sorted(results, key=lambda result: result["id"]))
+        return len(results)
+
+
+class ManualDispatcher:
+    # Hands back futures the test resolves itself
+    def __init__(self) -> None:
+        self.futures: dict[str, asyncio.Future] = {}
+
+    def enqueue(self, phone_number, body, media_url=None, priority=None):
+        future = self.futures[phone_number] = asyncio.get_running_loop().create_future()
+        return future
+
+
+def _message(index: int) -> dict:
+    return {"id": f"m{index}", "phone_number": f"+1555000000{index}", "body": "Break's over", "priority": 1}
+
+
+async def _drain_slow_batch(storage: OutboxStorage, outbound: ManualDispatcher) -> None:
+    drain = asyncio.create_task(OutboxDrainer(storage, outbound).drain_once())
+    await asyncio.sleep(0.05)
+    outbound.futures["+15550000000"].set_result("SM1")
+    outbound.futures["+15550000001"].set_exception(OutboundSendError("Twilio returned 400", retryable=False))
+    await asyncio.sleep(0.1)
+
+    # The fast sends are recorded while the slow one is still going
+    assert storage.recorded == [
+        [
+            {"id": "m0", "provider_sid": "SM1"},
+            {"id": "m1", "error": "Twilio returned 400", "retryable": False},
+        ]
+    ]
+    await asyncio.sleep(0.5)
+    assert storage.extended and set(map(tuple, storage.extended)) == {("m2",)}
+
+    outbound.futures["+15550000002"].set_result("SM3")
+    assert await drain == 3
+    assert storage.recorded[-1] == [{"id": "m2", "provider_sid": "SM3"}]
+
+
+def test_results_are_recorded_as_sends_finish(monkeypatch):
+    monkeypatch.setattr(outbox_drainer, "RECORD_INTERVAL_SECONDS", 0.02)
+    monkeypatch.setattr(settings, "OUTBOX_LEASE_SECONDS", 1)
+    storage = OutboxStorage([_message(index) for index in range(3)])
+    asyncio.run(_drain_slow_batch(storage, ManualDispatcher()))
+
+
+def test_backoff_fits_inside_the_outbox_lease(monkeypatch):
+    dispatcher = OutboundDispatcher(workers=1)
+    assert dispatcher._backoff(0, "3600") == settings.OUTBOUND_MAX_BACKOFF_SECONDS
+    assert dispatcher._backoff(10, None) == settings.OUTBOUND_MAX_BACKOFF_SECONDS
+    assert dispatcher._backoff(0, "2") == 2.0
+
+    # A lease too short for the configured cap shrinks the waits instead
+    monkeypatch.setattr(settings, "OUTBOX_LEASE_SECONDS", 70)
+    delays = [dispatcher._backoff(attempt, "3600") for attempt in range(settings.OUTBOUND_MAX_RETRIES)]
+    tries = settings.OUTBOUND_MAX_RETRIES + 1
+    assert tries * settings.OUTBOUND_TIMEOUT_SECONDS + sum(delays) <= settings.OUTBOX_LEASE_SECONDS
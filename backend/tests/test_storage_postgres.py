@@ -0,0 +1,130 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.storage import RowNotFound
+
+# The round trips journal replay relies on, against a real Postgres:
+# TEST_DATABASE_URL=postgresql://localhost/postgres python -m pytest tests
+
+
+@pytest.fixture(scope="module")
+def storage(postgres_dsn):
+    from services.postgres_service import PostgresService
+
+    storage = PostgresService(postgres_dsn)
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def user(storage):
+    return storage.create_user(f"+1555{uuid.uuid4().int % 10**7:07d}")
+
+
+def test_inserting_a_client_id_twice_keeps_one_row(storage, user):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    cycle_id, task_id, log_id = (str(uuid.uuid4()) for _ in range(3))
+    for _ in range(2):
+        cycle = storage.start_pomodoro_cycle(user.id, now, 25, 5, cycle_id=cycle_id)
+        task = storage.insert_task(user.id, "Write report", "write report", None, task_id=task_id, created_at=now)
+        log = storage.insert_calorie_log(
+            user.id, "Oats", 300, 10.0, 50.0, 5.0, 8.0, True, log_id=log_id, logged_at=now
+        )
+        assert (cycle.id, task.id, log.id) == (cycle_id, task_id, log_id)
+
+    day = (now - timedelta(days=1)).isoformat(), (now + timedelta(days=1)).isoformat()
+    assert [c.id for c in storage.iter_pomodoro_cycles(user.id, *day)] == [cycle_id]
+    assert [t.id for t in storage.iter_tasks_created(user.id, *day)] == [task_id]
+    assert [m.id for m in storage.iter_calorie_logs(user.id, *day)] == [log_id]
+
+
+def test_replayed_stop_leaves_a_later_cycle_running(storage, user):
+    now = datetime.now(timezone.utc)
+    first = storage.start_pomodoro_cycle(user.id, now - timedelta(minutes=10), 25, 5)
+    assert [c.id for c in storage.stop_pomodoro_cycles(user.id, now - timedelta(minutes=5))] == [first.id]
+    second = storage.start_pomodoro_cycle(user.id, now, 25, 5)
+    assert storage.stop_pomodoro_cycles(user.id, now - timedelta(minutes=5)) == []
+    assert [c.id for c in storage.stop_pomodoro_cycles(user.id, now)] == [second.id]
+
+
+def test_pagination_crosses_page_boundaries_without_gaps(storage, user):
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+    # Pairs share created_at, so the (created_at, id) cursor has to break ties
+    created = [start + timedelta(minutes=index // 2) for index in range(7)]
+    ids = [storage.insert_task(user.id, f"Task {i}", "", None, created_at=at).id for i, at in enumerate(created)]
+
+    window = (start - timedelta(minutes=1)).isoformat(), (start + timedelta(hours=1)).isoformat()
+    tasks = list(storage.iter_tasks_created(user.id, *window, page_size=2))
+    assert sorted(task.id for task in tasks) == sorted(ids)
+    assert [(task.created_at, task.id) for task in tasks] == sorted((task.created_at, task.id) for task in tasks)
+    assert len(list(storage.iter_incomplete_tasks(user.id, page_size=3))) == 7
+
+
+def test_update_user(storage, user):
+    updated = storage.update_user(
+        user.id, {"name": "Ada", "timezone": "Europe/London", "default_break_minutes": 0, "features_enabled": ["tasks"]}
+    )
+    assert (updated.name, updated.timezone, updated.default_break_minutes) == ("Ada", "Europe/London", 0)
+    assert updated.features_enabled == ["tasks"]
+    assert storage.get_user_by_phone(user.phone_number) == updated
+
+    with pytest.raises(ValueError):
+        storage.update_user(user.id, {"id": str(uuid.uuid4())})
+    with pytest.raises(RowNotFound):
+        storage.update_user(str(uuid.uuid4()), {"name": "Nobody"})
+    with pytest.raises(RowNotFound):
+        storage.complete_task(str(uuid.uuid4()))
+
+
+def test_get_or_create_user_is_one_user_per_phone(storage):
+    phone = f"+1555{uuid.uuid4().int % 10**7:07d}"
+    with ThreadPoolExecutor(4) as pool:
+        users = list(pool.map(lambda _: storage.get_or_create_user(phone), range(8)))
+    assert len({user.id for user in users}) == 1
+    assert storage.get_or_create_user(phone).id == users[0].id
+
+
+def test_jsonb_round_trips_through_queries_and_copy(storage, user):
+    data = {"cycle_id": str(uuid.uuid4()), "block": 2, "nested": {"ok": True}}
+    assert storage.upsert_state(user.id, user.phone_number, "awaiting_pomodoro_summary", data)["context_data"] == data
+    assert storage.get_state(user.id)["context_data"] == data
+
+    other = storage.create_user(f"+1555{uuid.uuid4().int % 10**7:07d}")
+    rows = [{"user_id": other.id, "phone_number": other.phone_number, "current_context": "idle", "context_data": data}]
+    assert storage.bulk_insert("conversation_state", rows) == 1
+    assert storage.get_state(other.id) == {"current_context": "idle", "context_data": data}
+
+
+def test_try_timestamptz_reads_malformed_values_as_null(storage):
+    parsed = {
+        value: storage._fetchval("SELECT try_timestamptz($1)", value)
+        for value in ["2024-05-01T09:30:00.123456+00:00", "2024-05-01T09:30:00Z", "2024-02-30T09:30:00Z", "yesterday"]
+    }
+    assert parsed == {
+        "2024-05-01T09:30:00.123456+00:00": datetime(2024, 5, 1, 9, 30, 0, 123456, tzinfo=timezone.utc),
+        "2024-05-01T09:30:00Z": datetime(2024, 5, 1, 9, 30, tzinfo=timezone.utc),
+        "2024-02-30T09:30:00Z": None,
+        "yesterday": None,
+    }
+
+
+def test_malformed_summary_prompts_are_skipped_not_fatal(storage):
+    now = datetime.now(timezone.utc)
+    requested = (now - timedelta(hours=1)).isoformat()
+    prompts = {
+        "due": {"summary_requested_at": requested, "summary_nudged": False},
+        "nudged": {"summary_requested_at": requested, "summary_nudged": True},
+        "odd flag": {"summary_requested_at": requested, "summary_nudged": "maybe"},
+        "bad date": {"summary_requested_at": "2024-02-30T09:30:00Z"},
+        "not a date": {"summary_requested_at": "yesterday"},
+    }
+    names = {}
+    for name, data in prompts.items():
+        user = storage.create_user(f"+1555{uuid.uuid4().int % 10**7:07d}")
+        storage.upsert_state(user.id, user.phone_number, "awaiting_pomodoro_summary", data)
+        names[user.id] = name
+    fired = storage.fire_due_nudges(1000, 600, now)
+    assert sorted(names[str(row["user_id"])] for row in fired if str(row["user_id"]) in names) == ["due", "odd flag"]
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import zlib
+from typing import Any, Awaitable, Callable
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Optional: without it (`pip install brotli`), responses are gzip only
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+Message = dict[str, Any]
+Send = Callable[[Message], Awaitable[None]]
+
+COMPRESSIBLE_TYPES = ("text/html", "text/css", "text/plain", "application/json", "application/javascript")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # past 5, brotli gets much slower for little gain on pages rendered per request
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    # br when the client takes it and brotli is installed, else gzip
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    for coding in ("br", "gzip"):
+        if coding == "br" and brotli is None:
+            continue
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+class _Gzip:
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH if more else zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self) -> None:
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + (self._compressor.flush() if more else self._compressor.finish())
+
+
+class CompressionMiddleware:
+    # gzip/brotli for text responses of at least minimum_size bytes. Streamed
+    # bodies are compressed chunk by chunk and flushed after each one, so every
+    # chunk still reaches the client as soon as it is sent.
+    def __init__(self, app: Any, minimum_size: int = 500) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: dict, receive: Callable, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    def __init__(self, send: Send, encoding: str, minimum_size: int) -> None:
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Message | None = None
+        self.compressor: _Gzip | _Brotli | None = None
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Held until the first body chunk shows whether to compress
+            self.start = message
+        elif message["type"] != "http.response.body":
+            if self.start is not None:
+                start, self.start = self.start, None
+                await self.send(start)
+            await self.send(message)
+        elif self.start is not None:
+            start, self.start = self.start, None
+            await self._begin(start, message)
+        else:
+            if self.compressor:
+                more = message.get("more_body", False)
+                message = {**message, "body": self.compressor.compress(message.get("body", b""), more)}
+            await self.send(message)
+
+    async def _begin(self, start: Message, message: Message) -> None:
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        headers = MutableHeaders(raw=list(start.get("headers", [])))
+        media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if (
+            "content-encoding" in headers
+            or media_type not in COMPRESSIBLE_TYPES
+            or start["status"] in (204, 304)
+            or (not more and len(body) < self.minimum_size)
+        ):
+            await self.send(start)
+            await self.send(message)
+            return
+        self.compressor = _Brotli() if self.encoding == "br" else _Gzip()
+        body = self.compressor.compress(body, more)
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # The compressed bytes differ from what a strong ETag names
+            headers["ETag"] = f"W/{etag}"
+        if more:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(body))
+        await self.send({**start, "headers": headers.raw})
+        await self.send({**message, "body": body})
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Any
+
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# Up to a full timer tick: TIMER_BATCH_SIZE x TIMER_MAX_BATCHES_PER_TICK (2000)
+COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2000)
+
+
+def _key(name: str, labels: dict[str, str] | None) -> tuple:
+    return (name, tuple(sorted((labels or {}).items())))
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS_MS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{f"le_{bound}": count for bound, count in zip(self.buckets, self.counts)},
+                "inf": self.counts[-1],
+            },
+        }
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[tuple, float] = {}
+        self._gauges: dict[tuple, float] = {}
+        self._histograms: dict[tuple, Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, labels: dict[str, str] | None = None) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, labels: dict[str, str] | None = None) -> None:
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: dict[str, str] | None = None,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS_MS,
+    ) -> None:
+        # buckets only applies when the histogram is first created
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def snapshot(self) -> dict[str, list[dict[str, Any]]]:
+        with self._lock:
+            return {
+                "counters": [_entry(key, {"value": value}) for key, value in self._counters.items()],
+                "gauges": [_entry(key, {"value": value}) for key, value in self._gauges.items()],
+                "histograms": [_entry(key, hist.snapshot()) for key, hist in self._histograms.items()],
+            }
+
+
+def _entry(key: tuple, values: dict[str, Any]) -> dict[str, Any]:
+    name, labels = key
+    return {"name": name, "labels": dict(labels), **values}
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import math
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from services.models import PomodoroCycle
+
+
+def _period(cycle: PomodoroCycle) -> timedelta:
+    return timedelta(minutes=cycle.work_minutes + cycle.break_minutes)
+
+
+def block_index_at(cycle: PomodoroCycle, at: datetime) -> int:
+    # Index of the work block that started most recently at `at`
+    period = _period(cycle)
+    if at <= cycle.started_at or period.total_seconds() <= 0:
+        return 0
+    return int((at - cycle.started_at) / period)
+
+
+def work_blocks(
+    cycle: PomodoroCycle,
+    range_start: datetime | None = None,
+    range_end: datetime | None = None,
+    now: datetime | None = None,
+) -> list[dict[str, Any]]:
+    # Work blocks whose start falls inside [range_start, range_end]. Phase
+    # boundaries come from started_at and the work/break lengths; the last
+    # block is cut short at stopped_at (or now while the cycle is running).
+    started = cycle.started_at
+    work = timedelta(minutes=cycle.work_minutes)
+    period = _period(cycle)
+    limit = cycle.stopped_at or now or datetime.now(timezone.utc)
+    summaries = cycle.summaries
+
+    first = 0
+    if range_start is not None and range_start > started and period.total_seconds() > 0:
+        first = math.ceil((range_start - started) / period)
+    blocks: list[dict[str, Any]] = []
+    index = first
+    while True:
+        block_start = started + period * index
+        if range_end is not None and block_start > range_end:
+            break
+        if block_start > limit or (block_start == limit and index > 0):
+            break
+        block_end = min(block_start + work, limit)
+        blocks.append(
+            {
+                "index": index,
+                "start": block_start,
+                "end": block_end,
+                "minutes": max(int((block_end - block_start).total_seconds() / 60), 0),
+                "summary": summaries.get(str(index)),
+            }
+        )
+        if period.total_seconds() <= 0:
+            break
+        index += 1
+    return blocks
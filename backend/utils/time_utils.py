@@ -1,12 +1,41 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
 
+def parse_ts(value: str | datetime | None, lenient: bool = False) -> datetime | None:
+    # ISO 8601 in, timezone-aware out (naive values are UTC). lenient reads a
+    # malformed value as None instead of raising, for data that may be stale
+    # or hand-edited
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        if lenient:
+            return None
+        raise
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
 def day_range_utc(tz_name: str) -> tuple[str, str]:
     tz = ZoneInfo(tz_name)
     now = datetime.now(tz)
     start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     end = start + timedelta(days=1)
     return start.astimezone(timezone.utc).isoformat(), end.astimezone(timezone.utc).isoformat()
+
+
+def local_today(tz_name: str) -> date:
+    return datetime.now(ZoneInfo(tz_name)).date()
+
+
+def days_range_utc(start_day: date, end_day: date, tz_name: str) -> tuple[str, str]:
+    # From the start of start_day to the start of the day after end_day, local time
+    tz = ZoneInfo(tz_name)
+    start = datetime.combine(start_day, datetime.min.time(), tz)
+    end = datetime.combine(end_day + timedelta(days=1), datetime.min.time(), tz)
+    return start.astimezone(timezone.utc).isoformat(), end.astimezone(timezone.utc).isoformat()
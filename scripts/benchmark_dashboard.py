@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+# Times the dashboard data fetch as a function of `days`: the old per-day
+# shape (three stats calls per day) against build_day_sections (three calls
+# for the whole window, bucketed into days locally) and load_day_sections (the
+# same three calls plus the daily rollups, run concurrently, as the dashboard
+# page does), and checks
+# all of them produce the same sections. Then times the first byte and first
+# content (today's section) of the whole page, buffered and streamed, and pages
+# back through --history-days of history the way /api/dashboard does, with the
+# calls and time of each page. Run from backend/ so config picks up .env:
+#
+#   python ../scripts/benchmark_dashboard.py                      # synthetic data, simulated round trips
+#   python ../scripts/benchmark_dashboard.py --phone +15551234567 # a real user on the configured backend
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from handlers.dashboard import (  # noqa: E402
+    _day_section,
+    _safe_timezone,
+    build_day_sections,
+    load_dashboard,
+    load_day_sections,
+    load_history_page,
+    page_cache,
+)
+from services.models import (  # noqa: E402
+    CalorieLog,
+    CalorieStats,
+    DailyRollup,
+    PomodoroCycle,
+    PomodoroStats,
+    Task,
+    TaskStats,
+    User,
+)
+from utils.time_utils import parse_ts  # noqa: E402
+
+
+class SyntheticStorage:
+    # In-memory history for one user; every stats call sleeps for one
+    # simulated round trip, plus row_us for each row it returns
+    def __init__(
+        self, days: int, latency_ms: float, seed: int = 7, row_us: float = 0.0, tz_name: str = "UTC"
+    ) -> None:
+        self.latency = latency_ms / 1000
+        self.tz = ZoneInfo(tz_name)
+        self.row_cost = row_us / 1_000_000
+        self.calls = 0
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        self.cycles: list[PomodoroCycle] = []
+        self.tasks: list[Task] = []
+        self.logs: list[CalorieLog] = []
+        for day in range(days + 1):
+            base = now - timedelta(days=day)
+            for k in range(3):
+                started = base.replace(hour=8 + 3 * k) + timedelta(seconds=rng.randint(1, 3000))
+                blocks = rng.randint(1, 4)
+                self.cycles.append(
+                    PomodoroCycle(
+                        id=f"c{day}-{k}",
+                        user_id="u",
+                        started_at=started,
+                        work_minutes=25,
+                        break_minutes=5,
+                        stopped_at=started + timedelta(minutes=30 * blocks - rng.randint(0, 10)),
+                        summaries={str(i): f"Deep work {i}" for i in range(blocks) if rng.random() < 0.6},
+                    )
+                )
+            for k in range(2):
+                created = base.replace(hour=9 + 4 * k) + timedelta(seconds=rng.randint(1, 3000))
+                done = rng.random() < 0.5
+                self.tasks.append(
+                    Task(
+                        id=f"t{day}-{k}",
+                        title=f"Task {day}.{k}",
+                        completed=done,
+                        completed_at=created + timedelta(hours=rng.randint(1, 30)) if done else None,
+                        created_at=created,
+                    )
+                )
+            for k in range(3):
+                self.logs.append(
+                    CalorieLog(
+                        id=f"m{day}-{k}",
+                        meal_description=f"Meal {k}",
+                        calories=rng.randint(200, 900),
+                        protein_g=rng.uniform(5, 50),
+                        carbs_g=rng.uniform(10, 90),
+                        fat_g=rng.uniform(2, 40),
+                        logged_at=base.replace(hour=7 + 5 * k) + timedelta(seconds=rng.randint(1, 3000)),
+                    )
+                )
+
+    def _round_trip(self, rows: int) -> None:
+        self.calls += 1
+        time.sleep(self.latency + rows * self.row_cost)
+
+    def pomodoro_stats(self, user_id: str, start_iso: str, end_iso: str, with_blocks: bool = False) -> PomodoroStats:
+        start, end = parse_ts(start_iso), parse_ts(end_iso)
+        cycles = [c for c in self.cycles if c.started_at <= end and (c.stopped_at is None or c.stopped_at >= start)]
+        self._round_trip(len(cycles))
+        return PomodoroStats.from_cycles(cycles, start, end, with_blocks)
+
+    def task_stats(self, user_id: str, start_iso: str, end_iso: str) -> TaskStats:
+        start, end = parse_ts(start_iso), parse_ts(end_iso)
+        created = [t for t in self.tasks if start <= t.created_at <= end]
+        completed = [t for t in self.tasks if t.completed_at and start <= t.completed_at <= end]
+        self._round_trip(len(created) + len(completed))
+        return TaskStats(
+            created=sorted(created, key=lambda t: (t.created_at, t.id)),
+            completed=sorted(completed, key=lambda t: (t.completed_at, t.id)),
+        )
+
+    def calorie_stats(self, user_id: str, start_iso: str, end_iso: str, with_meals: bool = False) -> CalorieStats:
+        start, end = parse_ts(start_iso), parse_ts(end_iso)
+        logs = sorted((log for log in self.logs if start <= log.logged_at <= end), key=lambda log: log.logged_at)
+        self._round_trip(len(logs))
+        return CalorieStats.from_logs(logs, with_meals)
+
+    def daily_rollups(self, user_id: str, start_day: date, end_day: date) -> dict[date, DailyRollup]:
+        # What the rollup triggers would hold; logs in time order so the macro
+        # sums add up exactly as the rows' do
+        days = DailyRollup.from_activity(
+            self.tz, self.cycles, self.tasks, self.tasks, sorted(self.logs, key=lambda log: log.logged_at)
+        )
+        days = {day: rollup for day, rollup in days.items() if start_day <= day <= end_day}
+        self._round_trip(len(days))
+        return days
+
+
+def per_day_sections(storage, user: User, days: int) -> list[dict]:
+    # The shape build_day_sections had before: every tile queried per day
+    tz = _safe_timezone(user.timezone)
+    today = datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    sections = []
+    for index in range(days):
+        day_start = today - timedelta(days=index)
+        start_iso = day_start.astimezone(timezone.utc).isoformat()
+        end_iso = (day_start + timedelta(days=1)).astimezone(timezone.utc).isoformat()
+        pomodoro = storage.pomodoro_stats(user.id, start_iso, end_iso, with_blocks=True)
+        tasks = storage.task_stats(user.id, start_iso, end_iso)
+        calories = storage.calorie_stats(user.id, start_iso, end_iso, with_meals=True)
+        sections.append(
+            _day_section(
+                index,
+                day_start,
+                tz,
+                pomodoro.blocks or [],
+                tasks.created,
+                tasks.completed,
+                calories.meals or [],
+                live=index == 0 and pomodoro.running,
+            )
+        )
+    return sections
+
+
+def concurrent_sections(storage, user: User, days: int) -> list[dict]:
+    sections, _ = asyncio.run(load_day_sections(storage, user, days, timeout=60))
+    return sections
+
+
+async def _deliver(storage, user: User, days: int, stream: bool) -> tuple[float, float, str]:
+    # (first byte ms, first content ms, page) as the client would see them
+    started = time.perf_counter()
+    page = await load_dashboard(storage, user, days, stream=stream, started=started)
+    if page.stream is None:
+        at = (time.perf_counter() - started) * 1000
+        return at, at, page.html
+    chunks = []
+    arrivals = []
+    async for chunk in page.stream:
+        chunks.append(chunk)
+        arrivals.append((time.perf_counter() - started) * 1000)
+    # The shell, then today's section
+    return arrivals[0], arrivals[1], "".join(chunks)
+
+
+def _time_delivery(storage, user: User, days: int, runs: int, stream: bool) -> tuple[float, float, str]:
+    results = [asyncio.run(_deliver(storage, user, days, stream)) for _ in range(runs)]
+    return (
+        statistics.median(result[0] for result in results),
+        statistics.median(result[1] for result in results),
+        results[-1][2],
+    )
+
+
+def _page_history(storage, user: User, history_days: int, page_days: int) -> list[dict]:
+    # Each page should cost the same calls and about the same time, however old
+    print(f"\n{'page':>5}  {'newest':>10}  {'oldest':>10}  {'calls':>5}  {'ms':>7}")
+    pages = []
+    cursor = None
+    while sum(page["days"] for page in pages) < history_days:
+        calls = getattr(storage, "calls", 0)
+        started = time.perf_counter()
+        page = asyncio.run(load_history_page(storage, user, page_days, cursor))
+        duration_ms = (time.perf_counter() - started) * 1000
+        calls = getattr(storage, "calls", 0) - calls
+        newest, oldest = page.days[0]["date"], page.days[-1]["date"]
+        print(f"{len(pages) + 1:>5}  {newest:>10}  {oldest:>10}  {calls:>5}  {duration_ms:>7.1f}")
+        pages.append({"newest": newest, "oldest": oldest, "days": len(page.days), "calls": calls, "ms": duration_ms})
+        cursor = page.next_cursor
+        if not cursor:
+            break
+    return pages
+
+
+def _time(build, storage, user: User, days: int, runs: int) -> tuple[float, int, list[dict]]:
+    timings = []
+    calls_before = getattr(storage, "calls", getattr(storage, "query_count", 0))
+    for _ in range(runs):
+        started = time.perf_counter()
+        sections = build(storage, user, days)
+        timings.append((time.perf_counter() - started) * 1000)
+    calls = (getattr(storage, "calls", getattr(storage, "query_count", 0)) - calls_before) // runs
+    return statistics.median(timings), calls, sections
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark dashboard data fetching against the number of days shown")
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 7, 14, 30, 60])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per measurement (median reported)")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Simulated round trip (synthetic data only)")
+    parser.add_argument("--history-days", type=int, default=90, help="History to page back through")
+    parser.add_argument("--page-days", type=int, default=30, help="Days per history page")
+    parser.add_argument("--row-us", type=float, default=0.0, help="Simulated cost per row returned (synthetic data only)")
+    parser.add_argument("--timezone", default="America/New_York", help="User timezone (synthetic data only)")
+    parser.add_argument("--phone", help="Benchmark this user's real data on the configured storage backend")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.phone:
+        from services.storage import create_storage
+
+        storage = create_storage()
+        user = storage.get_user_by_phone(args.phone)
+        if not user:
+            raise SystemExit(f"No user with phone number {args.phone}")
+    else:
+        history_days = max(*args.days, args.history_days)
+        storage = SyntheticStorage(history_days, args.latency_ms, row_us=args.row_us, tz_name=args.timezone)
+        signed_up = datetime.now(timezone.utc) - timedelta(days=history_days - 1)
+        user = User(id="u", phone_number="+15550000000", timezone=args.timezone, created_at=signed_up)
+
+    results = []
+    print(
+        f"{'days':>5}  {'per-day calls':>13}  {'per-day ms':>10}  {'window calls':>12}  {'window ms':>10}"
+        f"  {'concurrent ms':>13}  {'speedup':>8}  same"
+    )
+    try:
+        for days in args.days:
+            per_day_ms, per_day_calls, expected = _time(per_day_sections, storage, user, days, args.runs)
+            window_ms, window_calls, sections = _time(build_day_sections, storage, user, days, args.runs)
+            concurrent_ms, _, concurrent = _time(concurrent_sections, storage, user, days, args.runs)
+            same = sections == expected and concurrent == expected
+            speedup = per_day_ms / concurrent_ms if concurrent_ms else 0.0
+            print(
+                f"{days:>5}  {per_day_calls:>13}  {per_day_ms:>10.1f}  {window_calls:>12}  {window_ms:>10.1f}"
+                f"  {concurrent_ms:>13.1f}  {speedup:>7.1f}x  {'yes' if same else 'NO'}"
+            )
+            results.append(
+                {
+                    "days": days,
+                    "per_day": {"median_ms": per_day_ms, "calls": per_day_calls},
+                    "window": {"median_ms": window_ms, "calls": window_calls},
+                    "concurrent": {"median_ms": concurrent_ms, "calls": window_calls},
+                    "identical": same,
+                }
+            )
+        # Every run renders afresh
+        page_cache.max_entries = 0
+        print(
+            f"\n{'days':>5}  {'buffered first byte':>19}  {'first content':>13}"
+            f"  {'streamed first byte':>19}  {'first content':>13}  same"
+        )
+        for days, result in zip(args.days, results):
+            buffered_byte, buffered_content, buffered = _time_delivery(storage, user, days, args.runs, stream=False)
+            streamed_byte, streamed_content, streamed = _time_delivery(storage, user, days, args.runs, stream=True)
+            print(
+                f"{days:>5}  {buffered_byte:>19.1f}  {buffered_content:>13.1f}"
+                f"  {streamed_byte:>19.1f}  {streamed_content:>13.1f}  {'yes' if streamed == buffered else 'NO'}"
+            )
+            result["buffered"] = {"first_byte_ms": buffered_byte, "first_content_ms": buffered_content}
+            result["streamed"] = {"first_byte_ms": streamed_byte, "first_content_ms": streamed_content}
+        history = _page_history(storage, user, args.history_days, args.page_days)
+    finally:
+        if args.phone:
+            storage.close()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"runs": args.runs, "results": results, "history": history}, indent=2))
+
+
+if __name__ == "__main__":
+    run(_parse_args())
@@ -0,0 +1,449 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import asyncpg
+
+# Seeds a throwaway database with realistic volumes and records EXPLAIN ANALYZE
+# timings for the hot queries, before and after scripts/migrations are applied.
+#
+#   python scripts/benchmark_indexes.py --dsn postgresql://postgres@localhost/postgres
+#
+# The DSN is only used to create (and afterwards drop) --database; nothing is
+# written to the database it points at.
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+SEED_SQL = [
+    (
+        "users",
+        """
+        INSERT INTO users (phone_number, name, timezone, onboarding_complete, onboarding_step, features_enabled)
+        SELECT
+            '+1555' || lpad(i::TEXT, 7, '0'),
+            'User ' || i,
+            (ARRAY['UTC', 'America/New_York', 'Europe/London', 'Asia/Kolkata'])[1 + i % 4],
+            TRUE,
+            'done',
+            ARRAY['pomodoro', 'tasks', 'calories']
+        FROM generate_series(1, $1::INTEGER) i
+        """,
+        ("users",),
+    ),
+    (
+        "monthly partitions",
+        """
+        SELECT create_monthly_partitions(parent, ($1::TIMESTAMPTZ - make_interval(days => $2::INTEGER + 1))::DATE, $1::DATE)
+        FROM unnest(ARRAY['pomodoro_cycles', 'tasks', 'calorie_logs']) AS parent
+        """,
+        ("now", "days"),
+    ),
+    (
+        "pomodoro_cycles",
+        """
+        INSERT INTO pomodoro_cycles (
+            user_id, started_at, work_minutes, break_minutes, stopped_at, status,
+            notified_phase, summaries, created_at
+        )
+        SELECT
+            user_id, started_at, 25, 5, started_at + make_interval(mins => 30 * blocks), 'stopped',
+            2 * blocks - 1, jsonb_build_object('0', 'Deep work'), started_at
+        FROM (
+            SELECT
+                u.id AS user_id,
+                $1::TIMESTAMPTZ - make_interval(days => d) + make_interval(hours => 8 + 3 * k)
+                    + random() * INTERVAL '1 hour' AS started_at,
+                1 + floor(random() * 4)::INTEGER AS blocks
+            FROM users u, generate_series(1, $2::INTEGER) d, generate_series(0, 2) k
+        ) s
+        """,
+        ("now", "days"),
+    ),
+    (
+        "pomodoro_cycles (active)",
+        """
+        INSERT INTO pomodoro_cycles (
+            user_id, started_at, work_minutes, break_minutes, status, notified_phase, next_transition_at
+        )
+        SELECT id, $1::TIMESTAMPTZ - random() * INTERVAL '25 minutes', 25, 5, 'active', 0,
+               $1::TIMESTAMPTZ + (random() - 0.2) * INTERVAL '25 minutes'
+        FROM users
+        WHERE random() < 0.05
+        """,
+        ("now",),
+    ),
+    (
+        "tasks",
+        """
+        INSERT INTO tasks (
+            user_id, title, raw_message, reminder_time, reminder_sent, completed, completed_at, created_at
+        )
+        SELECT
+            user_id,
+            title,
+            title,
+            reminder_time,
+            COALESCE(reminder_time < $1::TIMESTAMPTZ - INTERVAL '1 minute', FALSE),
+            completed,
+            CASE WHEN completed THEN created_at + random() * INTERVAL '2 days' END,
+            created_at
+        FROM (
+            SELECT
+                user_id,
+                'Task ' || d || '-' || k AS title,
+                created_at,
+                CASE WHEN random() < 0.3 THEN created_at + random() * INTERVAL '1 day' END AS reminder_time,
+                random() < 0.7 AS completed
+            FROM (
+                SELECT u.id AS user_id, d, k,
+                       $1::TIMESTAMPTZ - make_interval(days => d) + random() * INTERVAL '1 day' AS created_at
+                FROM users u, generate_series(1, $2::INTEGER) d, generate_series(1, 4) k
+            ) c
+        ) s
+        """,
+        ("now", "days"),
+    ),
+    (
+        "calorie_logs",
+        """
+        INSERT INTO calorie_logs (
+            user_id, meal_description, calories, protein_g, carbs_g, fat_g, confirmed, logged_at, created_at
+        )
+        SELECT user_id, 'Meal', 200 + floor(random() * 700)::INTEGER, random() * 40, random() * 90,
+               random() * 30, TRUE, logged_at, logged_at
+        FROM (
+            SELECT
+                u.id AS user_id,
+                $1::TIMESTAMPTZ - make_interval(days => d) + make_interval(hours => 7 + 5 * k)
+                    + random() * INTERVAL '1 hour' AS logged_at
+            FROM users u, generate_series(1, $2::INTEGER) d, generate_series(0, 2) k
+        ) s
+        """,
+        ("now", "days"),
+    ),
+    (
+        "conversation_state",
+        """
+        INSERT INTO conversation_state (user_id, phone_number, current_context, context_data, updated_at)
+        SELECT
+            id,
+            phone_number,
+            CASE WHEN awaiting THEN 'awaiting_pomodoro_summary' END,
+            CASE
+                WHEN awaiting THEN jsonb_build_object(
+                    'cycle_id', gen_random_uuid(),
+                    'block', 0,
+                    'summary_requested_at', requested_at,
+                    'summary_nudged', random() < 0.5
+                )
+                ELSE '{}'::JSONB
+            END,
+            requested_at
+        FROM (
+            SELECT id, phone_number, random() < 0.1 AS awaiting,
+                   $1::TIMESTAMPTZ - random() * INTERVAL '30 minutes' AS requested_at
+            FROM users
+        ) s
+        """,
+        ("now",),
+    ),
+    (
+        "outbound_messages",
+        """
+        INSERT INTO outbound_messages (
+            user_id, phone_number, body, priority, status, attempts, next_attempt_at, created_at, sent_at
+        )
+        SELECT
+            user_id,
+            phone_number,
+            'Message',
+            (i % 3)::SMALLINT,
+            CASE WHEN i = 1 AND random() < 0.05 THEN 'pending' ELSE 'sent' END,
+            1,
+            sent_at,
+            sent_at,
+            sent_at
+        FROM (
+            SELECT u.id AS user_id, u.phone_number, i,
+                   $1::TIMESTAMPTZ - make_interval(days => i) + random() * INTERVAL '1 day' AS sent_at
+            FROM users u, generate_series(1, $2::INTEGER) i
+        ) s
+        """,
+        ("now", "days"),
+    ),
+]
+
+# The statements behind each storage method / timer RPC, with the parameters
+# they are called with. RPC bodies are inlined since EXPLAIN does not look
+# inside functions.
+HOT_QUERIES = [
+    ("user by phone", "SELECT id FROM users WHERE phone_number = $1", ("phone",)),
+    ("conversation state", "SELECT current_context, context_data FROM conversation_state WHERE user_id = $1", ("user",)),
+    (
+        "pomodoro cycles in range",
+        """
+        SELECT id, started_at, work_minutes, break_minutes, stopped_at, summaries FROM pomodoro_cycles
+        WHERE user_id = $1 AND started_at <= $3 AND (stopped_at IS NULL OR stopped_at >= $2)
+        ORDER BY started_at
+        """,
+        ("user", "week_start", "now"),
+    ),
+    (
+        "stop pomodoro",
+        """
+        UPDATE pomodoro_cycles SET status = 'stopped', stopped_at = $2, next_transition_at = NULL
+        WHERE user_id = $1 AND status = 'active'
+        """,
+        ("user", "now"),
+    ),
+    (
+        "due pomodoro cycles",
+        """
+        SELECT pc.id FROM pomodoro_cycles pc
+        JOIN users u ON u.id = pc.user_id
+        WHERE pc.status = 'active'
+          AND pc.next_transition_at <= $1
+        ORDER BY pc.next_transition_at
+        LIMIT 100
+        FOR UPDATE OF pc SKIP LOCKED
+        """,
+        ("now",),
+    ),
+    (
+        "open tasks",
+        "SELECT id, title FROM tasks WHERE user_id = $1 AND completed = FALSE ORDER BY created_at",
+        ("user",),
+    ),
+    (
+        "tasks created in range",
+        """
+        SELECT id, title FROM tasks
+        WHERE user_id = $1 AND created_at >= $2 AND created_at <= $3
+        ORDER BY created_at
+        """,
+        ("user", "week_start", "now"),
+    ),
+    (
+        "tasks completed in range",
+        """
+        SELECT id, title FROM tasks
+        WHERE user_id = $1 AND completed = TRUE AND completed_at >= $2 AND completed_at <= $3
+        ORDER BY completed_at
+        """,
+        ("user", "week_start", "now"),
+    ),
+    (
+        "due task reminders",
+        """
+        SELECT id FROM tasks
+        WHERE reminder_sent = FALSE AND reminder_time <= $1
+        ORDER BY reminder_time
+        LIMIT 100
+        FOR UPDATE SKIP LOCKED
+        """,
+        ("now",),
+    ),
+    (
+        "calorie logs in range",
+        """
+        SELECT id, calories FROM calorie_logs
+        WHERE user_id = $1 AND logged_at >= $2 AND logged_at <= $3
+        ORDER BY logged_at
+        """,
+        ("user", "day_start", "now"),
+    ),
+    (
+        "due summary nudges",
+        """
+        SELECT id FROM conversation_state
+        WHERE current_context = 'awaiting_pomodoro_summary'
+          AND (context_data->'summary_nudged') IS DISTINCT FROM 'true'::JSONB
+          AND try_timestamptz(context_data->>'summary_requested_at') <= $1::TIMESTAMPTZ - make_interval(secs => 600)
+        ORDER BY updated_at
+        LIMIT 100
+        FOR UPDATE SKIP LOCKED
+        """,
+        ("now",),
+    ),
+    (
+        "next timer due",
+        """
+        SELECT MIN(due_at) FROM (
+            SELECT MIN(next_transition_at) AS due_at
+            FROM pomodoro_cycles WHERE status = 'active'
+            UNION ALL
+            SELECT MIN(reminder_time)
+            FROM tasks WHERE reminder_sent = FALSE AND reminder_time IS NOT NULL
+            UNION ALL
+            SELECT MIN(try_timestamptz(context_data->>'summary_requested_at'))
+            FROM conversation_state
+            WHERE current_context = 'awaiting_pomodoro_summary'
+              AND (context_data->'summary_nudged') IS DISTINCT FROM 'true'::JSONB
+        ) due
+        """,
+        (),
+    ),
+    (
+        "claim outbound messages",
+        """
+        SELECT id FROM outbound_messages
+        WHERE status = 'pending'
+          AND next_attempt_at <= $1
+          AND (claim_expires_at IS NULL OR claim_expires_at < $1)
+        ORDER BY priority, created_at
+        LIMIT 50
+        FOR UPDATE SKIP LOCKED
+        """,
+        ("now",),
+    ),
+]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the hot queries before and after the index migrations")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="Postgres server to run against")
+    parser.add_argument("--database", default="commit2change_bench", help="Scratch database, dropped and recreated")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=90, help="Days of history per user")
+    parser.add_argument("--runs", type=int, default=20, help="EXPLAIN ANALYZE runs per query")
+    parser.add_argument("--keep", action="store_true", help="Leave the scratch database in place")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn (or DATABASE_URL) is required")
+    return args
+
+
+async def _recreate_database(dsn: str, name: str, drop_only: bool = False) -> None:
+    admin = await asyncpg.connect(dsn)
+    try:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        if not drop_only:
+            await admin.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await admin.close()
+
+
+async def _seed(conn: asyncpg.Connection, users: int, days: int, now: datetime) -> dict[str, int]:
+    await conn.execute((SCRIPTS_DIR / "setup_supabase.sql").read_text())
+    values = {"users": users, "days": days, "now": now}
+    for label, sql, params in SEED_SQL:
+        print(f"  seeding {label}...", file=sys.stderr)
+        await conn.execute(sql, *[values[p] for p in params])
+    await conn.execute("ANALYZE")
+    counts = {}
+    for table in ("users", "pomodoro_cycles", "tasks", "calorie_logs", "conversation_state", "outbound_messages"):
+        counts[table] = await conn.fetchval(f"SELECT COUNT(*) FROM {table}")
+    return counts
+
+
+def _index_names(plan: dict) -> list[str]:
+    names = [plan["Index Name"]] if "Index Name" in plan else []
+    for child in plan.get("Plans", []):
+        names.extend(_index_names(child))
+    return names
+
+
+async def _explain(conn: asyncpg.Connection, sql: str, args: list) -> tuple[float, list[str]]:
+    # Run inside a transaction that is rolled back so UPDATEs and row locks
+    # leave the data as seeded for the next run
+    tr = conn.transaction()
+    await tr.start()
+    try:
+        raw = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", *args)
+    finally:
+        await tr.rollback()
+    result = json.loads(raw)[0]
+    return result["Execution Time"], _index_names(result["Plan"])
+
+
+async def _measure(conn: asyncpg.Connection, runs: int, now: datetime) -> dict[str, dict]:
+    samples = await conn.fetch("SELECT id, phone_number FROM users ORDER BY random() LIMIT $1", runs)
+    results = {}
+    for name, sql, params in HOT_QUERIES:
+        timings = []
+        indexes: list[str] = []
+        for sample in samples:
+            values = {
+                "user": sample["id"],
+                "phone": sample["phone_number"],
+                "now": now,
+                "day_start": now - timedelta(days=1),
+                "week_start": now - timedelta(days=7),
+            }
+            elapsed, indexes = await _explain(conn, sql, [values[p] for p in params])
+            timings.append(elapsed)
+        results[name] = {
+            "median_ms": statistics.median(timings),
+            "max_ms": max(timings),
+            "indexes": sorted(set(indexes)),
+        }
+    return results
+
+
+async def _apply_migrations(conn: asyncpg.Connection) -> list[str]:
+    applied = []
+    for path in sorted((SCRIPTS_DIR / "migrations").glob("*.sql")):
+        print(f"  applying {path.name}...", file=sys.stderr)
+        await conn.execute(path.read_text())
+        applied.append(path.name)
+    await conn.execute("ANALYZE")
+    return applied
+
+
+def _report(before: dict[str, dict], after: dict[str, dict]) -> None:
+    width = max(len(name) for name in before)
+    print(f"{'query':<{width}}  {'before ms':>10}  {'after ms':>10}  {'speedup':>8}  indexes used after")
+    for name in before:
+        b = before[name]["median_ms"]
+        a = after[name]["median_ms"]
+        speedup = f"{b / a:.1f}x" if a else "-"
+        indexes = ", ".join(after[name]["indexes"]) or "(none)"
+        print(f"{name:<{width}}  {b:>10.3f}  {a:>10.3f}  {speedup:>8}  {indexes}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    now = datetime.now(timezone.utc)
+    await _recreate_database(args.dsn, args.database)
+    conn = await asyncpg.connect(args.dsn, database=args.database)
+    try:
+        print(f"Seeding {args.users} users x {args.days} days into {args.database}", file=sys.stderr)
+        counts = await _seed(conn, args.users, args.days, now)
+        print("  " + ", ".join(f"{table}={count}" for table, count in counts.items()), file=sys.stderr)
+        print("Measuring without migrations", file=sys.stderr)
+        before = await _measure(conn, args.runs, now)
+        migrations = await _apply_migrations(conn)
+        print("Measuring with migrations", file=sys.stderr)
+        after = await _measure(conn, args.runs, now)
+    finally:
+        await conn.close()
+        if not args.keep:
+            await _recreate_database(args.dsn, args.database, drop_only=True)
+
+    _report(before, after)
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(
+                {
+                    "users": args.users,
+                    "days": args.days,
+                    "runs": args.runs,
+                    "rows": counts,
+                    "migrations": migrations,
+                    "before": before,
+                    "after": after,
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(_parse_args()))
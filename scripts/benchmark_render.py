@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Times render_dashboard for 1, 7 and 14-day pages of synthetic data and
+# reports each page's size as sent: raw, gzip and (when the brotli package is
+# installed) brotli, next to the stylesheet the browser now fetches once and
+# caches. Run from backend/ so config picks up .env:
+#
+#   python ../scripts/benchmark_render.py
+#   python ../scripts/benchmark_render.py --days 1 7 14 30 --runs 200
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from benchmark_dashboard import SyntheticStorage  # noqa: E402
+from handlers.dashboard import STYLESHEET, build_day_sections, render_dashboard, render_login  # noqa: E402
+from services.models import User  # noqa: E402
+from utils.compression import BROTLI_QUALITY, GZIP_LEVEL, brotli  # noqa: E402
+
+
+def _sizes(html: str) -> dict[str, int]:
+    body = html.encode("utf-8")
+    sizes = {"raw": len(body), "gzip": len(gzip.compress(body, GZIP_LEVEL))}
+    if brotli:
+        sizes["br"] = len(brotli.compress(body, quality=BROTLI_QUALITY))
+    return sizes
+
+
+def _time(render, runs: int) -> tuple[float, float]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark dashboard page rendering and compressed page sizes")
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 7, 14])
+    parser.add_argument("--runs", type=int, default=100, help="Renders per page (median and p95 reported)")
+    parser.add_argument("--timezone", default="America/New_York")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+def run(args: argparse.Namespace) -> None:
+    storage = SyntheticStorage(max(args.days), latency_ms=0)
+    user = User(id="u", phone_number="+15550000000", timezone=args.timezone, name="Benchmark")
+    results = []
+    print(f"{'page':>8}  {'median ms':>9}  {'p95 ms':>7}  {'raw bytes':>9}  {'gzip':>7}  {'br':>7}")
+    pages = [("login", lambda: render_login())]
+    for days in args.days:
+        sections = build_day_sections(storage, user, days)
+        pages.append((f"{days} days", lambda sections=sections: render_dashboard(user, sections)))
+    for name, render in pages:
+        median_ms, p95_ms = _time(render, args.runs)
+        sizes = _sizes(render())
+        br = sizes.get("br")
+        print(
+            f"{name:>8}  {median_ms:>9.2f}  {p95_ms:>7.2f}  {sizes['raw']:>9}  {sizes['gzip']:>7}"
+            f"  {br if br is not None else '-':>7}"
+        )
+        results.append({"page": name, "median_ms": median_ms, "p95_ms": p95_ms, "bytes": sizes})
+    stylesheet = _sizes(STYLESHEET.body.decode("utf-8"))
+    print(
+        f"\nstylesheet /static/{STYLESHEET.filename}: {stylesheet['raw']} bytes"
+        f" ({stylesheet['gzip']} gzip), cached by the browser instead of inlined in every page"
+    )
+
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps({"runs": args.runs, "results": results, "stylesheet": stylesheet}, indent=2)
+        )
+
+
+if __name__ == "__main__":
+    run(_parse_args())
@@ -0,0 +1,133 @@
+-- Moves pomodoro history from one row per work/break phase (pomodoro_sessions)
+-- to one row per cycle (pomodoro_cycles). Run once, after setup_supabase.sql
+-- has created pomodoro_cycles. Safe to re-run: once the migration is
+-- recorded in schema_migrations, the copy is skipped.
+--
+-- * Every work session becomes a single-block cycle, with its summary as the
+--   summary for block 0. Break rows carry no information of their own and are
+--   not copied.
+-- * A running break becomes a running cycle that is in its first break; the
+--   work session that ended right before it is folded into that cycle.
+-- * Summary prompts waiting on a session_id are pointed at the new cycle/block.
+--
+-- pomodoro_sessions is left in place; drop it once the new data checks out.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+DO $$
+BEGIN
+    INSERT INTO schema_migrations (version) VALUES ('0001_pomodoro_cycles')
+    ON CONFLICT (version) DO NOTHING;
+    IF NOT FOUND THEN
+        RAISE NOTICE '0001_pomodoro_cycles is already applied';
+        RETURN;
+    END IF;
+
+    CREATE TEMP TABLE pomodoro_cycle_seed (
+        cycle_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        work_session_id UUID,
+        break_session_id UUID,
+        user_id UUID,
+        started_at TIMESTAMPTZ NOT NULL,
+        work_minutes INTEGER NOT NULL,
+        break_minutes INTEGER NOT NULL,
+        stopped_at TIMESTAMPTZ,
+        status TEXT NOT NULL,
+        is_backfill BOOLEAN NOT NULL,
+        notified_phase INTEGER NOT NULL,
+        next_transition_at TIMESTAMPTZ,
+        summaries JSONB NOT NULL,
+        created_at TIMESTAMPTZ
+    ) ON COMMIT DROP;
+
+    -- Running breaks, together with the work block that led into them
+    INSERT INTO pomodoro_cycle_seed (
+        work_session_id, break_session_id, user_id, started_at, work_minutes, break_minutes,
+        status, is_backfill, notified_phase, next_transition_at, summaries, created_at
+    )
+    SELECT
+        w.id,
+        b.id,
+        b.user_id,
+        b.start_time - make_interval(mins => COALESCE(b.cycle_work_minutes, w.planned_duration_minutes, 25)),
+        COALESCE(b.cycle_work_minutes, w.planned_duration_minutes, 25),
+        COALESCE(b.cycle_break_minutes, b.planned_duration_minutes, 0),
+        'active',
+        FALSE,
+        1,
+        b.end_time,
+        CASE
+            WHEN w.what_did_you_do IS NULL THEN '{}'::JSONB
+            ELSE jsonb_build_object('0', w.what_did_you_do)
+        END,
+        COALESCE(w.created_at, b.created_at)
+    FROM pomodoro_sessions b
+    LEFT JOIN LATERAL (
+        SELECT ws.id, ws.planned_duration_minutes, ws.what_did_you_do, ws.created_at
+        FROM pomodoro_sessions ws
+        WHERE ws.user_id = b.user_id
+          AND ws.session_type = 'work'
+          AND ws.end_time BETWEEN b.start_time - INTERVAL '10 minutes' AND b.start_time
+        ORDER BY ws.end_time DESC
+        LIMIT 1
+    ) w ON TRUE
+    WHERE b.session_type = 'break'
+      AND b.status = 'active';
+
+    -- Every other work session
+    INSERT INTO pomodoro_cycle_seed (
+        work_session_id, user_id, started_at, work_minutes, break_minutes, stopped_at,
+        status, is_backfill, notified_phase, next_transition_at, summaries, created_at
+    )
+    SELECT
+        s.id,
+        s.user_id,
+        s.start_time,
+        COALESCE(
+            s.planned_duration_minutes,
+            CEIL(EXTRACT(EPOCH FROM (s.end_time - s.start_time)) / 60)::INTEGER,
+            0
+        ),
+        COALESCE(s.cycle_break_minutes, 0),
+        CASE WHEN s.status = 'active' THEN NULL ELSE COALESCE(s.end_time, s.start_time) END,
+        CASE WHEN s.status = 'active' THEN 'active' ELSE 'stopped' END,
+        COALESCE(s.is_backfill, FALSE),
+        CASE WHEN s.status = 'active' THEN 0 ELSE 1 END,
+        CASE WHEN s.status = 'active' THEN s.end_time END,
+        CASE
+            WHEN s.what_did_you_do IS NULL THEN '{}'::JSONB
+            ELSE jsonb_build_object('0', s.what_did_you_do)
+        END,
+        s.created_at
+    FROM pomodoro_sessions s
+    WHERE s.session_type = 'work'
+      AND NOT EXISTS (
+          SELECT 1 FROM pomodoro_cycle_seed seed WHERE seed.work_session_id = s.id
+      );
+
+    INSERT INTO pomodoro_cycles (
+        id, user_id, started_at, work_minutes, break_minutes, stopped_at, status,
+        is_backfill, notified_phase, next_transition_at, summaries, created_at
+    )
+    SELECT
+        cycle_id, user_id, started_at, work_minutes, break_minutes, stopped_at, status,
+        is_backfill, notified_phase, next_transition_at, summaries, COALESCE(created_at, NOW())
+    FROM pomodoro_cycle_seed;
+
+    -- Pending summary prompts referenced the work (or, after 'stop', the break)
+    -- session; both now map to block 0 of the cycle they were folded into.
+    UPDATE conversation_state cs
+    SET context_data = (cs.context_data - 'session_id')
+        || jsonb_build_object('cycle_id', seed.cycle_id, 'block', 0)
+    FROM pomodoro_cycle_seed seed
+    WHERE cs.context_data ? 'session_id'
+      AND (cs.context_data->>'session_id')::UUID IN (seed.work_session_id, seed.break_session_id);
+END;
+$$;
+
+COMMIT;
@@ -0,0 +1,74 @@
+-- Indexes for the queries the bot and the timer run on every message/tick.
+-- setup_supabase.sql only creates primary keys and the unique constraints on
+-- users.phone_number and conversation_state.user_id, so everything else was a
+-- sequential scan. Run after setup_supabase.sql (and 0001).
+--
+-- Every statement is idempotent, so re-running the file is a no-op. CREATE
+-- INDEX blocks writes to each table while it builds, which is fine at our
+-- sizes. On a large live table, run the CREATE INDEX CONCURRENTLY form of the
+-- statement by hand first (outside a transaction) and this file will skip it.
+--
+-- scripts/benchmark_indexes.py measures each query before and after.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+INSERT INTO schema_migrations (version) VALUES ('0002_hot_query_indexes')
+ON CONFLICT (version) DO NOTHING;
+
+-- Pomodoro cycles
+-- advance_due_pomodoro_cycles / next_timer_due_at: active cycles by due time
+CREATE INDEX IF NOT EXISTS pomodoro_cycles_due_idx
+    ON pomodoro_cycles (next_transition_at)
+    WHERE status = 'active';
+
+-- stop: the user's running cycle
+CREATE INDEX IF NOT EXISTS pomodoro_cycles_user_active_idx
+    ON pomodoro_cycles (user_id)
+    WHERE status = 'active';
+
+-- stats/dashboard: a user's cycles overlapping a day range
+CREATE INDEX IF NOT EXISTS pomodoro_cycles_user_started_idx
+    ON pomodoro_cycles (user_id, started_at);
+
+-- Tasks
+-- fire_due_task_reminders / next_timer_due_at: unsent reminders by due time
+CREATE INDEX IF NOT EXISTS tasks_reminder_due_idx
+    ON tasks (reminder_time)
+    WHERE reminder_sent = FALSE AND reminder_time IS NOT NULL;
+
+-- 'tasks' list: a user's open tasks, oldest first
+CREATE INDEX IF NOT EXISTS tasks_user_open_idx
+    ON tasks (user_id, created_at)
+    WHERE completed = FALSE;
+
+-- dashboard: tasks created / completed in a day range
+CREATE INDEX IF NOT EXISTS tasks_user_created_idx
+    ON tasks (user_id, created_at);
+
+CREATE INDEX IF NOT EXISTS tasks_user_completed_idx
+    ON tasks (user_id, completed_at)
+    WHERE completed = TRUE;
+
+-- Calorie logs
+-- 'calories' and the dashboard: a user's meals in a day range
+CREATE INDEX IF NOT EXISTS calorie_logs_user_logged_idx
+    ON calorie_logs (user_id, logged_at);
+
+-- Conversation state
+-- fire_due_nudges / next_timer_due_at: pending summary prompts, oldest first
+CREATE INDEX IF NOT EXISTS conversation_state_awaiting_summary_idx
+    ON conversation_state (updated_at)
+    WHERE current_context = 'awaiting_pomodoro_summary';
+
+-- Outbound messages
+-- claim_outbound_messages: pending messages by priority, then age
+CREATE INDEX IF NOT EXISTS outbound_messages_pending_idx
+    ON outbound_messages (priority, created_at)
+    WHERE status = 'pending';
+
+COMMIT;
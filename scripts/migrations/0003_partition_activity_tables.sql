@@ -0,0 +1,112 @@
+-- Converts pomodoro_cycles, tasks and calorie_logs to monthly range partitions
+-- (on started_at, created_at and logged_at). Fresh installs get partitioned
+-- tables from setup_supabase.sql and this file only re-creates the 0002
+-- indexes, which it skips because they already exist.
+--
+-- Run setup_supabase.sql first (for create_monthly_partitions), then this
+-- file, then setup_supabase.sql once more: set_pomodoro_summary and
+-- fire_due_task_reminders return the old row types and are dropped here, and
+-- the timer triggers go away with the old tables.
+--
+-- Each table is copied, so this takes an exclusive lock on it for the length
+-- of the copy. Partitions cover the oldest row's month through
+-- three months ahead.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+INSERT INTO schema_migrations (version) VALUES ('0003_partition_activity_tables')
+ON CONFLICT (version) DO NOTHING;
+
+DO $$
+DECLARE
+    t RECORD;
+    old_name TEXT;
+    oldest TIMESTAMPTZ;
+    column_list TEXT;
+BEGIN
+    FOR t IN
+        SELECT * FROM (VALUES
+            ('pomodoro_cycles', 'started_at'),
+            ('tasks', 'created_at'),
+            ('calorie_logs', 'logged_at')
+        ) AS v(name, key)
+    LOOP
+        IF (SELECT relkind FROM pg_class WHERE oid = to_regclass(t.name)) = 'p' THEN
+            CONTINUE;
+        END IF;
+
+        DROP FUNCTION IF EXISTS set_pomodoro_summary(UUID, INTEGER, TEXT);
+        DROP FUNCTION IF EXISTS fire_due_task_reminders(INTEGER, TIMESTAMPTZ);
+
+        old_name := t.name || '_unpartitioned';
+        EXECUTE format('LOCK TABLE %I IN ACCESS EXCLUSIVE MODE', t.name);
+        -- The partition key becomes part of the primary key, so it can't be NULL
+        EXECUTE format(
+            'UPDATE %I SET %I = COALESCE(created_at, NOW()) WHERE %I IS NULL',
+            t.name, t.key, t.key
+        );
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', t.name, old_name);
+        EXECUTE format('ALTER INDEX IF EXISTS %I RENAME TO %I', t.name || '_pkey', old_name || '_pkey');
+
+        EXECUTE format(
+            'CREATE TABLE %I (
+                LIKE %I INCLUDING DEFAULTS INCLUDING GENERATED,
+                PRIMARY KEY (id, %I),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            ) PARTITION BY RANGE (%I)',
+            t.name, old_name, t.key, t.key
+        );
+
+        EXECUTE format('SELECT MIN(%I) FROM %I', t.key, old_name) INTO oldest;
+        PERFORM create_monthly_partitions(
+            t.name,
+            (COALESCE(oldest, NOW()) AT TIME ZONE 'UTC')::DATE,
+            ((NOW() AT TIME ZONE 'UTC') + INTERVAL '3 months')::DATE
+        );
+
+        -- Generated columns (pomodoro_cycles.actual_minutes) are recomputed
+        SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO column_list
+        FROM pg_attribute
+        WHERE attrelid = to_regclass(old_name) AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+        EXECUTE format('INSERT INTO %I (%s) SELECT %s FROM %I', t.name, column_list, column_list, old_name);
+        EXECUTE format('DROP TABLE %I', old_name);
+    END LOOP;
+END$$;
+
+-- Same indexes as 0002, now on the partitioned tables (each partition gets
+-- its own copy)
+CREATE INDEX IF NOT EXISTS pomodoro_cycles_due_idx
+    ON pomodoro_cycles (next_transition_at)
+    WHERE status = 'active';
+
+CREATE INDEX IF NOT EXISTS pomodoro_cycles_user_active_idx
+    ON pomodoro_cycles (user_id)
+    WHERE status = 'active';
+
+CREATE INDEX IF NOT EXISTS pomodoro_cycles_user_started_idx
+    ON pomodoro_cycles (user_id, started_at);
+
+CREATE INDEX IF NOT EXISTS tasks_reminder_due_idx
+    ON tasks (reminder_time)
+    WHERE reminder_sent = FALSE AND reminder_time IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS tasks_user_open_idx
+    ON tasks (user_id, created_at)
+    WHERE completed = FALSE;
+
+CREATE INDEX IF NOT EXISTS tasks_user_created_idx
+    ON tasks (user_id, created_at);
+
+CREATE INDEX IF NOT EXISTS tasks_user_completed_idx
+    ON tasks (user_id, completed_at)
+    WHERE completed = TRUE;
+
+CREATE INDEX IF NOT EXISTS calorie_logs_user_logged_idx
+    ON calorie_logs (user_id, logged_at);
+
+COMMIT;
@@ -0,0 +1,23 @@
+-- Fills daily_rollups from the existing activity rows. Run setup_supabase.sql
+-- first: it creates the table, the triggers that keep it current from then
+-- on, and rebuild_daily_rollups. Safe to re-run; `python -m rollups` (from
+-- backend/) does the same per user and reports drift. This file is one
+-- transaction holding every user's rollup lock until it commits, which can
+-- exhaust the shared lock table (max_locks_per_transaction per connection)
+-- on an install with many thousands of users; use `python -m rollups` there,
+-- which commits after each user.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+INSERT INTO schema_migrations (version) VALUES ('0004_daily_rollups')
+ON CONFLICT (version) DO NOTHING;
+
+SELECT COUNT(*) FILTER (WHERE rebuild_daily_rollups(id) > 0) AS users_filled
+FROM users;
+
+COMMIT;
@@ -15,7 +15,32 @@ CREATE TABLE IF NOT EXISTS users (
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
--- Pomodoro sessions
+-- Pomodoro cycles
+-- One row per start..stop run. Work/break phase boundaries are computed from
+-- started_at and the work/break lengths; summaries maps work block index to
+-- what the user did in it.
+--
+-- pomodoro_cycles, tasks and calorie_logs are range partitioned by month
+-- (see "Partitions" at the end of this file), so the partition key is part of
+-- the primary key.
+CREATE TABLE IF NOT EXISTS pomodoro_cycles (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    user_id UUID REFERENCES users(id),
+    started_at TIMESTAMPTZ NOT NULL,
+    work_minutes INTEGER NOT NULL,
+    break_minutes INTEGER NOT NULL DEFAULT 0,
+    stopped_at TIMESTAMPTZ,
+    status TEXT DEFAULT 'active', -- 'active', 'stopped'
+    is_backfill BOOLEAN DEFAULT FALSE,
+    notified_phase INTEGER DEFAULT 0, -- phase the user was last told about (even = work, odd = break)
+    next_transition_at TIMESTAMPTZ, -- end of that phase while active
+    summaries JSONB DEFAULT '{}',
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (id, started_at)
+) PARTITION BY RANGE (started_at);
+
+-- Pomodoro sessions (legacy, one row per work/break phase; see
+-- migrations/0001_pomodoro_cycles.sql)
 CREATE TABLE IF NOT EXISTS pomodoro_sessions (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     user_id UUID REFERENCES users(id),
@@ -33,7 +58,7 @@ CREATE TABLE IF NOT EXISTS pomodoro_sessions (
 
 -- Tasks
 CREATE TABLE IF NOT EXISTS tasks (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
     user_id UUID REFERENCES users(id),
     title TEXT NOT NULL,
     description TEXT,
@@ -42,12 +67,13 @@ CREATE TABLE IF NOT EXISTS tasks (
     reminder_sent BOOLEAN DEFAULT FALSE,
     completed BOOLEAN DEFAULT FALSE,
     completed_at TIMESTAMPTZ,
-    created_at TIMESTAMPTZ DEFAULT NOW()
-);
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
 
 -- Calorie logs
 CREATE TABLE IF NOT EXISTS calorie_logs (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
     user_id UUID REFERENCES users(id),
     meal_description TEXT,
     image_url TEXT,
@@ -57,9 +83,10 @@ CREATE TABLE IF NOT EXISTS calorie_logs (
     fat_g FLOAT,
     fiber_g FLOAT,
     confirmed BOOLEAN DEFAULT FALSE,
-    logged_at TIMESTAMPTZ DEFAULT NOW(),
-    created_at TIMESTAMPTZ DEFAULT NOW()
-);
+    logged_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (id, logged_at)
+) PARTITION BY RANGE (logged_at);
 
 -- Conversation state
 CREATE TABLE IF NOT EXISTS conversation_state (
@@ -80,3 +107,1163 @@ BEGIN
         ADD CONSTRAINT conversation_state_user_id_key UNIQUE (user_id);
     END IF;
 END$$;
+
+-- Outbound message outbox
+-- Timer functions write the messages they want sent here in the same
+-- transaction as the state change; a separate drain process sends them.
+CREATE TABLE IF NOT EXISTS outbound_messages (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID REFERENCES users(id),
+    phone_number TEXT NOT NULL,
+    body TEXT NOT NULL,
+    media_url TEXT,
+    priority SMALLINT DEFAULT 1, -- 0 urgent, 1 normal, 2 low
+    dedupe_key TEXT UNIQUE,
+    status TEXT DEFAULT 'pending', -- 'pending', 'sent', 'failed'
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ DEFAULT NOW(),
+    last_error TEXT,
+    provider_sid TEXT,
+    claimed_by TEXT,
+    claim_expires_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    sent_at TIMESTAMPTZ
+);
+
+-- Timer work claiming
+-- Timer work is claimed with FOR UPDATE SKIP LOCKED and fired (state change
+-- plus outbox row) in the same transaction, so it needs no lease. Only
+-- outbound_messages, whose send spans transactions, keeps one. These are
+-- the lease columns the timer used before the outbox.
+ALTER TABLE pomodoro_cycles DROP COLUMN IF EXISTS claimed_by;
+ALTER TABLE pomodoro_cycles DROP COLUMN IF EXISTS claim_expires_at;
+ALTER TABLE tasks DROP COLUMN IF EXISTS claimed_by;
+ALTER TABLE tasks DROP COLUMN IF EXISTS claim_expires_at;
+ALTER TABLE conversation_state DROP COLUMN IF EXISTS claimed_by;
+ALTER TABLE conversation_state DROP COLUMN IF EXISTS claim_expires_at;
+
+-- Pomodoro transitions
+-- Claims up to batch_size active cycles whose current phase has ended
+-- (skipping rows another worker holds), moves each one to the phase it is in
+-- now, (after a work block) asks for a summary and queues the transition
+-- message, all in one transaction. Returns one row per cycle advanced;
+-- session_type is the phase that just ended.
+DROP FUNCTION IF EXISTS advance_pomodoro_sessions(UUID[], TIMESTAMPTZ);
+DROP FUNCTION IF EXISTS advance_due_pomodoro_sessions(TEXT, INTEGER, TIMESTAMPTZ);
+DROP FUNCTION IF EXISTS advance_due_pomodoro_cycles(TEXT, INTEGER, TIMESTAMPTZ);
+
+CREATE OR REPLACE FUNCTION advance_due_pomodoro_cycles(
+    batch_size INTEGER,
+    now_ts TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS TABLE (
+    cycle_id UUID,
+    user_id UUID,
+    phone_number TEXT,
+    timezone TEXT,
+    session_type TEXT,
+    end_time TIMESTAMPTZ,
+    phase INTEGER,
+    next_session_type TEXT,
+    next_duration_minutes INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    c RECORD;
+    period_seconds DOUBLE PRECISION;
+    elapsed_seconds DOUBLE PRECISION;
+    block_index INTEGER;
+    summary_block INTEGER;
+    phase_end TIMESTAMPTZ;
+    message TEXT;
+BEGIN
+    FOR c IN
+        SELECT pc.id, pc.user_id, pc.started_at, pc.work_minutes, pc.break_minutes, pc.next_transition_at,
+               u.phone_number AS user_phone, u.timezone AS user_timezone
+        FROM pomodoro_cycles pc
+        JOIN users u ON u.id = pc.user_id
+        WHERE pc.status = 'active'
+          AND pc.next_transition_at <= now_ts
+        ORDER BY pc.next_transition_at
+        LIMIT batch_size
+        FOR UPDATE OF pc SKIP LOCKED
+    LOOP
+        period_seconds := GREATEST((c.work_minutes + c.break_minutes) * 60, 60);
+        elapsed_seconds := GREATEST(EXTRACT(EPOCH FROM (now_ts - c.started_at)), 0);
+        block_index := FLOOR(elapsed_seconds / period_seconds)::INTEGER;
+        summary_block := NULL;
+        IF c.break_minutes = 0 THEN
+            -- No breaks: every boundary ends a work block and the next one
+            -- starts straight away
+            phase := 2 * block_index;
+            phase_end := c.started_at + make_interval(secs => (block_index + 1) * period_seconds);
+            session_type := 'work';
+            next_session_type := 'work';
+            next_duration_minutes := c.work_minutes;
+            summary_block := GREATEST(block_index - 1, 0);
+            message := format(
+                E'⏱ Work block complete! Starting the next %s-minute focus block.\nQuick check-in — what did you work on?',
+                c.work_minutes
+            );
+        ELSIF elapsed_seconds - block_index * period_seconds < c.work_minutes * 60 THEN
+            -- Back in a work phase: the break before it just ended
+            phase := 2 * block_index;
+            phase_end := c.started_at + make_interval(secs => block_index * period_seconds + c.work_minutes * 60);
+            session_type := 'break';
+            next_session_type := 'work';
+            next_duration_minutes := c.work_minutes;
+            message := format(
+                E'✅ Break over. Starting a %s-minute focus block now.\nSend ''stop'' anytime to end.',
+                c.work_minutes
+            );
+        ELSE
+            phase := 2 * block_index + 1;
+            phase_end := c.started_at + make_interval(secs => (block_index + 1) * period_seconds);
+            session_type := 'work';
+            next_session_type := 'break';
+            next_duration_minutes := c.break_minutes;
+            summary_block := block_index;
+            message := format(
+                E'⏱ Work block complete! Take a %s-minute break.\nQuick check-in — what did you work on?',
+                c.break_minutes
+            );
+        END IF;
+
+        IF summary_block IS NOT NULL THEN
+            INSERT INTO conversation_state (user_id, phone_number, current_context, context_data, updated_at)
+            VALUES (
+                c.user_id,
+                c.user_phone,
+                'awaiting_pomodoro_summary',
+                jsonb_build_object(
+                    'cycle_id', c.id,
+                    'block', summary_block,
+                    'summary_requested_at', now_ts,
+                    'summary_nudged', FALSE
+                ),
+                now_ts
+            )
+            ON CONFLICT (user_id) DO UPDATE SET
+                phone_number = EXCLUDED.phone_number,
+                current_context = EXCLUDED.current_context,
+                context_data = EXCLUDED.context_data,
+                updated_at = EXCLUDED.updated_at;
+        END IF;
+
+        UPDATE pomodoro_cycles
+        SET notified_phase = phase,
+            next_transition_at = phase_end
+        WHERE id = c.id;
+
+        INSERT INTO outbound_messages (user_id, phone_number, body, priority, dedupe_key)
+        VALUES (c.user_id, c.user_phone, message, 0, 'pomodoro:' || c.id || ':' || phase)
+        ON CONFLICT (dedupe_key) DO NOTHING;
+
+        cycle_id := c.id;
+        user_id := c.user_id;
+        phone_number := c.user_phone;
+        timezone := COALESCE(c.user_timezone, 'UTC');
+        end_time := c.next_transition_at;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION set_pomodoro_summary(cycle_id UUID, block_index INTEGER, summary TEXT)
+RETURNS SETOF pomodoro_cycles
+LANGUAGE sql
+AS $$
+    UPDATE pomodoro_cycles
+    SET summaries = COALESCE(summaries, '{}'::JSONB) || jsonb_build_object(block_index::TEXT, summary)
+    WHERE id = cycle_id
+    RETURNING *;
+$$;
+
+-- Task reminders
+-- Marks up to batch_size due reminders sent and queues one digest message per
+-- user in the same transaction.
+DROP FUNCTION IF EXISTS claim_due_task_reminders(TEXT, INTEGER, INTEGER, TIMESTAMPTZ);
+
+CREATE OR REPLACE FUNCTION fire_due_task_reminders(
+    batch_size INTEGER,
+    now_ts TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS SETOF tasks
+LANGUAGE sql
+AS $$
+    WITH due AS (
+        SELECT id FROM tasks
+        WHERE reminder_sent = FALSE
+          AND reminder_time <= now_ts
+        ORDER BY reminder_time
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ),
+    fired AS (
+        UPDATE tasks t
+        SET reminder_sent = TRUE
+        FROM due
+        WHERE t.id = due.id
+        RETURNING t.*
+    ),
+    digests AS (
+        INSERT INTO outbound_messages (user_id, phone_number, body, priority, dedupe_key)
+        SELECT
+            f.user_id,
+            u.phone_number,
+            CASE
+                WHEN COUNT(*) = 1 THEN '⏰ Reminder: ' || MIN(f.title)
+                ELSE E'⏰ Reminders:\n' || string_agg('• ' || f.title, E'\n' ORDER BY f.reminder_time)
+            END,
+            1,
+            'reminder:' || md5(string_agg(f.id::TEXT, ',' ORDER BY f.id))
+        FROM fired f
+        JOIN users u ON u.id = f.user_id
+        GROUP BY f.user_id, u.phone_number
+        ON CONFLICT (dedupe_key) DO NOTHING
+    )
+    SELECT * FROM fired;
+$$;
+
+-- Safe timestamp cast
+-- context_data is free-form JSON. One malformed timestamp in it must not
+-- abort a claim or scan over every user's row, so it reads as NULL instead.
+-- Only ISO 8601 values with a real calendar date get cast. Being plain SQL
+-- (not plpgsql with an exception block) it is inlined into the timer's
+-- queries, with no subtransaction per row; CASE keeps the cast from running
+-- before the checks.
+CREATE OR REPLACE FUNCTION try_timestamptz(value TEXT)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT CASE
+        WHEN value ~ ('^[1-9][0-9]{3}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])'
+                      '([T ]([01][0-9]|2[0-3]):[0-5][0-9](:[0-5][0-9](\.[0-9]{1,6})?)?'
+                      '(Z|[+-](0[0-9]|1[0-5])(:?[0-5][0-9])?)?)?$') THEN
+            CASE
+                WHEN substr(value, 9, 2)::INTEGER <= extract(
+                    DAY FROM make_date(substr(value, 1, 4)::INTEGER, substr(value, 6, 2)::INTEGER, 1)
+                        + INTERVAL '1 month' - INTERVAL '1 day'
+                ) THEN value::TIMESTAMPTZ
+            END
+    END;
+$$;
+
+-- Pomodoro summary nudges
+-- Flags up to batch_size overdue summary prompts as nudged and queues the
+-- nudge message in the same transaction.
+DROP FUNCTION IF EXISTS claim_due_nudges(TEXT, INTEGER, INTEGER, INTEGER, TIMESTAMPTZ);
+DROP FUNCTION IF EXISTS mark_nudges_sent(TEXT, UUID[]);
+
+CREATE OR REPLACE FUNCTION fire_due_nudges(
+    batch_size INTEGER,
+    nudge_after_seconds INTEGER,
+    now_ts TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS SETOF conversation_state
+LANGUAGE sql
+AS $$
+    WITH due AS (
+        SELECT id FROM conversation_state
+        WHERE current_context = 'awaiting_pomodoro_summary'
+          AND (context_data->'summary_nudged') IS DISTINCT FROM 'true'::JSONB
+          AND try_timestamptz(context_data->>'summary_requested_at')
+              <= now_ts - make_interval(secs => nudge_after_seconds)
+        ORDER BY updated_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ),
+    fired AS (
+        UPDATE conversation_state cs
+        SET context_data = cs.context_data || jsonb_build_object('summary_nudged', TRUE)
+        FROM due
+        WHERE cs.id = due.id
+        RETURNING cs.*
+    ),
+    nudges AS (
+        INSERT INTO outbound_messages (user_id, phone_number, body, priority, dedupe_key)
+        SELECT
+            user_id,
+            phone_number,
+            'Quick reminder — what did you work on in that last focus session?',
+            2,
+            'nudge:' || user_id || ':' || (context_data->>'summary_requested_at')
+        FROM fired
+        ON CONFLICT (dedupe_key) DO NOTHING
+    )
+    SELECT * FROM fired;
+$$;
+
+-- Timer change feed
+-- Pushes newly due timer work to schedulers listening on 'timer_changes' so
+-- they can wake up at the right moment instead of polling the tables. The
+-- table comes in as the trigger argument: on a partitioned table
+-- TG_TABLE_NAME is the partition's name.
+CREATE OR REPLACE FUNCTION notify_timer_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    source_table TEXT := TG_ARGV[0];
+    due_at TIMESTAMPTZ;
+BEGIN
+    IF source_table = 'pomodoro_cycles' THEN
+        IF NEW.status = 'active' THEN
+            due_at := NEW.next_transition_at;
+        END IF;
+    ELSIF source_table = 'tasks' THEN
+        IF NOT COALESCE(NEW.reminder_sent, FALSE) THEN
+            due_at := NEW.reminder_time;
+        END IF;
+    ELSIF source_table = 'conversation_state' THEN
+        IF NEW.current_context = 'awaiting_pomodoro_summary'
+           AND (NEW.context_data->'summary_nudged') IS DISTINCT FROM 'true'::JSONB THEN
+            due_at := try_timestamptz(NEW.context_data->>'summary_requested_at');
+        END IF;
+    END IF;
+    IF due_at IS NOT NULL THEN
+        PERFORM pg_notify(
+            'timer_changes',
+            json_build_object('table', source_table, 'op', TG_OP, 'id', NEW.id, 'due_at', due_at)::TEXT
+        );
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS pomodoro_sessions_timer_change ON pomodoro_sessions;
+DROP TRIGGER IF EXISTS pomodoro_cycles_timer_change ON pomodoro_cycles;
+CREATE TRIGGER pomodoro_cycles_timer_change
+AFTER INSERT OR UPDATE OF status, next_transition_at ON pomodoro_cycles
+FOR EACH ROW EXECUTE FUNCTION notify_timer_change('pomodoro_cycles');
+
+DROP TRIGGER IF EXISTS tasks_timer_change ON tasks;
+CREATE TRIGGER tasks_timer_change
+AFTER INSERT OR UPDATE OF reminder_time, reminder_sent ON tasks
+FOR EACH ROW WHEN (NEW.reminder_time IS NOT NULL)
+EXECUTE FUNCTION notify_timer_change('tasks');
+
+DROP TRIGGER IF EXISTS conversation_state_timer_change ON conversation_state;
+CREATE TRIGGER conversation_state_timer_change
+AFTER INSERT OR UPDATE OF current_context, context_data ON conversation_state
+FOR EACH ROW EXECUTE FUNCTION notify_timer_change('conversation_state');
+
+-- Earliest moment any timer work becomes due; used to catch up after the
+-- change feed reconnects and to schedule the next wakeup.
+CREATE OR REPLACE FUNCTION next_timer_due_at(nudge_after_seconds INTEGER)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT MIN(due_at) FROM (
+        SELECT MIN(next_transition_at) AS due_at
+        FROM pomodoro_cycles
+        WHERE status = 'active'
+        UNION ALL
+        SELECT MIN(reminder_time)
+        FROM tasks
+        WHERE reminder_sent = FALSE AND reminder_time IS NOT NULL
+        UNION ALL
+        SELECT MIN(try_timestamptz(context_data->>'summary_requested_at') + make_interval(secs => nudge_after_seconds))
+        FROM conversation_state
+        WHERE current_context = 'awaiting_pomodoro_summary'
+          AND context_data ? 'summary_requested_at'
+          AND (context_data->'summary_nudged') IS DISTINCT FROM 'true'::JSONB
+    ) due;
+$$;
+
+-- Outbox draining
+CREATE OR REPLACE FUNCTION notify_outbound_message()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify('outbound_messages', json_build_object('id', NEW.id, 'priority', NEW.priority)::TEXT);
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS outbound_messages_notify ON outbound_messages;
+CREATE TRIGGER outbound_messages_notify
+AFTER INSERT ON outbound_messages
+FOR EACH ROW EXECUTE FUNCTION notify_outbound_message();
+
+CREATE OR REPLACE FUNCTION claim_outbound_messages(
+    worker_id TEXT,
+    batch_size INTEGER,
+    lease_seconds INTEGER,
+    now_ts TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS SETOF outbound_messages
+LANGUAGE sql
+AS $$
+    UPDATE outbound_messages m
+    SET claimed_by = worker_id,
+        claim_expires_at = now_ts + make_interval(secs => lease_seconds),
+        attempts = m.attempts + 1
+    WHERE m.id IN (
+        SELECT id FROM outbound_messages
+        WHERE status = 'pending'
+          AND next_attempt_at <= now_ts
+          AND (claim_expires_at IS NULL OR claim_expires_at < now_ts)
+        ORDER BY priority, created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING m.*;
+$$;
+
+-- Pushes the lease out for messages still being sent; returns how many
+-- claims this worker still holds
+CREATE OR REPLACE FUNCTION extend_outbound_claims(
+    worker_id TEXT,
+    message_ids UUID[],
+    lease_seconds INTEGER,
+    now_ts TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH extended AS (
+        UPDATE outbound_messages m
+        SET claim_expires_at = now_ts + make_interval(secs => lease_seconds)
+        WHERE m.id = ANY(message_ids)
+          AND m.claimed_by = worker_id
+          AND m.status = 'pending'
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM extended;
+$$;
+
+-- results: [{"id": ..., "provider_sid": ...}] for deliveries and
+-- [{"id": ..., "error": ..., "retryable": true|false}] for failures.
+CREATE OR REPLACE FUNCTION record_outbound_results(
+    worker_id TEXT,
+    results JSONB,
+    max_attempts INTEGER,
+    retry_after_seconds INTEGER,
+    now_ts TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH r AS (
+        SELECT
+            (item->>'id')::UUID AS id,
+            item->>'provider_sid' AS provider_sid,
+            item->>'error' AS error,
+            COALESCE((item->>'retryable')::BOOLEAN, TRUE) AS retryable
+        FROM jsonb_array_elements(results) item
+    ),
+    updated AS (
+        UPDATE outbound_messages m
+        SET status = CASE
+                WHEN r.error IS NULL THEN 'sent'
+                WHEN r.retryable AND m.attempts < max_attempts THEN 'pending'
+                ELSE 'failed'
+            END,
+            provider_sid = COALESCE(r.provider_sid, m.provider_sid),
+            sent_at = CASE WHEN r.error IS NULL THEN now_ts ELSE m.sent_at END,
+            last_error = r.error,
+            next_attempt_at = CASE
+                WHEN r.error IS NULL THEN m.next_attempt_at
+                ELSE now_ts + make_interval(secs => retry_after_seconds * power(2, GREATEST(m.attempts - 1, 0)))
+            END,
+            claimed_by = NULL,
+            claim_expires_at = NULL
+        FROM r
+        WHERE m.id = r.id
+          AND m.claimed_by = worker_id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
+
+-- Stats
+-- Work time per cycle is fixed once the cycle stops, so it is stored at
+-- write time in generated columns: work_block_count (work blocks started
+-- before stopped_at) and actual_minutes (their length, the last one cut short
+-- at stopped_at). Both are NULL while the cycle runs. Same block arithmetic as
+-- utils/pomodoro_cycles.work_blocks.
+CREATE OR REPLACE FUNCTION pomodoro_work_blocks(
+    started_at TIMESTAMPTZ,
+    stopped_at TIMESTAMPTZ,
+    work_minutes INTEGER,
+    break_minutes INTEGER
+)
+RETURNS INTEGER
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN stopped_at IS NULL THEN NULL
+        WHEN stopped_at < started_at THEN 0
+        WHEN work_minutes + break_minutes <= 0 THEN 1
+        ELSE GREATEST(
+            CEIL(EXTRACT(EPOCH FROM stopped_at - started_at) / ((work_minutes + break_minutes) * 60)), 1
+        )::INTEGER
+    END;
+$$;
+
+CREATE OR REPLACE FUNCTION pomodoro_work_minutes(
+    started_at TIMESTAMPTZ,
+    stopped_at TIMESTAMPTZ,
+    work_minutes INTEGER,
+    break_minutes INTEGER
+)
+RETURNS INTEGER
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN blocks IS NULL THEN NULL
+        WHEN blocks = 0 THEN 0
+        ELSE (blocks - 1) * work_minutes + GREATEST(FLOOR(LEAST(
+            work_minutes * 60,
+            EXTRACT(EPOCH FROM stopped_at - started_at) - (blocks - 1) * (work_minutes + break_minutes) * 60
+        ) / 60), 0)::INTEGER
+    END
+    FROM (SELECT pomodoro_work_blocks(started_at, stopped_at, work_minutes, break_minutes) AS blocks) b;
+$$;
+
+ALTER TABLE pomodoro_cycles ADD COLUMN IF NOT EXISTS work_block_count INTEGER
+    GENERATED ALWAYS AS (pomodoro_work_blocks(started_at, stopped_at, work_minutes, break_minutes)) STORED;
+ALTER TABLE pomodoro_cycles ADD COLUMN IF NOT EXISTS actual_minutes INTEGER
+    GENERATED ALWAYS AS (pomodoro_work_minutes(started_at, stopped_at, work_minutes, break_minutes)) STORED;
+
+-- Focus totals for one user over [range_start, range_end]: work blocks that
+-- start in the range, their minutes and the summaries given for them, in
+-- order. Stopped cycles that lie wholly inside the range are counted from
+-- their generated columns; only cycles crossing a range edge (or still
+-- running) are expanded block by block, unless with_blocks asks for every
+-- block ({start, minutes, summary}) to be returned. running says whether any
+-- of the cycles is still going, i.e. whether the totals grow with time.
+DROP FUNCTION IF EXISTS pomodoro_stats(UUID, TIMESTAMPTZ, TIMESTAMPTZ, BOOLEAN);
+CREATE OR REPLACE FUNCTION pomodoro_stats(
+    target_user_id UUID,
+    range_start TIMESTAMPTZ,
+    range_end TIMESTAMPTZ,
+    with_blocks BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (total_minutes INTEGER, block_count INTEGER, summaries TEXT[], blocks JSONB, running BOOLEAN)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH cycles AS (
+        SELECT
+            c.started_at,
+            c.stopped_at IS NULL AS running,
+            c.work_minutes,
+            c.summaries,
+            c.work_block_count,
+            c.actual_minutes,
+            (c.work_minutes + c.break_minutes) * 60 AS period_seconds,
+            COALESCE(c.stopped_at, NOW()) AS limit_at,
+            NOT with_blocks
+                AND c.stopped_at IS NOT NULL
+                AND c.started_at >= range_start
+                AND c.stopped_at <= range_end AS whole
+        FROM pomodoro_cycles c
+        WHERE c.user_id = target_user_id
+          AND c.started_at <= range_end
+          AND (c.stopped_at IS NULL OR c.stopped_at >= range_start)
+    ),
+    expanded AS (
+        SELECT
+            b.block_start,
+            GREATEST(FLOOR(EXTRACT(EPOCH FROM
+                LEAST(b.block_start + make_interval(mins => c.work_minutes), c.limit_at) - b.block_start
+            ) / 60), 0)::INTEGER AS minutes,
+            c.summaries ->> i::TEXT AS summary
+        FROM cycles c
+        CROSS JOIN LATERAL generate_series(
+            CASE
+                WHEN range_start > c.started_at AND c.period_seconds > 0
+                THEN CEIL(EXTRACT(EPOCH FROM range_start - c.started_at) / c.period_seconds)::INTEGER
+                ELSE 0
+            END,
+            CASE
+                WHEN c.period_seconds > 0
+                THEN FLOOR(EXTRACT(EPOCH FROM LEAST(range_end, c.limit_at) - c.started_at) / c.period_seconds)::INTEGER
+                ELSE 0
+            END
+        ) AS i
+        CROSS JOIN LATERAL (
+            SELECT c.started_at + make_interval(secs => i * c.period_seconds) AS block_start
+        ) b
+        WHERE NOT c.whole
+          AND b.block_start <= range_end
+          AND (b.block_start < c.limit_at OR (b.block_start = c.limit_at AND i = 0))
+    ),
+    summarized AS (
+        SELECT block_start, summary FROM expanded
+        UNION ALL
+        SELECT c.started_at + make_interval(secs => s.key::INTEGER * c.period_seconds), s.value
+        FROM cycles c
+        CROSS JOIN LATERAL jsonb_each_text(c.summaries) s
+        WHERE c.whole
+          AND s.key ~ '^[0-9]+$'
+          AND s.key::INTEGER < c.work_block_count
+    )
+    SELECT
+        (
+            COALESCE((SELECT SUM(actual_minutes) FROM cycles WHERE whole), 0)
+            + COALESCE((SELECT SUM(minutes) FROM expanded), 0)
+        )::INTEGER,
+        (
+            COALESCE((SELECT SUM(work_block_count) FROM cycles WHERE whole), 0)
+            + (SELECT COUNT(*) FROM expanded)
+        )::INTEGER,
+        ARRAY(SELECT summary FROM summarized WHERE summary <> '' ORDER BY block_start),
+        CASE WHEN with_blocks THEN (
+            SELECT COALESCE(
+                jsonb_agg(
+                    jsonb_build_object('start', block_start, 'minutes', minutes, 'summary', summary)
+                    ORDER BY block_start
+                ),
+                '[]'::JSONB
+            )
+            FROM expanded
+        ) END,
+        COALESCE((SELECT bool_or(running) FROM cycles), FALSE);
+$$;
+
+-- Meal count and calorie/macro totals for one user over [range_start,
+-- range_end]; with_meals adds the meals themselves ({description, calories,
+-- protein_g, carbs_g, fat_g, logged_at}), oldest first
+CREATE OR REPLACE FUNCTION calorie_stats(
+    target_user_id UUID,
+    range_start TIMESTAMPTZ,
+    range_end TIMESTAMPTZ,
+    with_meals BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (
+    meal_count INTEGER,
+    calories INTEGER,
+    protein_g DOUBLE PRECISION,
+    carbs_g DOUBLE PRECISION,
+    fat_g DOUBLE PRECISION,
+    meals JSONB
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        COUNT(*)::INTEGER,
+        COALESCE(SUM(l.calories), 0)::INTEGER,
+        COALESCE(SUM(l.protein_g), 0),
+        COALESCE(SUM(l.carbs_g), 0),
+        COALESCE(SUM(l.fat_g), 0),
+        CASE WHEN with_meals THEN COALESCE(
+            jsonb_agg(
+                jsonb_build_object(
+                    'description', l.meal_description, 'calories', COALESCE(l.calories, 0),
+                    'protein_g', l.protein_g, 'carbs_g', l.carbs_g, 'fat_g', l.fat_g, 'logged_at', l.logged_at
+                )
+                ORDER BY l.logged_at, l.id
+            ),
+            '[]'::JSONB
+        ) END
+    FROM calorie_logs l
+    WHERE l.user_id = target_user_id
+      AND l.logged_at >= range_start
+      AND l.logged_at <= range_end;
+$$;
+
+-- Tasks created and tasks completed in [range_start, range_end], in one call
+CREATE OR REPLACE FUNCTION task_stats(
+    target_user_id UUID,
+    range_start TIMESTAMPTZ,
+    range_end TIMESTAMPTZ
+)
+RETURNS TABLE (created JSONB, completed JSONB)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        (
+            SELECT COALESCE(
+                jsonb_agg(
+                    jsonb_build_object(
+                        'id', t.id, 'title', t.title, 'completed', t.completed,
+                        'completed_at', t.completed_at, 'created_at', t.created_at
+                    )
+                    ORDER BY t.created_at, t.id
+                ),
+                '[]'::JSONB
+            )
+            FROM tasks t
+            WHERE t.user_id = target_user_id
+              AND t.created_at >= range_start
+              AND t.created_at <= range_end
+        ),
+        (
+            SELECT COALESCE(
+                jsonb_agg(
+                    jsonb_build_object(
+                        'id', t.id, 'title', t.title, 'completed', t.completed,
+                        'completed_at', t.completed_at, 'created_at', t.created_at
+                    )
+                    ORDER BY t.completed_at, t.id
+                ),
+                '[]'::JSONB
+            )
+            FROM tasks t
+            WHERE t.user_id = target_user_id
+              AND t.completed = TRUE
+              AND t.completed_at >= range_start
+              AND t.completed_at <= range_end
+        );
+$$;
+
+-- Daily rollups
+-- Per-user totals for each local day (in the user's timezone), one row per
+-- metric: focus_minutes and focus_sessions (work blocks of stopped cycles, on
+-- the day each block starts), tasks_created, tasks_completed, meals,
+-- calories, protein_g, carbs_g and fat_g. Triggers on the activity tables
+-- apply every write as a delta (the old row's share out, the new row's in),
+-- so a replayed or repeated write leaves the totals as they were. A cycle is
+-- counted once it stops. rebuild_daily_rollups() recomputes a user's days
+-- from the rows to repair drift, and runs by itself when a user's timezone
+-- changes.
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id UUID NOT NULL REFERENCES users(id),
+    day DATE NOT NULL,
+    metric TEXT NOT NULL,
+    value NUMERIC NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (user_id, day, metric)
+);
+
+-- The user's timezone, or UTC when it isn't one Postgres knows (the app
+-- falls back the same way)
+CREATE OR REPLACE FUNCTION user_timezone(target_user_id UUID)
+RETURNS TEXT
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    tz TEXT;
+BEGIN
+    SELECT timezone INTO tz FROM users WHERE id = target_user_id;
+    PERFORM NOW() AT TIME ZONE tz;
+    RETURN COALESCE(tz, 'UTC');
+EXCEPTION
+    WHEN invalid_parameter_value THEN
+        RETURN 'UTC';
+END;
+$$;
+
+-- Serializes rollup writes per user: trigger deltas and rebuilds for the
+-- same user wait for each other, other users' writes don't. Ids are locked in
+-- order so an update moving a row between two users can't deadlock.
+CREATE OR REPLACE FUNCTION lock_daily_rollups(VARIADIC user_ids UUID[])
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    target_user_id UUID;
+BEGIN
+    FOR target_user_id IN
+        SELECT DISTINCT id FROM unnest(user_ids) AS ids (id) WHERE id IS NOT NULL ORDER BY id
+    LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('daily_rollups'), hashtext(target_user_id::TEXT));
+    END LOOP;
+END;
+$$;
+
+-- What one row adds to the rollups: (when, metric, amount)
+CREATE OR REPLACE FUNCTION pomodoro_rollup_rows(
+    started_at TIMESTAMPTZ,
+    work_minutes INTEGER,
+    break_minutes INTEGER,
+    work_block_count INTEGER,
+    actual_minutes INTEGER
+)
+RETURNS TABLE (happened_at TIMESTAMPTZ, metric TEXT, amount NUMERIC)
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    -- Every block but the last is a full work_minutes
+    SELECT started_at + make_interval(secs => i * (work_minutes + break_minutes) * 60), m.metric, m.amount
+    FROM generate_series(0, COALESCE(work_block_count, 0) - 1) AS i
+    CROSS JOIN LATERAL (VALUES
+        (
+            'focus_minutes',
+            (CASE WHEN i = work_block_count - 1 THEN actual_minutes - i * work_minutes ELSE work_minutes END)::NUMERIC
+        ),
+        ('focus_sessions', 1::NUMERIC)
+    ) AS m(metric, amount)
+    WHERE m.amount <> 0;
+$$;
+
+CREATE OR REPLACE FUNCTION task_rollup_rows(
+    created_at TIMESTAMPTZ,
+    completed BOOLEAN,
+    completed_at TIMESTAMPTZ
+)
+RETURNS TABLE (happened_at TIMESTAMPTZ, metric TEXT, amount NUMERIC)
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT created_at, 'tasks_created', 1::NUMERIC WHERE created_at IS NOT NULL
+    UNION ALL
+    SELECT completed_at, 'tasks_completed', 1::NUMERIC WHERE completed AND completed_at IS NOT NULL;
+$$;
+
+CREATE OR REPLACE FUNCTION calorie_rollup_rows(
+    logged_at TIMESTAMPTZ,
+    calories INTEGER,
+    protein_g DOUBLE PRECISION,
+    carbs_g DOUBLE PRECISION,
+    fat_g DOUBLE PRECISION
+)
+RETURNS TABLE (happened_at TIMESTAMPTZ, metric TEXT, amount NUMERIC)
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT logged_at, m.metric, m.amount
+    FROM (VALUES
+        ('meals', 1::NUMERIC),
+        ('calories', COALESCE(calories, 0)::NUMERIC),
+        ('protein_g', COALESCE(protein_g, 0)::NUMERIC),
+        ('carbs_g', COALESCE(carbs_g, 0)::NUMERIC),
+        ('fat_g', COALESCE(fat_g, 0)::NUMERIC)
+    ) AS m(metric, amount)
+    WHERE logged_at IS NOT NULL AND m.amount <> 0;
+$$;
+
+CREATE OR REPLACE FUNCTION activity_rollup_rows(source_table TEXT, r JSONB)
+RETURNS TABLE (happened_at TIMESTAMPTZ, metric TEXT, amount NUMERIC)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT * FROM pomodoro_rollup_rows(
+        (r ->> 'started_at')::TIMESTAMPTZ,
+        (r ->> 'work_minutes')::INTEGER,
+        (r ->> 'break_minutes')::INTEGER,
+        (r ->> 'work_block_count')::INTEGER,
+        (r ->> 'actual_minutes')::INTEGER
+    )
+    WHERE source_table = 'pomodoro_cycles'
+    UNION ALL
+    SELECT * FROM task_rollup_rows(
+        (r ->> 'created_at')::TIMESTAMPTZ,
+        (r ->> 'completed')::BOOLEAN,
+        (r ->> 'completed_at')::TIMESTAMPTZ
+    )
+    WHERE source_table = 'tasks'
+    UNION ALL
+    SELECT * FROM calorie_rollup_rows(
+        (r ->> 'logged_at')::TIMESTAMPTZ,
+        (r ->> 'calories')::INTEGER,
+        (r ->> 'protein_g')::DOUBLE PRECISION,
+        (r ->> 'carbs_g')::DOUBLE PRECISION,
+        (r ->> 'fat_g')::DOUBLE PRECISION
+    )
+    WHERE source_table = 'calorie_logs';
+$$;
+
+-- Row trigger on the activity tables; the table comes in as the argument.
+-- Shares that cancel out (an update that moves nothing) write nothing.
+CREATE OR REPLACE FUNCTION apply_daily_rollups()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM lock_daily_rollups(
+        CASE WHEN TG_OP <> 'INSERT' THEN OLD.user_id END,
+        CASE WHEN TG_OP <> 'DELETE' THEN NEW.user_id END
+    );
+    INSERT INTO daily_rollups AS d (user_id, day, metric, value)
+    SELECT s.user_id, (s.happened_at AT TIME ZONE user_timezone(s.user_id))::DATE, s.metric, SUM(s.amount)
+    FROM (
+        SELECT shares.user_id, shares.happened_at, shares.metric, SUM(shares.amount) AS amount
+        FROM (
+            SELECT OLD.user_id, o.happened_at, o.metric, -o.amount
+            FROM activity_rollup_rows(TG_ARGV[0], to_jsonb(OLD)) o
+            WHERE TG_OP <> 'INSERT'
+            UNION ALL
+            SELECT NEW.user_id, n.happened_at, n.metric, n.amount
+            FROM activity_rollup_rows(TG_ARGV[0], to_jsonb(NEW)) n
+            WHERE TG_OP <> 'DELETE'
+        ) AS shares (user_id, happened_at, metric, amount)
+        WHERE shares.user_id IS NOT NULL
+        GROUP BY shares.user_id, shares.happened_at, shares.metric
+        HAVING SUM(shares.amount) <> 0
+    ) s
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (user_id, day, metric) DO UPDATE
+        SET value = d.value + EXCLUDED.value, updated_at = NOW();
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS pomodoro_cycles_daily_rollups ON pomodoro_cycles;
+CREATE TRIGGER pomodoro_cycles_daily_rollups
+AFTER INSERT OR DELETE OR UPDATE OF user_id, started_at, work_minutes, break_minutes, stopped_at ON pomodoro_cycles
+FOR EACH ROW EXECUTE FUNCTION apply_daily_rollups('pomodoro_cycles');
+
+DROP TRIGGER IF EXISTS tasks_daily_rollups ON tasks;
+CREATE TRIGGER tasks_daily_rollups
+AFTER INSERT OR DELETE OR UPDATE OF user_id, created_at, completed, completed_at ON tasks
+FOR EACH ROW EXECUTE FUNCTION apply_daily_rollups('tasks');
+
+DROP TRIGGER IF EXISTS calorie_logs_daily_rollups ON calorie_logs;
+CREATE TRIGGER calorie_logs_daily_rollups
+AFTER INSERT OR DELETE OR UPDATE OF user_id, logged_at, calories, protein_g, carbs_g, fat_g ON calorie_logs
+FOR EACH ROW EXECUTE FUNCTION apply_daily_rollups('calorie_logs');
+
+-- A user's rollups for every local day from first_day on, recomputed from
+-- the rows
+CREATE OR REPLACE FUNCTION compute_daily_rollups(target_user_id UUID, tz TEXT, first_day DATE)
+RETURNS TABLE (day DATE, metric TEXT, value NUMERIC)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH bounds AS (
+        SELECT first_day::TIMESTAMP AT TIME ZONE tz AS since
+    ),
+    shares AS (
+        SELECT r.*
+        FROM pomodoro_cycles c
+        CROSS JOIN LATERAL pomodoro_rollup_rows(
+            c.started_at, c.work_minutes, c.break_minutes, c.work_block_count, c.actual_minutes
+        ) r
+        WHERE c.user_id = target_user_id AND c.stopped_at >= (SELECT since FROM bounds)
+        UNION ALL
+        SELECT r.*
+        FROM tasks t
+        CROSS JOIN LATERAL task_rollup_rows(t.created_at, t.completed, t.completed_at) r
+        WHERE t.user_id = target_user_id
+          AND (t.created_at >= (SELECT since FROM bounds) OR t.completed_at >= (SELECT since FROM bounds))
+        UNION ALL
+        SELECT r.*
+        FROM calorie_logs l
+        CROSS JOIN LATERAL calorie_rollup_rows(l.logged_at, l.calories, l.protein_g, l.carbs_g, l.fat_g) r
+        WHERE l.user_id = target_user_id AND l.logged_at >= (SELECT since FROM bounds)
+    )
+    SELECT (happened_at AT TIME ZONE tz)::DATE, metric, SUM(amount)
+    FROM shares
+    WHERE happened_at >= (SELECT since FROM bounds)
+    GROUP BY 1, 2
+    HAVING SUM(amount) <> 0;
+$$;
+
+-- Compares a user's rollups with the rows and (with repair) replaces the days
+-- that differ. Days before `since` are left alone; it defaults to the first
+-- whole local day in the UTC month of the user's oldest row still in
+-- Postgres, so days holding rows from months moved to the archive keep their
+-- totals. Returns how many rollup rows were (or would be) corrected. A repair
+-- holds the user's rollup lock, so only that user's writes wait while it
+-- applies.
+CREATE OR REPLACE FUNCTION rebuild_daily_rollups(
+    target_user_id UUID,
+    since DATE DEFAULT NULL,
+    repair BOOLEAN DEFAULT TRUE
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    tz TEXT := user_timezone(target_user_id);
+    first_day DATE := since;
+    month_start TIMESTAMP;
+    drifted INTEGER;
+BEGIN
+    IF repair THEN
+        -- The user's trigger deltas either land before the rows are read or
+        -- wait and apply on top of the rebuilt totals
+        PERFORM lock_daily_rollups(target_user_id);
+    END IF;
+
+    IF first_day IS NULL THEN
+        SELECT date_trunc('month', MIN(oldest), 'UTC') AT TIME ZONE tz INTO month_start
+        FROM (
+            SELECT MIN(started_at) AS oldest FROM pomodoro_cycles WHERE user_id = target_user_id
+            UNION ALL
+            SELECT MIN(created_at) FROM tasks WHERE user_id = target_user_id
+            UNION ALL
+            SELECT MIN(logged_at) FROM calorie_logs WHERE user_id = target_user_id
+        ) o;
+        first_day := CASE
+            WHEN month_start IS NULL THEN (NOW() AT TIME ZONE tz)::DATE
+            WHEN month_start = date_trunc('day', month_start) THEN month_start::DATE
+            ELSE month_start::DATE + 1
+        END;
+    END IF;
+
+    SELECT COUNT(*) INTO drifted
+    FROM (
+        SELECT r.day, r.metric, r.value
+        FROM daily_rollups r
+        WHERE r.user_id = target_user_id AND r.day >= first_day AND r.value <> 0
+    ) stored
+    FULL JOIN compute_daily_rollups(target_user_id, tz, first_day) fresh
+        ON fresh.day = stored.day AND fresh.metric = stored.metric
+    WHERE stored.value IS DISTINCT FROM fresh.value;
+
+    IF repair AND drifted > 0 THEN
+        DELETE FROM daily_rollups r WHERE r.user_id = target_user_id AND r.day >= first_day;
+        INSERT INTO daily_rollups (user_id, day, metric, value)
+        SELECT target_user_id, fresh.day, fresh.metric, fresh.value
+        FROM compute_daily_rollups(target_user_id, tz, first_day) fresh;
+    END IF;
+    RETURN drifted;
+END;
+$$;
+
+-- Local days move with the timezone, so a user's rollups are rebuilt when it
+-- changes
+CREATE OR REPLACE FUNCTION rebuild_daily_rollups_for_user()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM rebuild_daily_rollups(NEW.id);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS users_daily_rollups ON users;
+CREATE TRIGGER users_daily_rollups
+AFTER UPDATE OF timezone ON users
+FOR EACH ROW WHEN (OLD.timezone IS DISTINCT FROM NEW.timezone)
+EXECUTE FUNCTION rebuild_daily_rollups_for_user();
+
+-- Data versions
+-- users.data_version goes up with every write that changes what the user's
+-- dashboard shows: their cycles, tasks and meals, and their profile. The web
+-- process uses it as the dashboard ETag and to key its rendered-page cache.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD IS NOT DISTINCT FROM NEW THEN
+        RETURN NULL;
+    END IF;
+    UPDATE users
+    SET data_version = data_version + 1
+    WHERE id IN (
+        CASE WHEN TG_OP <> 'INSERT' THEN OLD.user_id END,
+        CASE WHEN TG_OP <> 'DELETE' THEN NEW.user_id END
+    );
+    RETURN NULL;
+END;
+$$;
+
+-- Only the columns the dashboard shows; timer bookkeeping (phases, reminder
+-- flags) leaves the version alone. The triggers sort before the
+-- *_daily_rollups ones, so a write locks the users row before the user's
+-- rollup lock, the same order a timezone change takes them in.
+DROP TRIGGER IF EXISTS pomodoro_cycles_data_version ON pomodoro_cycles;
+CREATE TRIGGER pomodoro_cycles_data_version
+AFTER INSERT OR DELETE OR UPDATE OF user_id, started_at, work_minutes, break_minutes, stopped_at, summaries
+ON pomodoro_cycles
+FOR EACH ROW EXECUTE FUNCTION bump_data_version();
+
+DROP TRIGGER IF EXISTS tasks_data_version ON tasks;
+CREATE TRIGGER tasks_data_version
+AFTER INSERT OR DELETE OR UPDATE OF user_id, title, created_at, completed, completed_at ON tasks
+FOR EACH ROW EXECUTE FUNCTION bump_data_version();
+
+DROP TRIGGER IF EXISTS calorie_logs_data_version ON calorie_logs;
+CREATE TRIGGER calorie_logs_data_version
+AFTER INSERT OR DELETE OR UPDATE OF user_id, meal_description, calories, protein_g, carbs_g, fat_g, logged_at
+ON calorie_logs
+FOR EACH ROW EXECUTE FUNCTION bump_data_version();
+
+CREATE OR REPLACE FUNCTION bump_profile_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.data_version := OLD.data_version + 1;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS users_data_version ON users;
+CREATE TRIGGER users_data_version
+BEFORE UPDATE OF name, timezone, onboarding_complete, onboarding_step, features_enabled,
+    default_work_minutes, default_break_minutes, daily_calorie_goal, dietary_preferences
+ON users
+FOR EACH ROW WHEN (OLD IS DISTINCT FROM NEW)
+EXECUTE FUNCTION bump_profile_version();
+
+-- Partitions
+-- One partition per UTC month, named <table>_pYYYY_MM, plus a <table>_default
+-- partition for rows outside every monthly range (e.g. a backfill into a month
+-- that has been archived). create_future_partitions() keeps PARTITION_MONTHS_AHEAD
+-- months ready ahead of time; the timer service calls it every
+-- PARTITION_CHECK_HOURS, and it is safe to call from several workers at once.
+-- Tables that are not partitioned yet (installs from before
+-- migrations/0003_partition_activity_tables.sql) are skipped.
+CREATE OR REPLACE FUNCTION create_monthly_partitions(
+    parent TEXT,
+    from_month DATE,
+    to_month DATE
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass(parent)) IS DISTINCT FROM 'p' THEN
+        RETURN 0;
+    END IF;
+
+    IF to_regclass(parent || '_default') IS NULL THEN
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I DEFAULT', parent || '_default', parent);
+    END IF;
+
+    WHILE month_start <= to_month LOOP
+        partition_name := parent || '_p' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            BEGIN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name,
+                    parent,
+                    month_start::TIMESTAMP AT TIME ZONE 'UTC',
+                    (month_start + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC'
+                );
+                created := created + 1;
+            EXCEPTION
+                WHEN duplicate_table THEN
+                    NULL; -- another worker created it first
+                WHEN check_violation THEN
+                    -- The default partition already holds rows for this month
+                    RAISE WARNING 'skipping %: rows for this month are in %_default', partition_name, parent;
+            END;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+
+    RETURN created;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION create_future_partitions(months_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    SELECT COALESCE(SUM(create_monthly_partitions(
+        parent,
+        (NOW() AT TIME ZONE 'UTC')::DATE,
+        ((NOW() AT TIME ZONE 'UTC') + make_interval(months => months_ahead))::DATE
+    )), 0)::INTEGER
+    FROM unnest(ARRAY['pomodoro_cycles', 'tasks', 'calorie_logs']) AS parent;
+$$;
+
+SELECT create_future_partitions();